@@ -0,0 +1,187 @@
+# server/admin_api.py
+"""
+Endpoints d'administration (profil superviseur uniquement).
+
+  GET  /api/admin/views           état des vues de features (matérialisées ? fraîcheur ?)
+  POST /api/admin/views/refresh   rafraîchissement à la demande {"views": [...]} (optionnel)
+  GET  /api/admin/slow-queries    requêtes lentes (top N par durée max, plans EXPLAIN échantillonnés)
+  DELETE /api/admin/slow-queries  remise à zéro du classement
+  POST /api/admin/profile         profilage par échantillonnage {"route", "method", "seconds" | "requests"}
+  GET  /api/admin/profile         état ou résultat (?format=collapsed|speedscope)
+  GET  /api/admin/admission       limites / files par classe de routes (contrôle d'admission)
+  GET  /api/admin/replicas        réplicas en lecture : retard observé, éligibilité
+  GET  /api/admin/cache           cache partagé : entrées, taille
+  DELETE /api/admin/cache         purge (?prefix=/api/ml/anom/list pour une route)
+  GET  /api/admin/jobs            tâches planifiées : échéance, pause, dernière exécution
+  GET  /api/admin/jobs/<nom>      historique des exécutions (?limit=50)
+  POST /api/admin/jobs/<nom>/run  exécution immédiate sur cette instance
+  POST /api/admin/jobs/<nom>/pause | /resume
+"""
+from functools import wraps
+
+from flask import Blueprint, Response, jsonify, request, current_app
+from flask_jwt_extended import jwt_required, get_jwt
+
+import admission
+import db
+import matviews
+import profiler
+import scheduler
+import shared_cache
+import slowlog
+from serialization import json_response
+
+bp_admin = Blueprint("bp_admin", __name__, url_prefix="/api/admin")
+
+ADMIN_PROFILES = {"superviseur"}
+
+
+def admin_required(fn):
+    """JWT obligatoire + type_profil administrateur."""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if get_jwt().get("type_profil") not in ADMIN_PROFILES:
+            return jsonify(message="Accès réservé aux superviseurs"), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+@bp_admin.get("/views")
+@admin_required
+def views_status():
+    eng = current_app.config.get("_ENGINE")
+    matviews.invalidate_state()
+    return json_response({"views": matviews.state(eng)})
+
+
+@bp_admin.post("/views/refresh")
+@admin_required
+def views_refresh():
+    eng = db.get_engine("batch")
+    data = request.get_json(silent=True) or {}
+    names = data.get("views") or None
+    try:
+        res = matviews.refresh(eng, names=names, concurrently=not data.get("blocking", False))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    if not res:
+        return jsonify(message="Aucune vue matérialisée à rafraîchir, ou rafraîchissement déjà en cours",
+                       results={}), 409
+    return json_response({"results": res})
+
+
+@bp_admin.get("/slow-queries")
+@admin_required
+def slow_queries():
+    n = request.args.get("limit", type=int)
+    plans = request.args.get("plans", "1") not in ("0", "false")
+    return json_response({"threshold_ms": slowlog.SLOW_QUERY_MS,
+                          "queries": slowlog.top(n, with_plans=plans)})
+
+
+@bp_admin.delete("/slow-queries")
+@admin_required
+def slow_queries_reset():
+    slowlog.reset()
+    return jsonify(message="ok")
+
+
+@bp_admin.post("/profile")
+@admin_required
+def profile_start():
+    data = request.get_json(silent=True) or {}
+    try:
+        s = profiler.start(
+            route=data.get("route"), method=data.get("method"),
+            seconds=data.get("seconds"), requests=data.get("requests"),
+            interval_ms=float(data.get("interval_ms", profiler.PROFILE_INTERVAL_MS)),
+        )
+    except profiler.ProfileBusy as e:
+        return jsonify(message=str(e)), 409
+    except (TypeError, ValueError) as e:
+        return jsonify(message=f"paramètres invalides : {e}"), 400
+    return json_response(profiler.status(s), status=202)
+
+
+@bp_admin.get("/profile")
+@admin_required
+def profile_result():
+    s = profiler.current()
+    if s is None:
+        return jsonify(message="aucune session de profilage"), 404
+    if s.ended is None:
+        return json_response(profiler.status(s), status=202)
+    fmt = (request.args.get("format") or "collapsed").lower()
+    if fmt == "speedscope":
+        resp = json_response(profiler.to_speedscope(s))
+        resp.headers["Content-Disposition"] = 'attachment; filename="profile.speedscope.json"'
+        return resp
+    if fmt == "status":
+        return json_response(profiler.status(s))
+    return Response(profiler.to_collapsed(s), mimetype="text/plain")
+
+
+@bp_admin.get("/admission")
+@admin_required
+def admission_status():
+    return json_response({"enabled": admission.ADMISSION_ENABLED, "adaptive": admission.ADAPTIVE,
+                          "classes": admission.status()})
+
+
+@bp_admin.get("/replicas")
+@admin_required
+def replicas_status():
+    router = current_app.config.get("_ROUTER")
+    if router is None:
+        return json_response({"enabled": False, "replicas": {}})
+    return json_response({"enabled": True, **router.status()})
+
+
+@bp_admin.get("/cache")
+@admin_required
+def cache_status():
+    return json_response({"enabled": shared_cache.SHARED_CACHE_ENABLED, **shared_cache.stats()})
+
+
+@bp_admin.delete("/cache")
+@admin_required
+def cache_purge():
+    return jsonify(message="ok", deleted=shared_cache.invalidate(request.args.get("prefix", "")))
+
+
+@bp_admin.get("/jobs")
+@admin_required
+def jobs_status():
+    return json_response({"instance": scheduler.INSTANCE, "jobs": scheduler.state(db.get_engine("batch"))})
+
+
+@bp_admin.get("/jobs/<name>")
+@admin_required
+def job_history(name):
+    limit = min(request.args.get("limit", 50, type=int), 1000)
+    return json_response({"job": name, "runs": scheduler.history(db.get_engine("batch"), name, limit)})
+
+
+@bp_admin.post("/jobs/<name>/run")
+@admin_required
+def job_run(name):
+    try:
+        started = scheduler.trigger(db.get_engine("batch"), name)
+    except scheduler.UnknownJob:
+        return jsonify(message=f"tâche inconnue : {name}"), 404
+    if not started:
+        return jsonify(message="tâche déjà en cours sur cette instance"), 409
+    return jsonify(message="lancée", job=name, instance=scheduler.INSTANCE), 202
+
+
+@bp_admin.post("/jobs/<name>/<action>")
+@admin_required
+def job_pause(name, action):
+    if action not in ("pause", "resume"):
+        return jsonify(message="action attendue : run, pause ou resume"), 404
+    try:
+        scheduler.pause(db.get_engine("batch"), name, paused=(action == "pause"))
+    except scheduler.UnknownJob:
+        return jsonify(message=f"tâche inconnue : {name}"), 404
+    return jsonify(message="ok", job=name, paused=(action == "pause"))
@@ -0,0 +1,249 @@
+# server/admission.py
+"""
+Contrôle d'admission par classe de routes (délestage sous charge).
+
+Chaque route Flask appartient à une classe (ROUTE_CLASSES, motifs fnmatch sur la
+règle) :
+  - cheap  : auth, méta, distincts — ne doit jamais attendre derrière le reste
+  - heavy  : recommend, listes sur vues, predict en masse, exports
+  - default: tout le reste
+
+Par classe : une limite de concurrence, une file d'attente bornée et une attente
+maximale. Requête admise -> traitée ; limite atteinte -> attend dans la file
+(au plus WAIT_MS) ; file pleine ou attente expirée -> 503 immédiat avec
+Retry-After. La surcharge dégrade donc les routes coûteuses sans bloquer les
+threads dont ont besoin les appels légers.
+
+La limite est adaptative (algorithme « gradient ») : on suit la latence minimale
+observée (sans file) et la latence lissée ; toutes les WINDOW requêtes,
+limite <- limite * min / lissée + sqrt(limite), bornée à [MIN, MAX]. Quand la
+latence grimpe (DB saturée), la limite baisse avant que les threads s'empilent.
+
+Configuration (CLASSE = CHEAP / DEFAULT / HEAVY) :
+  ADMISSION_ENABLED            1 (0 = désactivé)
+  ADMISSION_<CLASSE>_LIMIT     limite initiale (cheap 32, default 16, heavy 4)
+  ADMISSION_<CLASSE>_MIN / _MAX  bornes de la limite adaptative
+  ADMISSION_<CLASSE>_QUEUE     taille de la file (cheap 64, default 32, heavy 8)
+  ADMISSION_<CLASSE>_WAIT_MS   attente max en file (cheap 2000, default 1000, heavy 500)
+  ADMISSION_ADAPTIVE           1 (0 = limites fixes)
+
+Compteurs exposés sur /api/metrics : admises, mises en file, délestées, plus
+jauges en cours / en file / limite courante.
+"""
+import math
+import os
+import threading
+import time
+from fnmatch import fnmatchcase
+
+from flask import g, jsonify, request
+
+import metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADAPTIVE = os.getenv("ADMISSION_ADAPTIVE", "1") == "1"
+WINDOW = 50               # échantillons entre deux ajustements de limite
+SMOOTHING = 0.2           # poids d'une fenêtre dans la latence lissée
+MIN_RTT_DECAY_S = 60.0    # la latence minimale est « oubliée » au-delà
+RETRY_AFTER_MAX = 30
+
+# (classe, motif de règle Flask) — premier motif qui correspond
+ROUTE_CLASSES = (
+    ("cheap", "/api/auth/*"),
+    ("cheap", "/api/ml/eta/meta"),
+    ("cheap", "/api/ml/*/distincts"),
+    ("cheap", "/api/jobs"),
+    ("cheap", "/api/jobs/<job_id>"),
+    ("cheap", "/api/jobs/<job_id>/cancel"),
+    ("heavy", "/api/ml/reco-simple/recommend"),
+    ("heavy", "/api/ml/anom/list"),
+    ("heavy", "/api/ml/delay/list"),
+    ("heavy", "/api/ml/eta/predict"),
+    ("heavy", "/api/ml/eta/shipments"),
+    ("heavy", "/api/export/*"),
+)
+# jamais délestées : sondes, scrape, CORS et pilotage
+EXEMPT = ("/api/health", "/api/ready", "/api/metrics", "/api/admin/*")
+
+_DEFAULTS = {
+    "cheap": {"limit": 32, "queue": 64, "wait_ms": 2000},
+    "default": {"limit": 16, "queue": 32, "wait_ms": 1000},
+    "heavy": {"limit": 4, "queue": 8, "wait_ms": 500},
+}
+
+
+def _env(cls: str, key: str, default):
+    return type(default)(os.getenv(f"ADMISSION_{cls.upper()}_{key.upper()}", default))
+
+
+class Limiter:
+    def __init__(self, name: str, limit: int, queue: int, wait_ms: float,
+                 min_limit: int = 1, max_limit: int = None):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max_limit or limit * 4
+        self.queue = queue
+        self.wait = wait_ms / 1000.0
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+        # latences (s) pour la limite adaptative
+        self._min_rtt = None
+        self._min_rtt_at = 0.0
+        self._smoothed = None
+        self._window = []
+
+    # -- admission -----------------------------------------------------------
+    def acquire(self) -> str:
+        """'admitted', 'queued' (admise après attente) ou 'shed'."""
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return "admitted"
+            if self.waiting >= self.queue:
+                return "shed"
+            self.waiting += 1
+            deadline = time.monotonic() + self.wait
+            try:
+                while self.in_flight >= int(self.limit):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        return "shed"
+                    self._cond.wait(left)
+                self.in_flight += 1
+                return "queued"
+            finally:
+                self.waiting -= 1
+
+    def release(self, latency: float = None):
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None and ADAPTIVE:
+                self._sample(latency)
+            self._cond.notify()
+
+    # -- limite adaptative (sous self._cond) ----------------------------------
+    def _sample(self, latency: float):
+        now = time.monotonic()
+        if self._min_rtt is None or latency < self._min_rtt or now - self._min_rtt_at > MIN_RTT_DECAY_S:
+            self._min_rtt, self._min_rtt_at = latency, now
+        self._window.append(latency)
+        if len(self._window) < WINDOW:
+            return
+        avg = sum(self._window) / len(self._window)
+        self._window.clear()
+        self._smoothed = avg if self._smoothed is None else (1 - SMOOTHING) * self._smoothed + SMOOTHING * avg
+        gradient = min(1.0, max(0.5, self._min_rtt / self._smoothed)) if self._smoothed > 0 else 1.0
+        new = self.limit * gradient + math.sqrt(self.limit)
+        old = int(self.limit)
+        self.limit = min(float(self.max_limit), max(float(self.min_limit), new))
+        if int(self.limit) > old:
+            self._cond.notify(int(self.limit) - old)
+
+    def retry_after(self) -> int:
+        """Estimation grossière du temps pour vider la file (s)."""
+        per_req = self._smoothed or self._min_rtt or 1.0
+        est = per_req * (self.waiting + 1) / max(1.0, self.limit)
+        return int(min(RETRY_AFTER_MAX, max(1, math.ceil(est))))
+
+    def snapshot(self) -> dict:
+        return {"limit": int(self.limit), "in_flight": self.in_flight, "waiting": self.waiting,
+                "queue": self.queue, "wait_ms": self.wait * 1000.0,
+                "min_latency_ms": None if self._min_rtt is None else self._min_rtt * 1000.0,
+                "smoothed_latency_ms": None if self._smoothed is None else self._smoothed * 1000.0}
+
+
+def _build() -> dict:
+    out = {}
+    for cls, d in _DEFAULTS.items():
+        limit = _env(cls, "limit", d["limit"])
+        out[cls] = Limiter(
+            cls, limit, _env(cls, "queue", d["queue"]), _env(cls, "wait_ms", float(d["wait_ms"])),
+            min_limit=_env(cls, "min", max(1, limit // 4)), max_limit=_env(cls, "max", limit * 4),
+        )
+    return out
+
+
+LIMITERS = _build()
+
+ADMISSION = metrics.register(metrics.Counter(
+    "logiops_admission_total", "Décisions d'admission par classe de routes", ("class", "outcome")))
+QUEUE_WAIT = metrics.register(metrics.Histogram(
+    "logiops_admission_queue_wait_seconds", "Attente en file avant admission", ("class",)))
+metrics.register(metrics.Gauge(
+    "logiops_admission_in_flight", "Requêtes en cours par classe",
+    lambda: {(c,): l.in_flight for c, l in LIMITERS.items()}, ("class",)))
+metrics.register(metrics.Gauge(
+    "logiops_admission_waiting", "Requêtes en file par classe",
+    lambda: {(c,): l.waiting for c, l in LIMITERS.items()}, ("class",)))
+metrics.register(metrics.Gauge(
+    "logiops_admission_limit", "Limite de concurrence courante par classe",
+    lambda: {(c,): int(l.limit) for c, l in LIMITERS.items()}, ("class",)))
+
+
+def route_class(rule: str) -> str:
+    for cls, pattern in ROUTE_CLASSES:
+        if fnmatchcase(rule, pattern):
+            return cls
+    return "default"
+
+
+def _exempt(rule: str) -> bool:
+    return any(fnmatchcase(rule, p) for p in EXEMPT)
+
+
+# ----------------------------------------------------------------------------
+# Hooks Flask
+# ----------------------------------------------------------------------------
+def _before_request():
+    rule = metrics.current_route()
+    if request.method == "OPTIONS" or rule == "unmatched" or _exempt(rule):
+        return None
+    cls = route_class(rule)
+    lim = LIMITERS[cls]
+    t0 = time.perf_counter()
+    outcome = lim.acquire()
+    ADMISSION.inc(cls, outcome)
+    if outcome == "shed":
+        resp = jsonify(message="Service surchargé, réessayez plus tard", route_class=cls)
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(lim.retry_after())
+        return resp
+    if outcome == "queued":
+        QUEUE_WAIT.observe(time.perf_counter() - t0, cls)
+    g._admission = (lim, time.perf_counter())
+    return None
+
+
+def _after_request(resp):
+    # réponse en flux (exports) : Flask appelle teardown_request dès que la vue a rendu
+    # la Response, avant que le générateur soit consommé ; la place reste donc prise
+    # jusqu'à la fermeture du corps (fin d'envoi ou client parti)
+    if resp.is_streamed:
+        held = g.pop("_admission", None)
+        if held is not None:
+            lim, t0 = held
+            resp.call_on_close(lambda: lim.release(time.perf_counter() - t0))
+    return resp
+
+
+def _teardown_request(exc=None):
+    held = g.pop("_admission", None)
+    if held is not None:
+        lim, t0 = held
+        # une erreur ne renseigne pas sur la capacité : pas d'échantillon de latence
+        lim.release(None if exc is not None else time.perf_counter() - t0)
+
+
+def status() -> dict:
+    return {c: l.snapshot() for c, l in LIMITERS.items()}
+
+
+def init_app(app):
+    """À enregistrer après metrics.init_app : les 503 restent mesurés."""
+    if not ADMISSION_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 from datetime import timedelta
+from functools import partial
 from ml_eta_api import bp_eta
 from flask import Flask, jsonify, request
 from flask_cors import CORS
@@ -11,29 +12,37 @@ from flask_jwt_extended import (
     get_jwt_identity,
     jwt_required,
 )
-from sqlalchemy import create_engine, text
 from sqlalchemy.orm import scoped_session, sessionmaker
 from passlib.hash import bcrypt
-import pandas as pd 
 from models import Base, User, TypeProfil
 from ml_reco_simple_api import bp_reco_simple
 from ml_delay_api import bp_delay
 from ml_anomaly_api import bp_anom
 from kpi_api import bp_kpi 
+from admin_api import bp_admin
+from export_api import bp_export
+from jobs_api import bp_jobs
+import serialization
+import metrics
+import slowlog
+import profiler
+import deadline
+import admission
+import matviews
+import partitions
+import scheduler
+import jobs
+import model_store
+import health
+import invalidation
+import shared_cache
 
 
 # ----------------------------------------------------------------------------
 # Configuration
 # ----------------------------------------------------------------------------
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASS = os.getenv("DB_PASS", "313055")
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "logiops")
-
-DATABASE_URL = (
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
+# DB_USER / DB_PASS / DB_HOST / DB_PORT / DB_NAME (ou DATABASE_URL) : voir db.py
+import db
 
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "change-me-in-prod")
 CORS_ORIGIN = os.getenv("CORS_ORIGIN", "http://localhost:8080")
@@ -60,7 +69,30 @@ CORS(
 
 jwt = JWTManager(app)
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Latences par route, temps SQL / pool / predict / JSON -> GET /api/metrics (Prometheus).
+# Enregistré avant la compression : after_request s'exécute en ordre inverse, la
+# latence mesurée inclut donc la compression.
+metrics.init_app(app)
+# Profilage à la demande (superviseur) : /api/admin/profile
+profiler.init_app(app)
+# Échéance par requête (en-tête X-Request-Timeout-Ms ou défaut de la route) -> 504
+deadline.init_app(app)
+# Limites de concurrence par classe de routes, 503 + Retry-After si saturé
+admission.init_app(app)
+
+# Compression gzip/br des réponses JSON (négociée via Accept-Encoding)
+serialization.init_app(app)
+
+# Un pool par charge (oltp / analytics / batch), réglages DB_* : voir db.py
+engines = db.make_engines()
+engine = engines["oltp"]
+# Lectures analytics vers les réplicas (DB_REPLICA_URLS), garde de retard + read-your-writes
+router = db.make_router(engines)
+for _eng in set(engines.values()) | set(router.engines() if router else ()):
+    # Requêtes > SLOW_QUERY_MS : journal + EXPLAIN ANALYZE échantillonné (GET /api/admin/slow-queries)
+    slowlog.install(_eng)
+    # statement_timeout = budget restant de la requête, à chaque transaction
+    deadline.install(_eng)
 SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
 
 
@@ -68,11 +100,36 @@ SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocom
 
 #Register-------------------
 app.config["_ENGINE"] = engine
+app.config["_ENGINES"] = engines
+app.config["_ROUTER"] = router
 app.register_blueprint(bp_eta)
 app.register_blueprint(bp_reco_simple)
 app.register_blueprint(bp_delay)
 app.register_blueprint(bp_anom)
 app.register_blueprint(bp_kpi)
+app.register_blueprint(bp_admin)
+app.register_blueprint(bp_export)
+app.register_blueprint(bp_jobs)
+
+# Tâches de fond : une seule instance exécute chaque échéance (verrou consultatif, cf. scheduler.py)
+if matviews.REFRESH_SECONDS > 0:
+    scheduler.register("matviews.refresh", partial(matviews.refresh, engines["batch"]),
+                       every=matviews.REFRESH_SECONDS)
+if partitions.MAINTENANCE_SECONDS > 0:
+    scheduler.register("partitions.maintain", partial(partitions.maintain, engines["batch"]),
+                       every=partitions.MAINTENANCE_SECONDS)
+scheduler.register("jobs.cleanup", partial(jobs.cleanup, engines["batch"]), every=3600)
+scheduler.start(engines["batch"])
+# Traitements asynchrones (eta.predict, export, reco.sweep) : répartiteur vers les pools de processus
+jobs.start(engines["batch"])
+# Modèles ML : chargement + predict de préchauffage (MODEL_WARMUP, défaut en tâche de fond) -> /api/ready
+model_store.start()
+# /api/health : état maintenu par une sonde de fond (connexion dédiée), ?deep=1 pour le diagnostic
+health.init_app(app, router)
+health.start(engine)
+# NOTIFY logiops_changes (migration v0011) -> purge des entrées du cache partagé par table
+invalidation.subscribe(None, shared_cache.on_invalidate)
+invalidation.start(engines["oltp"])
 
 
 #-----------------------
@@ -98,14 +155,11 @@ def validate_profile(value: str) -> str:
 # ----------------------------------------------------------------------------
 # Routes
 # ----------------------------------------------------------------------------
-@app.get("/api/health")
-def health():
-    try:
-        with engine.connect() as conn:
-            conn.execute(text("select 1"))
-        return jsonify(status="ok"), 200
-    except Exception as e:
-        return jsonify(status="error", error=str(e)), 500
+@app.get("/api/ready")
+def ready():
+    """Sonde de disponibilité : 200 quand les modèles sont chargés et préchauffés, 503 sinon."""
+    st = model_store.status()
+    return serialization.json_response(st, status=200 if st["ready"] else 503)
 
 
 @app.post("/api/auth/signup")
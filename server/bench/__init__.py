@@ -0,0 +1,2 @@
+# server/bench
+"""Benchmarks et outils de mesure (lancer depuis server/ : `python -m bench.<module>`)."""
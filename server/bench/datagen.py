@@ -0,0 +1,279 @@
+# server/bench/datagen.py
+"""
+Générateur de données logistiques synthétiques au schéma du projet.
+
+Tables remplies : carrier_profiles, shipments, shipment_events (séquence de
+phases created -> picked -> in_transit -> out_for_delivery -> delivered avec
+durées réalistes), users. Génération vectorisée NumPy par chunks, chargement
+par COPY, chunks répartis sur `--workers` process.
+
+Déterministe : le chunk k est tiré de `default_rng([seed, k])`, le résultat ne
+dépend donc ni du nombre de workers ni de l'ordre d'exécution.
+
+Réglages :
+  --carriers / --services          transporteurs x niveaux de service (carrier_profiles)
+  --origins / --zones              lanes = origines x zones (distance fixe par lane)
+  --late-rate                      part des shipments livrés au-delà du SLA
+  --anomaly-rate                   part des phases anormalement longues (x3 à x6)
+  --days                           fenêtre des dates d'expédition (jusqu'à maintenant)
+
+    python -m bench.datagen --shipments 1000000 --workers 8
+    python -m bench.datagen --url postgresql+psycopg2://... --shipments 10000 --seed 7
+
+Volume : 1 shipment = 5 évènements ; --shipments 20000000 donne 10^8 évènements.
+Relancer sur une base déjà remplie : changer --prefix (les event_id continuent
+après le max existant).
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+PHASES = np.array(["created", "picked", "in_transit", "out_for_delivery", "delivered"])
+SERVICES = [("EXPRESS", 24.0), ("STANDARD", 48.0), ("ECONOMY", 96.0), ("PRIORITY", 18.0)]
+
+# durées de phase (heures) hors transit : lognormales (médiane, sigma)
+_PHASE_MEDIAN_H = np.array([3.0, 6.0, 0.0, 4.0])
+_PHASE_SIGMA = np.array([0.5, 0.5, 0.35, 0.6])
+_TRANSIT_KMH = 55.0
+
+USERS_PASSWORD = "loadtest"  # même mot de passe pour tous (un seul bcrypt)
+
+DEFAULTS = dict(
+    shipments=100_000, carriers=12, services=3, origins=40, zones=25,
+    late_rate=0.08, anomaly_rate=0.03, days=120, users=50, seed=42,
+    chunk=200_000, prefix="SYN",
+)
+
+
+class Config:
+    def __init__(self, **kw):
+        for k, v in DEFAULTS.items():
+            setattr(self, k, kw.get(k, v) if kw.get(k) is not None else v)
+        self.end = kw.get("end") or datetime.now(timezone.utc).replace(microsecond=0)
+        self.event_base = int(kw.get("event_base") or 0)
+        self.start = self.end - timedelta(days=self.days)
+        self.services = max(1, min(self.services, len(SERVICES)))
+
+    def as_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in DEFAULTS}
+        d["end"] = self.end
+        d["event_base"] = self.event_base
+        return d
+
+
+# ----------------------------------------------------------------------------
+# Référentiels (petits, dérivés de la seed seule)
+# ----------------------------------------------------------------------------
+def carriers(cfg: Config) -> pd.DataFrame:
+    rng = np.random.default_rng([cfg.seed, 0xCA])
+    rows = []
+    for c in range(cfg.carriers):
+        speed = rng.uniform(0.85, 1.2)  # facteur de SLA propre au transporteur
+        for svc, sla in SERVICES[: cfg.services]:
+            rows.append({
+                "carrier": f"{cfg.prefix}_CARRIER_{c:03d}",
+                "service_level": svc,
+                "sla_hours": round(sla * speed, 1),
+                "exception_rate": round(rng.uniform(0.02, 0.2), 4),
+                "base_rate_per_km": round(rng.uniform(0.3, 1.2), 4),
+                "surcharge_per_kg": round(rng.uniform(0.05, 0.4), 4),
+            })
+    return pd.DataFrame(rows)
+
+
+def lanes(cfg: Config) -> pd.DataFrame:
+    rng = np.random.default_rng([cfg.seed, 0x1A])
+    o, z = np.meshgrid(np.arange(cfg.origins), np.arange(cfg.zones), indexing="ij")
+    return pd.DataFrame({
+        "origin": [f"ORIG_{i:03d}" for i in o.ravel()],
+        "destination_zone": [f"ZONE_{i:03d}" for i in z.ravel()],
+        "distance_km": np.round(rng.gamma(2.2, 180.0, o.size) + 15.0, 1),
+    })
+
+
+# ----------------------------------------------------------------------------
+# Chunk de shipments + évènements
+# ----------------------------------------------------------------------------
+def make_chunk(cfg: Config, k: int, lo: int, hi: int, cp: pd.DataFrame, ln: pd.DataFrame):
+    """Shipments [lo, hi) et leurs évènements ; renvoie deux DataFrames."""
+    rng = np.random.default_rng([cfg.seed, k])
+    n = hi - lo
+    idx = np.arange(lo, hi)
+
+    lane = rng.integers(0, len(ln), n)
+    prof = rng.integers(0, len(cp), n)
+    dist = ln["distance_km"].to_numpy()[lane]
+    sla = cp["sla_hours"].to_numpy()[prof]
+    weight = np.round(rng.gamma(1.8, 35.0, n) + 0.5, 2)
+    units = rng.integers(1, 60, n)
+    span = (cfg.end - cfg.start).total_seconds()
+    ship = np.datetime64(cfg.start.replace(tzinfo=None), "s") + \
+        (rng.random(n) * span).astype(np.int64).astype("timedelta64[s]")
+
+    # durées de phase (n x 4), la phase de transit dépend de la distance
+    dur = np.exp(np.log(np.maximum(_PHASE_MEDIAN_H, 1e-9)) + _PHASE_SIGMA * rng.standard_normal((n, 4)))
+    dur[:, 2] = dist / _TRANSIT_KMH * np.exp(_PHASE_SIGMA[2] * rng.standard_normal(n))
+
+    # anomalies : phase ponctuellement x3 à x6 ; appliquées avant le recalage du
+    # total, la phase garde une part anormale du shipment (rupture avec le P90)
+    # sans déplacer le shipment de l'autre côté du SLA
+    anom = rng.random((n, 4)) < cfg.anomaly_rate
+    dur = np.where(anom, dur * rng.uniform(3.0, 6.0, (n, 4)), dur)
+
+    # retards : on recale le total pour obtenir exactement ~late_rate au-delà du SLA
+    late = rng.random(n) < cfg.late_rate
+    total = dur.sum(axis=1)
+    target = np.where(late, sla * rng.uniform(1.05, 1.6, n),
+                      np.minimum(total, sla * rng.uniform(0.5, 0.98, n)))
+    dur *= (target / total)[:, None]
+
+    offsets = np.concatenate([np.zeros((n, 1)), np.cumsum(dur, axis=1)], axis=1)  # n x 5
+    ev_time = ship[:, None] + (offsets * 3600.0).astype(np.int64).astype("timedelta64[s]")
+
+    sid = pd.Series(idx).astype(str).str.zfill(10).radd(cfg.prefix).to_numpy()
+    c_rate = cp["base_rate_per_km"].to_numpy()[prof]
+    c_kg = cp["surcharge_per_kg"].to_numpy()[prof]
+    shipments = pd.DataFrame({
+        "shipment_id": sid,
+        "ordernumber": pd.Series(idx).astype(str).radd("ORD").to_numpy(),
+        "origin": ln["origin"].to_numpy()[lane],
+        "destination_zone": ln["destination_zone"].to_numpy()[lane],
+        "carrier": cp["carrier"].to_numpy()[prof],
+        "service_level": cp["service_level"].to_numpy()[prof],
+        "distance_km": dist,
+        "weight_kg": weight,
+        "volume_m3": np.round(weight / rng.uniform(120.0, 300.0, n), 3),
+        "total_units": units,
+        "n_lines": np.minimum(units, rng.integers(1, 12, n)),
+        "ship_datetime": pd.to_datetime(ship).tz_localize("UTC"),
+        "delivery_datetime": pd.to_datetime(ev_time[:, 4]).tz_localize("UTC"),
+        "cost_estimated": np.round(c_rate * dist + c_kg * weight + rng.normal(0, 5, n).clip(-10, 30), 2),
+    })
+    events = pd.DataFrame({
+        "event_id": (cfg.event_base + idx[:, None] * 5 + np.arange(1, 6)).ravel(),
+        "shipment_id": np.repeat(sid, 5),
+        "event_type": np.tile(PHASES, n),
+        "event_time": pd.to_datetime(ev_time.ravel()).tz_localize("UTC"),
+    })
+    return shipments, events
+
+
+# ----------------------------------------------------------------------------
+# Chargement
+# ----------------------------------------------------------------------------
+def _copy(raw, table: str, df: pd.DataFrame):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, date_format="%Y-%m-%d %H:%M:%S%z")
+    buf.seek(0)
+    cur = raw.cursor()
+    cur.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _engine(url: str):
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+    return create_engine(url, poolclass=NullPool)
+
+
+def _load_chunk(args):
+    url, cfg_dict, k, lo, hi = args
+    cfg = Config(**cfg_dict)
+    ship, ev = make_chunk(cfg, k, lo, hi, carriers(cfg), lanes(cfg))
+    raw = _engine(url).raw_connection()
+    try:
+        _copy(raw, "shipments", ship)
+        _copy(raw, "shipment_events", ev)
+        raw.commit()
+    finally:
+        raw.close()
+    return hi - lo
+
+
+def _prepare(url: str, cfg: Config):
+    """Référentiels + partitions couvrant la fenêtre (si shipment_events est partitionnée)."""
+    from passlib.hash import bcrypt
+    from sqlalchemy import text
+
+    import partitions
+
+    eng = _engine(url)
+    with eng.begin() as c:
+        cfg.event_base = int(c.execute(text("SELECT COALESCE(MAX(event_id), 0) FROM shipment_events")).scalar())
+        for r in carriers(cfg).to_dict(orient="records"):
+            c.execute(text("""
+                INSERT INTO carrier_profiles (carrier, service_level, sla_hours, exception_rate,
+                                              base_rate_per_km, surcharge_per_kg)
+                VALUES (:carrier, :service_level, :sla_hours, :exception_rate,
+                        :base_rate_per_km, :surcharge_per_kg)
+                ON CONFLICT DO NOTHING
+            """), r)
+        if partitions.is_partitioned(c):
+            # les phases d'un shipment peuvent déborder de quelques jours après `end`
+            partitions.ensure_partitions(c, cfg.start, cfg.end + timedelta(days=30))
+        c.execute(text("""
+            INSERT INTO users (id, nom, email, mot_de_passe_hash, type_profil)
+            SELECT md5(:p || i)::uuid, 'User ' || i, lower(:p) || i || '@example.com', :h,
+                   (ARRAY['commande','stockage','transport','superviseur'])[1 + i % 4]
+            FROM generate_series(1, :n) AS i
+            ON CONFLICT DO NOTHING
+        """), {"p": cfg.prefix, "h": bcrypt.hash(USERS_PASSWORD), "n": cfg.users})
+    return eng
+
+
+def generate(url: str, workers: int = None, out=sys.stderr, **kw) -> dict:
+    """Génère et charge le jeu ; renvoie {"shipments", "events", "seconds"}."""
+    from sqlalchemy import text
+
+    cfg = Config(**kw)
+    eng = _prepare(url, cfg)
+    tasks = [(url, cfg.as_dict(), k, lo, min(lo + cfg.chunk, cfg.shipments))
+             for k, lo in enumerate(range(0, cfg.shipments, cfg.chunk))]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks) or 1))
+    t0, done = time.perf_counter(), 0
+    if workers == 1:
+        results = map(_load_chunk, tasks)
+    else:
+        pool = get_context("spawn").Pool(workers)
+        results = pool.imap_unordered(_load_chunk, tasks)
+    try:
+        for n in results:
+            done += n
+            el = time.perf_counter() - t0
+            print(f"[datagen] {done}/{cfg.shipments} shipments ({done / max(el, 1e-9):,.0f}/s)", file=out)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+    with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+        for t in ("carrier_profiles", "shipments", "shipment_events", "users"):
+            c.execute(text(f"ANALYZE {t}"))
+    eng.dispose()
+    return {"shipments": cfg.shipments, "events": cfg.shipments * 5,
+            "seconds": time.perf_counter() - t0}
+
+
+def main() -> int:
+    from db import DATABASE_URL
+
+    ap = argparse.ArgumentParser(description="Jeu de données logistique synthétique (COPY)")
+    ap.add_argument("--url", default=DATABASE_URL)
+    ap.add_argument("--workers", type=int, default=None)
+    for k, v in DEFAULTS.items():
+        ap.add_argument(f"--{k.replace('_', '-')}", type=type(v), default=v)
+    args = vars(ap.parse_args())
+    url, workers = args.pop("url"), args.pop("workers")
+    res = generate(url, workers=workers, **args)
+    print(f"[datagen] {res['shipments']} shipments / {res['events']} évènements "
+          f"en {res['seconds']:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# server/bench/importtime.py
+"""
+Profil de démarrage : temps d'import de `app` (= délai avant d'ouvrir le port)
+et délai jusqu'à /api/ready, par configuration.
+
+Chaque mesure tourne dans un process neuf lancé avec `python -X importtime`
+(threads de fond qui parlent à Postgres désactivés : planificateur, file de
+traitements, invalidation). Configurations comparées :
+  legacy      LAZY_IMPORTS=0, MODEL_WARMUP=eager  (tout importé et chargé avant le port)
+  background  LAZY_IMPORTS=1, MODEL_WARMUP=background (défaut)
+  lazy        LAZY_IMPORTS=1, MODEL_WARMUP=lazy   (coût d'import seul)
+
+Le rapport donne, par configuration : médiane import / ready sur `--runs`,
+bibliothèques lourdes déjà importées au moment où l'app est prête à servir, et
+les paquets les plus coûteux (temps « self » cumulé par paquet racine,
+d'après -X importtime).
+
+    python -m bench.importtime --runs 5 --top 15 --out importtime.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGS = {
+    "legacy": {"LAZY_IMPORTS": "0", "MODEL_WARMUP": "eager"},
+    "background": {"LAZY_IMPORTS": "1", "MODEL_WARMUP": "background"},
+    "lazy": {"LAZY_IMPORTS": "1", "MODEL_WARMUP": "lazy"},
+}
+QUIET = {"SCHEDULER_ENABLED": "0", "JOBS_ENABLED": "0", "INVALIDATION_ENABLED": "0"}
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter() - t0
+import lazy, model_store
+at_bind = {m: lazy.loaded(m) for m in model_store.HEAVY_MODULES}
+ok = model_store.wait(%(timeout)s)
+t_ready = time.perf_counter() - t0
+st = model_store.status()
+print(json.dumps({"import_s": t_import, "ready_s": t_ready, "ready": ok, "loaded_at_bind": at_bind,
+                  "models": {k: v["state"] for k, v in st["models"].items()}}, default=str))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """{paquet racine: temps self en ms} d'après les lignes `import time: self | cumulative | nom`."""
+    out = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|", 2)
+            out[name.strip().split(".")[0]] += int(self_us) / 1000.0
+        except ValueError:
+            continue
+    return dict(out)
+
+
+def measure(env_overrides: dict, timeout: float) -> dict:
+    env = {**os.environ, **QUIET, **env_overrides}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE % {"timeout": timeout}],
+        cwd=HERE, env=env, capture_output=True, text=True, timeout=timeout + 60,
+    )
+    last = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ""
+    if proc.returncode != 0 or not last.startswith("{"):
+        tail = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))[-2000:]
+        raise RuntimeError(f"sonde en échec (code {proc.returncode}) :\n{tail}")
+    res = json.loads(last)
+    res["packages_ms"] = parse_importtime(proc.stderr)
+    return res
+
+
+def run(names, runs: int, top: int, timeout: float) -> dict:
+    report = {}
+    for name in names:
+        samples = [measure(CONFIGS[name], timeout) for _ in range(runs)]
+        packages = defaultdict(list)
+        for s in samples:
+            for pkg, ms in s["packages_ms"].items():
+                packages[pkg].append(ms)
+        ranked = sorted(((pkg, statistics.median(v)) for pkg, v in packages.items()),
+                        key=lambda kv: kv[1], reverse=True)[:top]
+        report[name] = {
+            "env": CONFIGS[name],
+            "import_s": statistics.median(s["import_s"] for s in samples),
+            "ready_s": statistics.median(s["ready_s"] for s in samples),
+            "ready": all(s["ready"] for s in samples),
+            "loaded_at_bind": samples[-1]["loaded_at_bind"],
+            "models": samples[-1]["models"],
+            "top_packages_ms": [{"package": p, "self_ms": round(ms, 2)} for p, ms in ranked],
+        }
+    return report
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Profil d'import et de préchauffage au démarrage")
+    ap.add_argument("--configs", default=",".join(CONFIGS))
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--timeout", type=float, default=120.0, help="attente max du préchauffage (s)")
+    ap.add_argument("--out", help="rapport JSON (sinon stdout)")
+    args = ap.parse_args()
+
+    names = [n for n in args.configs.split(",") if n]
+    unknown = [n for n in names if n not in CONFIGS]
+    if unknown:
+        raise SystemExit(f"configurations inconnues : {unknown} (connues : {list(CONFIGS)})")
+
+    report = run(names, args.runs, args.top, args.timeout)
+    for name, r in report.items():
+        heavy = ", ".join(m for m, v in r["loaded_at_bind"].items() if v) or "aucune"
+        print(f"{name:>10} : import {r['import_s'] * 1000:8.1f} ms | prêt {r['ready_s'] * 1000:8.1f} ms"
+              f" | déjà importées : {heavy}", file=sys.stderr)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,372 @@
+# server/bench/loadtest.py
+"""
+Test de charge des endpoints avec rapport de latence (p50 / p95 / p99) par route.
+
+Par défaut tout est jetable : un cluster Postgres temporaire (initdb + pg_ctl,
+port libre, répertoire temporaire), les migrations, un jeu de données généré,
+puis l'application Flask complète (tous les blueprints) servie dans un
+sous-process (le client ne partage pas le GIL du serveur). L'authentification
+passe par /api/auth/signup : les JWT sont de vrais jetons signés par l'app.
+Le serveur tourne sans tâches de fond ni cache de réponses
+(SHARED_CACHE_ENABLED=0) : les requêtes répétées mesurent les handlers, pas des
+hits de cache, et un fichier de cache d'un run précédent ne fausse pas
+`--baseline`. Avec `--target`, désactiver le cache côté serveur.
+
+Le client envoie un mélange pondéré de requêtes à concurrence fixe pendant
+`--duration` secondes et écrit un rapport JSON. Avec `--baseline`, le rapport
+est comparé à un rapport précédent : code de sortie 1 si une route régresse
+au-delà de `--tolerance` (p95 / p99 en hausse ou débit en baisse).
+
+    python -m bench.loadtest --rows 20000 --concurrency 8 --duration 30 --out report.json
+    python -m bench.loadtest --baseline report.json            # échoue si régression
+    python -m bench.loadtest --url postgresql+psycopg2://...   # base existante (vide)
+    python -m bench.loadtest --target http://127.0.0.1:8000    # serveur déjà lancé
+
+Mélange par défaut (`--mix`) :
+  predict=1,predict_by_id=2,delay_list=2,anom_list=2,recommend=2,kpi=1
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "predict=1,predict_by_id=2,delay_list=2,anom_list=2,recommend=2,kpi=1"
+
+
+# ----------------------------------------------------------------------------
+# Postgres jetable
+# ----------------------------------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pg_tool(name: str, pg_bin: str = None) -> str:
+    path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise SystemExit(f"{name} introuvable : installer PostgreSQL ou passer --pg-bin / --url")
+    return path
+
+
+@contextmanager
+def temp_postgres(pg_bin: str = None, dbname: str = "logiops"):
+    """Cluster Postgres éphémère ; renvoie l'URL SQLAlchemy de la base `dbname`."""
+    from sqlalchemy import create_engine, text
+
+    root = tempfile.mkdtemp(prefix="logiops-pg-")
+    data, port = os.path.join(root, "data"), _free_port()
+    pg_ctl = _pg_tool("pg_ctl", pg_bin)
+    subprocess.run([_pg_tool("initdb", pg_bin), "-D", data, "-U", "postgres", "--auth=trust",
+                    "-E", "UTF8", "--no-sync"], check=True, stdout=subprocess.DEVNULL)
+    opts = f"-p {port} -k {root} -c listen_addresses=127.0.0.1 -c fsync=off -c shared_buffers=256MB"
+    subprocess.run([pg_ctl, "-D", data, "-o", opts, "-l", os.path.join(root, "pg.log"), "-w", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        admin = create_engine(f"postgresql+psycopg2://postgres@127.0.0.1:{port}/postgres",
+                              isolation_level="AUTOCOMMIT")
+        with admin.connect() as c:
+            c.execute(text(f"CREATE DATABASE {dbname}"))
+        admin.dispose()
+        yield f"postgresql+psycopg2://postgres@127.0.0.1:{port}/{dbname}"
+    finally:
+        subprocess.run([pg_ctl, "-D", data, "-m", "immediate", "stop"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def prepare_db(url: str, rows: int, seed: int = 42, out=sys.stderr):
+    """Migrations + jeu de données (idempotent si la base contient déjà des shipments)."""
+    from sqlalchemy import create_engine, text
+
+    import migrations
+    from bench import datagen
+
+    eng = create_engine(url)
+    migrations.upgrade(eng, out=out)
+    with eng.connect() as c:
+        empty = not c.execute(text("SELECT EXISTS (SELECT 1 FROM shipments)")).scalar()
+    eng.dispose()
+    if empty:
+        res = datagen.generate(url, shipments=rows, seed=seed, prefix="LT", out=out)
+        print(f"[loadtest] {rows} shipments générés en {res['seconds']:.1f}s", file=out)
+
+
+# ----------------------------------------------------------------------------
+# Serveur (sous-process)
+# ----------------------------------------------------------------------------
+def serve(port: int):
+    """Point d'entrée du sous-process : app complète, serveur werkzeug multi-thread."""
+    from werkzeug.serving import make_server
+
+    import app as application
+
+    application.init_db()
+    make_server("127.0.0.1", port, application.app, threaded=True).serve_forever()
+
+
+@contextmanager
+def app_server(url: str, port: int = None):
+    port = port or _free_port()
+    env = dict(os.environ, DATABASE_URL=url, MATVIEW_REFRESH_SECONDS="0",
+               PARTITION_MAINTENANCE_SECONDS="0", SLOW_QUERY_EXPLAIN_RATE="0",
+               SHARED_CACHE_ENABLED="0")
+    proc = subprocess.Popen([sys.executable, "-m", "bench.loadtest", "--serve", str(port)],
+                            cwd=HERE, env=env)
+    target = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            if proc.poll() is not None:
+                raise SystemExit("le serveur s'est arrêté au démarrage")
+            try:
+                if _request(target, "GET", "/api/health")[0] == 200:
+                    break
+            except OSError:
+                pass
+            time.sleep(0.5)
+        else:
+            raise SystemExit("le serveur n'a pas répondu en 120s")
+        yield target
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# ----------------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------------
+def _request(target: str, method: str, path: str, body=None, token: str = None, timeout: float = 60):
+    u = urlsplit(target)
+    conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=timeout)
+    headers = {"Accept-Encoding": "gzip"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    payload = None
+    if body is not None:
+        payload = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    try:
+        conn.request(method, path, body=payload, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.getheader("Content-Encoding") == "gzip":  # décompression comptée dans la latence
+            data = gzip.decompress(data)
+        return resp.status, data
+    finally:
+        conn.close()
+
+
+def get_token(target: str, profile: str = "superviseur") -> str:
+    creds = {"nom": "Load Test", "email": f"loadtest-{uuid.uuid4().hex[:12]}@example.com",
+             "password": uuid.uuid4().hex, "type_profil": profile}
+    status, data = _request(target, "POST", "/api/auth/signup", creds)
+    if status != 201:
+        raise SystemExit(f"signup impossible ({status}) : {data[:200]!r}")
+    return json.loads(data)["token"]
+
+
+def _samples(target: str, token: str) -> dict:
+    """Identifiants / entrées valides lus via l'API elle-même."""
+    status, data = _request(target, "GET", "/api/ml/eta/shipments?limit=200", token=token)
+    ids = json.loads(data).get("shipment_ids", []) if status == 200 else []
+    status, data = _request(target, "GET", "/api/ml/eta/meta", token=token)
+    features = json.loads(data).get("features", []) if status == 200 else []
+    status, data = _request(target, "GET", "/api/ml/reco-simple/distincts", token=token)
+    reco = json.loads(data) if status == 200 else {}
+    if not ids:
+        raise SystemExit("aucun shipment dans fv_train_eta : base vide ?")
+    return {"ids": ids, "features": features, "reco": reco}
+
+
+def _scenarios(s: dict) -> dict:
+    """route -> fonction(rng) -> (méthode, chemin, corps)."""
+    ids = s["ids"]
+    origins = s["reco"].get("origin") or ["ORIG_1"]
+    dests = s["reco"].get("destination_zone") or ["ZONE_1"]
+    services = s["reco"].get("service_level") or ["EXPRESS"]
+
+    def item(rng):
+        return {
+            "origin": rng.choice(origins), "destination_zone": rng.choice(dests),
+            "carrier": "LT_CARRIER_001", "service_level": rng.choice(services),
+            "ship_dow": rng.randrange(7), "ship_hour": rng.randrange(24),
+            "distance_km": rng.uniform(20, 1500), "weight_kg": rng.uniform(1, 500),
+            "volume_m3": rng.uniform(0.1, 5), "total_units": rng.randrange(1, 50),
+            "n_lines": rng.randrange(1, 10),
+        }
+
+    return {
+        "predict": lambda rng: ("POST", "/api/ml/eta/predict",
+                                {"items": [item(rng) for _ in range(10)]}),
+        "predict_by_id": lambda rng: ("GET", f"/api/ml/eta/predict-by-id?shipment_id={rng.choice(ids)}", None),
+        "delay_list": lambda rng: ("GET", "/api/ml/delay/list?limit=40", None),
+        "anom_list": lambda rng: ("GET", "/api/ml/anom/list?limit=30", None),
+        "recommend": lambda rng: ("POST", "/api/ml/reco-simple/recommend", {
+            "origin": rng.choice(origins), "destination_zone": rng.choice(dests),
+            "service_level": rng.choice(services),
+            "distance_km": rng.uniform(20, 1500), "weight_kg": rng.uniform(1, 500), "topk": 5,
+        }),
+        "kpi": lambda rng: ("GET", "/api/kpi/counters", None),
+    }
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        if name.strip():
+            mix[name.strip()] = float(w or 1)
+    return mix
+
+
+def run_load(target: str, token: str, mix: dict, concurrency: int, duration: float,
+             warmup: float = 3.0, seed: int = 42) -> dict:
+    scenarios = _scenarios(_samples(target, token))
+    unknown = set(mix) - set(scenarios)
+    if unknown:
+        raise SystemExit(f"routes inconnues dans --mix : {sorted(unknown)} (connues : {sorted(scenarios)})")
+    names = [n for n in mix if mix[n] > 0]
+    weights = [mix[n] for n in names]
+    lat = {n: [] for n in names}
+    errors = {n: 0 for n in names}
+    lock = threading.Lock()
+    t_start = time.perf_counter() + warmup
+    t_end = t_start + duration
+
+    def worker(i: int):
+        rng = random.Random(seed + i)
+        while True:
+            now = time.perf_counter()
+            if now >= t_end:
+                return
+            name = rng.choices(names, weights)[0]
+            method, path, body = scenarios[name](rng)
+            t0 = time.perf_counter()
+            try:
+                status = _request(target, method, path, body, token)[0]
+            except OSError:
+                status = 0
+            dt = time.perf_counter() - t0
+            if t0 < t_start:  # chauffe : non comptée
+                continue
+            with lock:
+                if 200 <= status < 300:
+                    lat[name].append(dt)
+                else:
+                    errors[name] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(worker, range(concurrency)))
+
+    routes, total = {}, 0
+    for n in names:
+        a = np.asarray(lat[n]) * 1000.0
+        total += len(a)
+        routes[n] = {
+            "n": int(len(a)), "errors": errors[n], "rps": len(a) / duration,
+            "mean_ms": float(a.mean()) if len(a) else None,
+            "p50_ms": float(np.percentile(a, 50)) if len(a) else None,
+            "p95_ms": float(np.percentile(a, 95)) if len(a) else None,
+            "p99_ms": float(np.percentile(a, 99)) if len(a) else None,
+        }
+    return {
+        "config": {"concurrency": concurrency, "duration_s": duration, "mix": mix, "seed": seed},
+        "total": {"n": total, "rps": total / duration, "errors": sum(errors.values())},
+        "routes": routes,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Régressions (route, métrique, base, actuel) au-delà de la tolérance."""
+    out = []
+    for name, cur in report["routes"].items():
+        base = baseline.get("routes", {}).get(name)
+        if not base:
+            continue
+        for k in ("p95_ms", "p99_ms"):
+            if base.get(k) and cur.get(k) and cur[k] > base[k] * (1 + tolerance):
+                out.append((name, k, base[k], cur[k]))
+        if base.get("rps") and cur["rps"] < base["rps"] * (1 - tolerance):
+            out.append((name, "rps", base["rps"], cur["rps"]))
+        if cur["errors"] > base.get("errors", 0):
+            out.append((name, "errors", base.get("errors", 0), cur["errors"]))
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Test de charge des endpoints Logiops360")
+    ap.add_argument("--serve", type=int, help=argparse.SUPPRESS)  # sous-process serveur
+    ap.add_argument("--target", help="serveur déjà lancé (http://host:port) : ni base ni boot")
+    ap.add_argument("--url", help="base Postgres existante au lieu d'un cluster jetable")
+    ap.add_argument("--pg-bin", help="répertoire de initdb / pg_ctl")
+    ap.add_argument("--rows", type=int, default=20_000, help="shipments générés")
+    ap.add_argument("--mix", default=DEFAULT_MIX)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="fichier JSON du rapport (sinon stdout)")
+    ap.add_argument("--baseline", help="rapport de référence à comparer")
+    ap.add_argument("--tolerance", type=float, default=0.10)
+    args = ap.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    mix = parse_mix(args.mix)
+
+    def drive(target: str) -> dict:
+        token = get_token(target)
+        return run_load(target, token, mix, args.concurrency, args.duration, args.warmup, args.seed)
+
+    if args.target:
+        report = drive(args.target)
+    else:
+        with (nullcontext(args.url) if args.url else temp_postgres(args.pg_bin)) as url:
+            prepare_db(url, args.rows, args.seed)
+            with app_server(url) as target:
+                report = drive(target)
+    report["config"]["rows"] = None if args.target else args.rows
+
+    text_report = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text_report)
+    else:
+        print(text_report)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for name, metric, base, cur in regressions:
+            print(f"[REGRESSION] {name:<14} {metric:<7} {base:10.2f} -> {cur:10.2f}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"[loadtest] aucune régression (tolérance {args.tolerance:.0%})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
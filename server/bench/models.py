@@ -0,0 +1,298 @@
+# server/bench/models.py
+"""
+Benchmark d'inférence des modèles servis par l'API.
+
+Pour chaque artefact (eta_lgbm, eta_carrier_lgbm, cost_lgbm) chargé avec son
+*_meta.json, on génère des entrées valides : catégories tirées du vocabulaire
+appris par le modèle (encodeur du pipeline / catégories pandas de LightGBM),
+sinon des valeurs distinctes de la base (`--url`), sinon celles de bench.datagen.
+On mesure ensuite, pour chaque taille de batch x nb de threads x type d'entrée
+(DataFrame pandas ou tableau NumPy) : latence p50 / p95, débit en lignes/s, pic
+mémoire Python (tracemalloc, sur un appel séparé hors chronométrage) et pic de
+RSS du cas (allocations natives de LightGBM comprises) : le pic du process
+(VmHWM) est remis à zéro avant chaque cas via /proc/self/clear_refs, le rapport
+donne ce pic et son écart au RSS d'avant le cas (Linux ; null ailleurs).
+
+    python -m bench.models --batches 1,10,100,1000,10000,100000 --threads 1,4 --out models.json
+    python -m bench.models --baseline models.json --tolerance 0.15   # code 1 si régression
+
+Les entrées NumPy ne sont mesurées que si le modèle les accepte (un pipeline
+avec ColumnTransformer nommé exige un DataFrame : ligne marquée "unsupported").
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(HERE, "models")
+
+# nom -> (artefact, meta) ; mêmes fichiers que les blueprints
+ARTIFACTS = {
+    "eta": ("eta_lgbm.joblib", "eta_feature_meta.json"),
+    "reco_eta": ("eta_carrier_lgbm.joblib", "reco_meta.json"),
+    "reco_cost": ("cost_lgbm.joblib", "reco_meta.json"),
+}
+
+# bornes plausibles des numériques (uniformes) pour les features sans vocabulaire
+_NUMERIC_RANGES = {
+    "distance_km": (15.0, 1500.0), "weight_kg": (0.5, 500.0), "volume_m3": (0.01, 5.0),
+    "total_units": (1, 60), "n_lines": (1, 12), "p50_eta_h": (6.0, 72.0), "p90_eta_h": (12.0, 120.0),
+    "delay_rate": (0.0, 0.3), "cp_cost_baseline_eur": (10.0, 1500.0), "on_time_rate": (0.7, 1.0),
+    "capacity_score": (0.5, 1.0), "ship_dow": (0, 6), "ship_hour": (0, 23),
+}
+_DB_VOCAB_SQL = {
+    "origin": "SELECT DISTINCT origin FROM shipments WHERE origin IS NOT NULL LIMIT 1000",
+    "destination_zone": "SELECT DISTINCT destination_zone FROM shipments "
+                        "WHERE destination_zone IS NOT NULL LIMIT 1000",
+    "carrier": "SELECT DISTINCT carrier FROM carrier_profiles",
+    "service_level": "SELECT DISTINCT service_level FROM carrier_profiles",
+}
+
+
+def load(name: str):
+    art, meta = ARTIFACTS[name]
+    model = joblib.load(os.path.join(MODELS_DIR, art))
+    with open(os.path.join(MODELS_DIR, meta), "r", encoding="utf-8") as f:
+        return model, json.load(f)
+
+
+# ----------------------------------------------------------------------------
+# Vocabulaires et entrées
+# ----------------------------------------------------------------------------
+def _walk(obj):
+    """Estimateurs / transformeurs imbriqués d'un pipeline sklearn."""
+    yield obj
+    for attr in ("steps", "transformers_", "transformers"):
+        for item in getattr(obj, attr, None) or []:
+            yield from _walk(item[1] if isinstance(item, tuple) else item)
+
+
+def model_vocab(model, categorical=()) -> dict:
+    vocab = {}
+    for o in _walk(model):
+        cats, names = getattr(o, "categories_", None), getattr(o, "feature_names_in_", None)
+        if cats is not None and names is not None:
+            for n, c in zip(names, cats):
+                vocab[str(n)] = [v for v in c if not (isinstance(v, float) and np.isnan(v))]
+        booster = getattr(o, "booster_", None)
+        cat_map = getattr(booster, "pandas_categorical", None) if booster is not None else None
+        feat = getattr(o, "feature_name_", None)
+        if cat_map and feat:
+            cat_cols = [c for c in feat if c in categorical]
+            for n, c in zip(cat_cols, cat_map):
+                vocab.setdefault(n, list(c))
+    return vocab
+
+
+def db_vocab(url: str) -> dict:
+    from sqlalchemy import create_engine
+
+    import db
+    eng = create_engine(url)
+    out = {k: db.fetch_column(sql, eng=eng) for k, sql in _DB_VOCAB_SQL.items()}
+    eng.dispose()
+    return {k: v for k, v in out.items() if v}
+
+
+def datagen_vocab() -> dict:
+    from bench import datagen
+    cfg = datagen.Config()
+    cp, ln = datagen.carriers(cfg), datagen.lanes(cfg)
+    return {
+        "origin": sorted(ln["origin"].unique()), "destination_zone": sorted(ln["destination_zone"].unique()),
+        "carrier": sorted(cp["carrier"].unique()), "service_level": sorted(cp["service_level"].unique()),
+    }
+
+
+def make_inputs(meta: dict, vocab: dict, n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cols = {}
+    for f in meta["features"]:
+        if f in vocab and vocab[f]:
+            values = np.asarray(vocab[f], dtype=object)
+            cols[f] = values[rng.integers(0, len(values), n)]
+        else:
+            lo, hi = _NUMERIC_RANGES.get(f, (0.0, 1.0))
+            if isinstance(lo, int) and isinstance(hi, int):
+                cols[f] = rng.integers(lo, hi + 1, n)
+            else:
+                cols[f] = rng.uniform(lo, hi, n)
+    df = pd.DataFrame(cols, columns=meta["features"])
+    for f in meta.get("categorical", []):
+        if df[f].dtype == object:
+            df[f] = df[f].astype(str)
+    return df
+
+
+# ----------------------------------------------------------------------------
+# Mesure
+# ----------------------------------------------------------------------------
+def _set_threads(model, n: int):
+    for o in _walk(model):
+        for attr in ("n_jobs", "num_threads"):
+            if hasattr(o, attr):
+                try:
+                    o.set_params(**{attr: n})
+                except Exception:
+                    setattr(o, attr, n)
+
+
+def _proc_status_mb(field: str):
+    """Champ mémoire de /proc/self/status (VmRSS, VmHWM) en Mo ; None hors Linux."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0  # kB
+    except OSError:
+        pass
+    return None
+
+
+def _reset_rss_peak() -> bool:
+    """Remet VmHWM au RSS courant : le pic suivant est celui du cas mesuré."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(model, X, repeat: int, min_time: float) -> dict:
+    model.predict(X[:1] if hasattr(X, "__getitem__") and len(X) > 1 else X)  # chauffe
+    gc.collect()
+    rss_before = _proc_status_mb("VmRSS")
+    peak_reset = _reset_rss_peak()
+    samples, t_total = [], 0.0
+    while len(samples) < repeat or (t_total < min_time and len(samples) < 10 * repeat):
+        t0 = time.perf_counter()
+        model.predict(X)
+        dt = time.perf_counter() - t0
+        samples.append(dt)
+        t_total += dt
+    rss_peak = _proc_status_mb("VmHWM") if peak_reset else None
+    # pic Python sur un appel séparé : tracemalloc ralentit chaque allocation
+    tracemalloc.start()
+    try:
+        model.predict(X)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    samples.sort()
+    p50 = statistics.median(samples)
+    return {
+        "p50_ms": p50 * 1000.0,
+        "p95_ms": samples[int(0.95 * (len(samples) - 1))] * 1000.0,
+        "rows_per_s": len(X) / p50 if p50 > 0 else None,
+        "py_peak_mb": peak / 1e6,
+        "rss_peak_mb": rss_peak,
+        "rss_delta_mb": rss_peak - rss_before if rss_peak is not None and rss_before is not None else None,
+        "runs": len(samples),
+    }
+
+
+def run(names, batches, threads, inputs, repeat, min_time, url=None, seed=0, out=sys.stderr) -> list:
+    rows = []
+    fallback = None
+    for name in names:
+        model, meta = load(name)
+        vocab = model_vocab(model, meta.get("categorical", ()))
+        if not all(f in vocab for f in meta.get("categorical", []) if f in _DB_VOCAB_SQL):
+            if fallback is None:
+                fallback = db_vocab(url) if url else datagen_vocab()
+            vocab = {**fallback, **vocab}
+        big = make_inputs(meta, vocab, max(batches), seed)
+        for t in threads:
+            _set_threads(model, t)
+            for b in batches:
+                frame = big.iloc[:b]
+                for kind in inputs:
+                    X = frame if kind == "pandas" else frame.to_numpy()
+                    row = {"model": name, "input": kind, "threads": t, "batch": b}
+                    try:
+                        row.update(measure(model, X, repeat, min_time))
+                    except Exception as e:  # ex. entrée NumPy refusée par le pipeline
+                        row.update({"unsupported": f"{type(e).__name__}: {e}"[:200]})
+                    rows.append(row)
+                    if "p50_ms" in row:
+                        print(f"[models] {name:<9} {kind:<6} t={t:<2} batch={b:<6} "
+                              f"p50={row['p50_ms']:9.3f}ms  {row['rows_per_s'] or 0:12,.0f} lignes/s  "
+                              f"py_peak={row['py_peak_mb']:7.1f}Mo  "
+                              f"rss_delta={row['rss_delta_mb'] if row['rss_delta_mb'] is not None else float('nan'):7.1f}Mo",
+                              file=out)
+    return rows
+
+
+def _key(r: dict):
+    return r["model"], r["input"], r["threads"], r["batch"]
+
+
+def compare(rows: list, baseline: list, tolerance: float) -> list:
+    base = {_key(r): r for r in baseline if "p50_ms" in r}
+    out = []
+    for r in rows:
+        b = base.get(_key(r))
+        if b and "p50_ms" in r and r["p50_ms"] > b["p50_ms"] * (1 + tolerance):
+            out.append((_key(r), b["p50_ms"], r["p50_ms"]))
+    return out
+
+
+def _ints(spec: str) -> list:
+    return [int(x) for x in spec.split(",") if x.strip()]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark d'inférence des modèles")
+    ap.add_argument("--models", default=",".join(ARTIFACTS))
+    ap.add_argument("--batches", default="1,10,100,1000,10000,100000")
+    ap.add_argument("--threads", default="1," + str(os.cpu_count() or 1))
+    ap.add_argument("--inputs", default="pandas,numpy")
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--min-time", type=float, default=0.5, help="durée mini de mesure par cas (s)")
+    ap.add_argument("--url", default=None, help="base pour les vocabulaires (sinon modèle / datagen)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="rapport JSON (sinon stdout)")
+    ap.add_argument("--baseline")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    args = ap.parse_args()
+
+    names = [n for n in args.models.split(",") if n]
+    unknown = [n for n in names if n not in ARTIFACTS]
+    if unknown:
+        raise SystemExit(f"modèles inconnus : {unknown} (connus : {list(ARTIFACTS)})")
+    batches = _ints(args.batches)
+    threads = sorted(set(_ints(args.threads)))
+    inputs = [i for i in args.inputs.split(",") if i in ("pandas", "numpy")]
+
+    rows = run(names, batches, threads, inputs, args.repeat, args.min_time, args.url, args.seed)
+    report = {"config": {"batches": batches, "threads": threads, "inputs": inputs,
+                         "repeat": args.repeat, "cpu_count": os.cpu_count()},
+              "results": rows}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(rows, json.load(f)["results"], args.tolerance)
+        for key, b, c in regressions:
+            print(f"[REGRESSION] {key} p50 {b:.3f}ms -> {c:.3f}ms", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# server/bench/queries.py
+"""
+Micro-benchmark des lectures OLTP : `pd.read_sql` vs helpers `db.fetch_*`.
+
+Pour chaque endpoint concerné, on exécute la même requête sur une connexion chaude
+par les deux chemins et on reporte la médiane / p95 en microsecondes.
+
+    python -m bench.queries --repeat 200
+"""
+import argparse
+import statistics
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import db
+from kpi_api import SQL_IN_PROGRESS
+from ml_anomaly_api import SQL_DETAIL_EVENT, SQL_DETAIL_PHASES
+from ml_delay_api import SQL_DETAIL
+from ml_reco_simple_api import SQL_GLOBAL_MEDIANS
+
+
+def _sample_params(eng) -> dict:
+    with eng.connect() as c:
+        sid = c.execute(text(
+            "SELECT shipment_id FROM fv_train_eta WHERE shipment_id IS NOT NULL LIMIT 1"
+        )).scalar()
+        ev = c.execute(text(
+            "SELECT shipment_id, event_id FROM fv_phase_enriched LIMIT 1"
+        )).first()
+    return {
+        "sid": sid,
+        "anom_sid": ev[0] if ev else sid,
+        "anom_eid": int(ev[1]) if ev else 0,
+    }
+
+
+def _cases(p: dict):
+    # (endpoint, sql, params, helper db utilisé par le handler)
+    return [
+        ("kpi.counters", SQL_IN_PROGRESS, {}, db.fetch_scalar),
+        ("eta.predict_by_id / delay.detail", SQL_DETAIL, {"sid": p["sid"]}, db.fetch_one_dict),
+        ("anom.detail (event)", SQL_DETAIL_EVENT,
+         {"sid": p["anom_sid"], "eid": p["anom_eid"]}, db.fetch_one_dict),
+        ("anom.detail (phases)", SQL_DETAIL_PHASES, {"sid": p["anom_sid"]}, db.fetch_dicts),
+        ("reco.global_medians", SQL_GLOBAL_MEDIANS, {}, db.fetch_one_dict),
+    ]
+
+
+def _timeit(fn, repeat: int) -> list:
+    fn()  # chauffe (connexion, cache de compilation)
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+
+def _fmt(samples: list) -> str:
+    samples = sorted(samples)
+    p95 = samples[int(0.95 * (len(samples) - 1))]
+    return f"p50={statistics.median(samples):9.0f}us  p95={p95:9.0f}us"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--url", default=db.DATABASE_URL)
+    args = ap.parse_args()
+
+    eng = create_engine(args.url, pool_pre_ping=True)
+    params = _sample_params(eng)
+
+    for name, sql, prm, helper in _cases(params):
+        q = text(sql)
+
+        def via_pandas():
+            with eng.connect() as c:
+                pd.read_sql(q, c, params=prm)
+
+        def via_db():
+            helper(sql, prm, eng=eng)
+
+        a = _timeit(via_pandas, args.repeat)
+        b = _timeit(via_db, args.repeat)
+        gain = statistics.median(a) / max(statistics.median(b), 1e-9)
+        print(f"{name:<34} read_sql {_fmt(a)} | db.{helper.__name__:<15} {_fmt(b)} | x{gain:4.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# server/bench/replicas.py
+"""
+Primaire + réplica en streaming replication, jetables, pour vérifier le routage
+des lectures (db.ReplicaRouter).
+
+Le primaire est créé comme dans bench.loadtest (initdb / pg_ctl, port libre),
+le réplica par `pg_basebackup -R` puis démarré en hot standby. Le scénario :
+  1. migrations sur le primaire, attente du rattrapage du réplica
+  2. lectures hors écriture -> réplica
+  3. écriture (commit) dans la requête -> lectures suivantes sur le primaire
+  4. rejeu suspendu (pg_wal_replay_pause) + écriture : le retard dépasse
+     --max-lag, le routeur retombe sur le primaire ; reprise -> réplica
+
+    python -m bench.replicas                 # scénario, code 1 en cas d'écart
+    python -m bench.replicas --keep          # garde les deux instances (affiche les URL)
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from bench.loadtest import _free_port, _pg_tool
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start(pg_ctl: str, data: str, port: int, root: str, log: str, extra: str = ""):
+    opts = f"-p {port} -k {root} -c listen_addresses=127.0.0.1 -c fsync=off {extra}"
+    subprocess.run([pg_ctl, "-D", data, "-o", opts, "-l", log, "-w", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+@contextmanager
+def temp_replicated(pg_bin: str = None, dbname: str = "logiops"):
+    """(url primaire, url réplica) sur deux clusters éphémères."""
+    from sqlalchemy import create_engine, text
+
+    root = tempfile.mkdtemp(prefix="logiops-repl-")
+    primary, standby = os.path.join(root, "primary"), os.path.join(root, "standby")
+    p_port, s_port = _free_port(), _free_port()
+    pg_ctl = _pg_tool("pg_ctl", pg_bin)
+    subprocess.run([_pg_tool("initdb", pg_bin), "-D", primary, "-U", "postgres", "--auth=trust",
+                    "-E", "UTF8", "--no-sync"], check=True, stdout=subprocess.DEVNULL)
+    with open(os.path.join(primary, "pg_hba.conf"), "a", encoding="utf-8") as f:
+        f.write("host replication postgres 127.0.0.1/32 trust\n")
+    started = []
+    try:
+        _start(pg_ctl, primary, p_port, root, os.path.join(root, "primary.log"),
+               "-c wal_level=replica -c max_wal_senders=4")
+        started.append(primary)
+        subprocess.run([_pg_tool("pg_basebackup", pg_bin), "-D", standby, "-h", "127.0.0.1",
+                        "-p", str(p_port), "-U", "postgres", "-R", "-X", "stream"],
+                       check=True, stdout=subprocess.DEVNULL)
+        _start(pg_ctl, standby, s_port, root, os.path.join(root, "standby.log"), "-c hot_standby=on")
+        started.append(standby)
+
+        admin = create_engine(f"postgresql+psycopg2://postgres@127.0.0.1:{p_port}/postgres",
+                              isolation_level="AUTOCOMMIT")
+        with admin.connect() as c:
+            c.execute(text(f"CREATE DATABASE {dbname}"))
+        admin.dispose()
+        yield (f"postgresql+psycopg2://postgres@127.0.0.1:{p_port}/{dbname}",
+               f"postgresql+psycopg2://postgres@127.0.0.1:{s_port}/{dbname}")
+    finally:
+        for data in reversed(started):
+            subprocess.run([pg_ctl, "-D", data, "-m", "immediate", "stop"],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _wait_caught_up(router, timeout: float = 30.0):
+    t_end = time.time() + timeout
+    while time.time() < t_end:
+        router.check_once()
+        if router.healthy():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def scenario(primary_url: str, replica_url: str, max_lag: float = 1.0, out=sys.stderr) -> list:
+    """Déroule le scénario ; renvoie la liste des écarts (vide = OK)."""
+    from flask import Flask
+    from sqlalchemy import create_engine, text
+
+    import db
+    import migrations
+
+    eng = create_engine(primary_url)
+    migrations.upgrade(eng, out=out)
+    eng.dispose()
+
+    primary = db.make_engine("analytics", primary_url, name="bench-primary")
+    replica = db.make_engine("replica", replica_url, name="bench-replica")
+    router = db.ReplicaRouter(primary, [("replica0", replica)], max_lag_s=max_lag, check_s=0.2)
+    router.track_writes(primary)
+    app = Flask(__name__)
+    app.config.update(_ENGINE=primary, _ENGINES={"analytics": primary}, _ROUTER=router)
+
+    errors = []
+
+    def expect(label, got, want):
+        ok = got is want
+        print(f"[replicas] {label:<32} -> {'réplica' if got is replica else 'primaire'}"
+              f"{'' if ok else '  (ÉCART)'}", file=out)
+        if not ok:
+            errors.append(label)
+
+    if not _wait_caught_up(router):
+        return ["réplica jamais à jour"]
+
+    with app.test_request_context("/api/ml/delay/list"):
+        expect("lecture simple", db.get_engine("analytics"), replica)
+
+    with app.test_request_context("/api/auth/signup"):
+        with primary.begin() as c:
+            c.execute(text("CREATE TABLE IF NOT EXISTS bench_ryw (v int)"))
+            c.execute(text("INSERT INTO bench_ryw VALUES (1)"))
+        expect("lecture après écriture", db.get_engine("analytics"), primary)
+
+    # rejeu suspendu : le retard grandit jusqu'au-delà de max_lag
+    with replica.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+        c.execute(text("SELECT pg_wal_replay_pause()"))
+    try:
+        with primary.begin() as c:
+            c.execute(text("INSERT INTO bench_ryw VALUES (2)"))
+        time.sleep(max_lag + 0.5)
+        router.check_once()
+        with app.test_request_context("/api/ml/delay/list"):
+            expect("réplica en retard", db.get_engine("analytics"), primary)
+    finally:
+        with replica.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+            c.execute(text("SELECT pg_wal_replay_resume()"))
+
+    if not _wait_caught_up(router):
+        errors.append("réplica jamais revenu")
+    with app.test_request_context("/api/ml/delay/list"):
+        expect("réplica rattrapé", db.get_engine("analytics"), replica)
+
+    primary.dispose()
+    replica.dispose()
+    return errors
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Routage des lectures sur primaire + réplica jetables")
+    ap.add_argument("--pg-bin", default=None, help="répertoire des binaires PostgreSQL")
+    ap.add_argument("--max-lag", type=float, default=1.0)
+    ap.add_argument("--keep", action="store_true", help="garder les instances jusqu'à Ctrl-C")
+    args = ap.parse_args()
+
+    sys.path.insert(0, HERE)
+    with temp_replicated(args.pg_bin) as (primary_url, replica_url):
+        if args.keep:
+            print(f"export DATABASE_URL={primary_url}\nexport DB_REPLICA_URLS={replica_url}")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return 0
+        errors = scenario(primary_url, replica_url, args.max_lag)
+    for e in errors:
+        print(f"[ÉCART] {e}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
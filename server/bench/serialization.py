@@ -0,0 +1,67 @@
+# server/bench/serialization.py
+"""
+Compare l'ancien chemin `to_dict(orient="records")` + json stdlib au chemin
+`serialization.json_response` (records et colonnes) sur un DataFrame synthétique.
+
+    python -m bench.serialization --rows 10000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from serialization import json_response
+
+
+def _frame(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    carriers = np.array(["DHL", "UPS", "GLS", "CHRONOPOST", "TNT"])
+    df = pd.DataFrame({
+        "shipment_id": [f"S{i:08d}" for i in range(n)],
+        "carrier": carriers[rng.integers(0, len(carriers), n)],
+        "distance_km": rng.gamma(2.0, 150.0, n),
+        "weight_kg": rng.gamma(2.0, 40.0, n),
+        "eta_pred_h": rng.normal(36.0, 8.0, n),
+        "delta_h": np.where(rng.random(n) < 0.1, np.nan, rng.normal(0.0, 3.0, n)),
+        "n_lines": rng.integers(1, 20, n),
+        "ship_dt": pd.date_range("2025-01-01", periods=n, freq="min", tz="UTC"),
+    })
+    return df
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    df = _frame(args.rows)
+
+    def legacy():
+        recs = df.assign(ship_dt=df["ship_dt"].astype(str)).to_dict(orient="records")
+        # jsonify refuse NaN / NumPy : on reproduit le nettoyage minimal nécessaire
+        json.dumps({"items": recs}, default=str).encode("utf-8")
+
+    results = {
+        "legacy_to_dict_json": _best_of(legacy, args.repeat),
+        "records": _best_of(lambda: json_response({"items": df}, columnar=False), args.repeat),
+        "columns": _best_of(lambda: json_response({"items": df}, columnar=True), args.repeat),
+    }
+    base = results["legacy_to_dict_json"]
+    for name, sec in results.items():
+        print(f"{name:<22} {sec * 1000:9.2f} ms   x{base / sec:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
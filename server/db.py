@@ -0,0 +1,378 @@
+# server/db.py
+"""
+Accès DB léger pour les lectures OLTP (scalaire, une ligne, quelques lignes).
+
+`pd.read_sql` construit un DataFrame même pour un `COUNT(*)` : sur une connexion
+chaude, c'est plus cher que la requête elle-même. Les helpers ci-dessous passent
+directement par l'engine partagé (`current_app.config["_ENGINE"]`) et renvoient des
+tuples, des dicts ou des tableaux NumPy structurés. `read_sql` reste réservé aux
+handlers qui ont vraiment besoin d'un DataFrame (listes + prédiction batch).
+
+Les requêtes sont compilées une seule fois (`stmt`) : la même TextClause est
+réutilisée, ce qui profite du cache de compilation de SQLAlchemy. psycopg2 n'a
+pas de PREPARE côté serveur, c'est donc le seul niveau de préparation utile ici.
+
+Engines par charge de travail (`make_engines`) : un pool par classe, pour qu'un
+scan analytique ne puisse jamais affamer les connexions des logins.
+  oltp       auth, lectures ponctuelles             (`current_app.config["_ENGINE"]`)
+  analytics  listes, KPI, recommandation, ML        (`get_engine("analytics")`)
+  batch      exports, rafraîchissements, maintenance (`get_engine("batch")`)
+
+Réglages par variable d'environnement, globaux ou par charge (DB_<CHARGE>_…
+l'emporte sur DB_…) : POOL_SIZE, MAX_OVERFLOW, POOL_TIMEOUT (s), POOL_RECYCLE (s),
+PRE_PING = always | idle | never (idle : ping seulement si la connexion dort
+depuis plus de PRE_PING_IDLE_S, au lieu d'un aller-retour à chaque checkout),
+URL (base dédiée). DB_ENGINES=shared revient à un seul pool pour tout.
+
+Réplicas en lecture (`ReplicaRouter`) : avec DB_REPLICA_URLS, les lectures de la
+charge `analytics` partent vers un réplica (round_robin ou least_busy), tant que
+son retard de réplication reste sous DB_REPLICA_MAX_LAG_S ; sinon primaire.
+Après une écriture (commit sur un engine primaire), la requête en cours et les
+suivantes du même utilisateur pendant DB_READ_YOUR_WRITES_S lisent le primaire.
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from decimal import Decimal
+from functools import lru_cache
+
+from flask import current_app, g, has_request_context
+from sqlalchemy import create_engine, event, exc, text
+
+import lazy
+import metrics
+
+np = lazy.module("numpy")
+
+# ----------------------------------------------------------------------------
+# Configuration (partagée par app.py et les scripts hors Flask)
+# ----------------------------------------------------------------------------
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASS = os.getenv("DB_PASS", "313055")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "logiops")
+
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
+)
+
+
+# ----------------------------------------------------------------------------
+# Engines par charge de travail
+# ----------------------------------------------------------------------------
+WORKLOADS = ("oltp", "analytics", "batch")
+_POOL_DEFAULTS = {
+    "oltp": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 5, "pool_recycle": 3600, "pre_ping": "idle"},
+    "analytics": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 15, "pool_recycle": 3600, "pre_ping": "idle"},
+    "batch": {"pool_size": 3, "max_overflow": 2, "pool_timeout": 60, "pool_recycle": 1800, "pre_ping": "always"},
+    # engine propre à chaque process de traitement asynchrone (jobs.py)
+    "jobs": {"pool_size": 1, "max_overflow": 1, "pool_timeout": 60, "pool_recycle": 1800, "pre_ping": "always"},
+    "replica": {"pool_size": 5, "max_overflow": 5, "pool_timeout": 15, "pool_recycle": 3600, "pre_ping": "idle"},
+}
+PRE_PING_IDLE_S = float(os.getenv("DB_PRE_PING_IDLE_S", "30"))
+
+
+def _setting(workload: str, key: str, default):
+    raw = os.getenv(f"DB_{workload.upper()}_{key.upper()}", os.getenv(f"DB_{key.upper()}"))
+    return default if raw is None or raw == "" else type(default)(raw)
+
+
+def pool_options(workload: str) -> dict:
+    d = _POOL_DEFAULTS.get(workload, _POOL_DEFAULTS["oltp"])
+    return {k: _setting(workload, k, v) for k, v in d.items()}
+
+
+def _install_idle_ping(eng, idle_s: float):
+    """Ping (SELECT 1) au checkout seulement après `idle_s` d'inactivité."""
+
+    @event.listens_for(eng.pool, "checkin")
+    def _checkin(dbapi_conn, rec):
+        rec.info["_checkin_at"] = time.monotonic()
+
+    @event.listens_for(eng.pool, "checkout")
+    def _checkout(dbapi_conn, rec, proxy):
+        t = rec.info.get("_checkin_at")
+        if t is None or time.monotonic() - t < idle_s:
+            return
+        try:
+            cur = dbapi_conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            dbapi_conn.rollback()  # pas de transaction ouverte laissée au handler
+        except Exception as e:
+            raise exc.DisconnectionError(str(e))  # le pool jette la connexion et réessaie
+
+
+def make_engine(workload: str = "oltp", url: str = None, name: str = None):
+    """Engine configuré pour une charge ; pool instrumenté sous `name` (défaut : la charge)."""
+    opts = pool_options(workload)
+    pre_ping = opts.pop("pre_ping")
+    eng = create_engine(
+        url or _setting(workload, "url", DATABASE_URL),
+        poolclass=metrics.TimedQueuePool,
+        pool_pre_ping=(pre_ping == "always"),
+        connect_args={"application_name": f"logiops-{name or workload}"},
+        **opts,
+    )
+    if pre_ping == "idle":
+        _install_idle_ping(eng, PRE_PING_IDLE_S)
+    return metrics.instrument_engine(eng, name or workload)
+
+
+def make_engines() -> dict:
+    """{charge: engine} ; DB_ENGINES=shared -> un seul engine pour toutes."""
+    if os.getenv("DB_ENGINES", "separate") == "shared":
+        eng = make_engine("oltp")
+        return {w: eng for w in WORKLOADS}
+    return {w: make_engine(w) for w in WORKLOADS}
+
+
+# ----------------------------------------------------------------------------
+# Routage des lectures vers les réplicas
+# ----------------------------------------------------------------------------
+REPLICA_URLS = [u.strip() for u in os.getenv("DB_REPLICA_URLS", "").split(",") if u.strip()]
+REPLICA_STRATEGY = os.getenv("DB_REPLICA_STRATEGY", "round_robin")  # round_robin | least_busy
+REPLICA_MAX_LAG_S = float(os.getenv("DB_REPLICA_MAX_LAG_S", "5"))
+REPLICA_CHECK_S = float(os.getenv("DB_REPLICA_CHECK_S", "2"))  # 0 = pas de sonde (retard supposé nul)
+READ_YOUR_WRITES_S = float(os.getenv("DB_READ_YOUR_WRITES_S", str(REPLICA_MAX_LAG_S)))
+READ_WORKLOADS = ("analytics",)
+
+# position WAL du primaire, lue juste avant de sonder les réplicas
+SQL_PRIMARY_LSN = "SELECT pg_current_wal_lsn()::text"
+# retard (s) d'un réplica ; NULL si pas en recovery. À jour (0) seulement si le rejeu a
+# atteint la position du primaire, ou si le récepteur WAL est connecté (streaming) et a
+# tout rejoué : `receive = replay` seul reste vrai quand le récepteur est déconnecté.
+# Sinon âge de la dernière transaction rejouée (infini si inconnu). Le statut du
+# récepteur n'est visible qu'avec pg_read_all_stats (rôle pg_monitor).
+SQL_REPLICA_LAG = """
+    SELECT CASE
+      WHEN NOT pg_is_in_recovery() THEN NULL
+      WHEN CAST(:primary_lsn AS pg_lsn) IS NOT NULL
+           AND pg_last_wal_replay_lsn() >= CAST(:primary_lsn AS pg_lsn) THEN 0::float8
+      WHEN (SELECT status FROM pg_stat_wal_receiver) = 'streaming'
+           AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0::float8
+      ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+                    'Infinity'::float8)
+    END
+"""
+
+READ_ROUTED = metrics.register(metrics.Counter(
+    "logiops_db_read_routed_total", "Lectures routées (réplica ou primaire, avec la raison)",
+    ("target", "reason")))
+
+
+class ReplicaRouter:
+    def __init__(self, primary, replicas: list, strategy: str = REPLICA_STRATEGY,
+                 max_lag_s: float = REPLICA_MAX_LAG_S, pin_s: float = READ_YOUR_WRITES_S,
+                 check_s: float = REPLICA_CHECK_S):
+        self.primary = primary
+        self.replicas = list(replicas)          # [(nom, engine)]
+        self.strategy = strategy
+        self.max_lag_s = max_lag_s
+        self.pin_s = pin_s
+        self.check_s = check_s
+        # retard par réplica (s) ; None = injoignable / pas encore sondé
+        self.lag = {n: (0.0 if check_s <= 0 else None) for n, _ in self.replicas}
+        self._rr = itertools.count()
+        self._writes = {}                       # identité JWT -> instant de la dernière écriture
+        self._lock = threading.Lock()
+        self._thread = None
+        metrics.register(metrics.Gauge(
+            "logiops_db_replica_lag_seconds", "Retard de réplication observé (-1 = injoignable)",
+            lambda: {(n,): (-1 if v is None else v) for n, v in self.lag.items()}, ("replica",)))
+
+    def engines(self) -> list:
+        return [e for _, e in self.replicas]
+
+    # -- sonde de retard -------------------------------------------------------
+    def check_once(self):
+        try:
+            primary_lsn = fetch_scalar(SQL_PRIMARY_LSN, eng=self.primary)
+        except Exception:
+            primary_lsn = None   # primaire injoignable : on se fie au seul récepteur WAL
+        for name, eng in self.replicas:
+            try:
+                v = fetch_scalar(SQL_REPLICA_LAG, {"primary_lsn": primary_lsn}, eng=eng)
+                self.lag[name] = 0.0 if v is None else float(v)
+            except Exception:
+                self.lag[name] = None
+
+    def _loop(self):
+        while True:
+            self.check_once()
+            time.sleep(self.check_s)
+
+    def start(self):
+        if self.check_s > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="replica-lag", daemon=True)
+            self._thread.start()
+        return self
+
+    def healthy(self) -> list:
+        return [(n, e) for n, e in self.replicas
+                if self.lag.get(n) is not None and self.lag[n] <= self.max_lag_s]
+
+    # -- read your writes --------------------------------------------------------
+    @staticmethod
+    def _identity():
+        try:
+            from flask_jwt_extended import get_jwt_identity
+            return get_jwt_identity()
+        except Exception:
+            return None
+
+    def note_write(self, conn=None):
+        if not has_request_context():
+            return
+        g._db_pinned = True
+        ident = self._identity()
+        if ident is not None:
+            with self._lock:
+                self._writes[ident] = time.monotonic()
+
+    def track_writes(self, eng):
+        """Un commit sur cet engine (primaire) épingle les lectures qui suivent."""
+        event.listen(eng, "commit", self.note_write)
+
+    def _pinned(self) -> bool:
+        if g.get("_db_pinned"):
+            return True
+        ident = self._identity()
+        if ident is None:
+            return False
+        with self._lock:
+            t = self._writes.get(ident)
+            if t is not None and time.monotonic() - t > self.pin_s:
+                del self._writes[ident]
+                t = None
+        return t is not None
+
+    # -- choix -------------------------------------------------------------------
+    def _choose(self):
+        if self._pinned():
+            return "primary", self.primary, "pinned"
+        candidates = self.healthy()
+        if not candidates:
+            return "primary", self.primary, "no_replica"
+        if self.strategy == "least_busy":
+            name, eng = min(candidates, key=lambda c: (c[1].pool.checkedout(), c[0]))
+        else:
+            name, eng = candidates[next(self._rr) % len(candidates)]
+        return name, eng, "read"
+
+    def pick(self):
+        """Engine de lecture, figé pour la durée de la requête (même réplica pour toutes ses lectures)."""
+        if not has_request_context():
+            return self._choose()[1]
+        chosen = g.get("_db_read_engine")
+        if chosen is None or (chosen is not self.primary and self._pinned()):
+            name, chosen, reason = self._choose()
+            g._db_read_engine = chosen
+            READ_ROUTED.inc(name, reason)
+        return chosen
+
+    def status(self) -> dict:
+        return {"strategy": self.strategy, "max_lag_s": self.max_lag_s,
+                "replicas": {n: {"lag_s": self.lag.get(n),
+                                 "healthy": any(n == h for h, _ in self.healthy())}
+                             for n, _ in self.replicas}}
+
+
+def make_router(engines: dict):
+    """ReplicaRouter si DB_REPLICA_URLS est défini (sinon None) ; sonde démarrée."""
+    if not REPLICA_URLS:
+        return None
+    replicas = [(f"replica{i}", make_engine("replica", url, name=f"replica{i}"))
+                for i, url in enumerate(REPLICA_URLS)]
+    router = ReplicaRouter(engines["analytics"], replicas)
+    for eng in set(engines.values()):
+        router.track_writes(eng)
+    return router.start()
+
+
+def get_engine(workload: str = None):
+    """
+    Engine de la charge demandée (repli : engine principal `_ENGINE`). Les charges
+    de lecture (READ_WORKLOADS) passent par le ReplicaRouter s'il est configuré.
+    """
+    cfg = current_app.config
+    router = cfg.get("_ROUTER")
+    if router is not None and workload in READ_WORKLOADS:
+        return router.pick()
+    if workload is not None:
+        eng = (cfg.get("_ENGINES") or {}).get(workload)
+        if eng is not None:
+            return eng
+    return cfg.get("_ENGINE")
+
+
+@lru_cache(maxsize=512)
+def stmt(sql: str):
+    """TextClause mise en cache par texte SQL (compilée une fois)."""
+    return text(sql)
+
+
+def _coerce(v):
+    # même comportement que read_sql(coerce_float=True) : numeric -> float
+    return float(v) if isinstance(v, Decimal) else v
+
+
+def _connect(eng):
+    return (eng if eng is not None else get_engine()).connect()
+
+
+def fetch_scalar(sql: str, params: dict = None, eng=None):
+    """Première colonne de la première ligne (ou None)."""
+    with _connect(eng) as c:
+        return _coerce(c.execute(stmt(sql), params or {}).scalar())
+
+
+def fetch_one(sql: str, params: dict = None, eng=None):
+    """Première ligne en tuple (ou None)."""
+    with _connect(eng) as c:
+        row = c.execute(stmt(sql), params or {}).first()
+    return None if row is None else tuple(_coerce(v) for v in row)
+
+
+def fetch_one_dict(sql: str, params: dict = None, eng=None):
+    """Première ligne en dict {colonne: valeur} (ou None)."""
+    with _connect(eng) as c:
+        row = c.execute(stmt(sql), params or {}).mappings().first()
+    return None if row is None else {k: _coerce(v) for k, v in row.items()}
+
+
+def fetch_all(sql: str, params: dict = None, eng=None) -> list:
+    """Toutes les lignes en tuples."""
+    with _connect(eng) as c:
+        return [tuple(_coerce(v) for v in row) for row in c.execute(stmt(sql), params or {})]
+
+
+def fetch_dicts(sql: str, params: dict = None, eng=None) -> list:
+    """Toutes les lignes en dicts."""
+    with _connect(eng) as c:
+        res = c.execute(stmt(sql), params or {}).mappings()
+        return [{k: _coerce(v) for k, v in row.items()} for row in res]
+
+
+def fetch_column(sql: str, params: dict = None, eng=None) -> list:
+    """Première colonne de toutes les lignes."""
+    with _connect(eng) as c:
+        return [_coerce(v) for v in c.execute(stmt(sql), params or {}).scalars()]
+
+
+def fetch_array(sql: str, params: dict = None, eng=None, dtype=None) -> np.ndarray:
+    """Lignes en tableau NumPy structuré (un champ par colonne)."""
+    with _connect(eng) as c:
+        res = c.execute(stmt(sql), params or {})
+        names = list(res.keys())
+        rows = [tuple(_coerce(v) for v in row) for row in res]
+    if dtype is not None:
+        return np.array(rows, dtype=dtype)
+    if not rows:
+        return np.empty(0, dtype=[(n, object) for n in names])
+    return np.rec.fromrecords(rows, names=names).view(np.ndarray)
@@ -0,0 +1,172 @@
+# server/deadline.py
+"""
+Échéance de bout en bout par requête, propagée jusqu'à Postgres.
+
+Chaque requête reçoit une échéance au before_request :
+  - en-tête `X-Request-Timeout-Ms` (budget restant côté client), plafonné par
+    DEADLINE_MAX_MS ;
+  - sinon le défaut de la route (DEADLINE_ROUTES, motifs fnmatch), sinon
+    DEADLINE_DEFAULT_MS. 0 = pas d'échéance (exports en flux).
+
+Le budget restant est appliqué en `SET LOCAL statement_timeout` au début de
+chaque transaction ouverte par les blueprints (event `begin` de l'engine, donc
+sur chaque connexion empruntée au pool) : un scan abandonné par le navigateur
+est annulé par Postgres au lieu de garder une connexion et du CPU. Les
+`predict()` (metrics.TimedModel) sont sautés si l'échéance est déjà passée.
+
+Échéance dépassée (avant une requête SQL, avant un predict, ou annulation
+Postgres 57014) -> réponse 504 distincte, même si le handler a intercepté
+l'exception et préparé un 500 / 400.
+"""
+import math
+import os
+import time
+from fnmatch import fnmatchcase
+
+from flask import g, has_request_context, jsonify, request
+from sqlalchemy import event
+
+import metrics
+
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+DEADLINE_DEFAULT_MS = float(os.getenv("DEADLINE_DEFAULT_MS", "30000"))
+DEADLINE_MAX_MS = float(os.getenv("DEADLINE_MAX_MS", "120000"))
+MIN_STATEMENT_MS = 10     # en deçà, inutile de lancer la requête
+
+# (motif de règle Flask, budget ms) — premier motif qui correspond
+DEADLINE_ROUTES = (
+    ("/api/auth/*", 5000),
+    ("/api/ml/eta/meta", 2000),
+    ("/api/ml/*/distincts", 5000),
+    ("/api/ml/anom/list", 15000),
+    ("/api/ml/delay/list", 15000),
+    ("/api/ml/reco-simple/recommend", 10000),
+    ("/api/export/*", 0),
+    ("/api/jobs/*/result", 0),
+    ("/api/admin/*", 0),
+    ("/api/metrics", 0),
+)
+
+_PG_QUERY_CANCELED = "57014"
+
+EXCEEDED = metrics.register(metrics.Counter(
+    "logiops_deadline_exceeded_total", "Requêtes arrêtées à l'échéance (étape : db, model, pg)",
+    ("route", "stage")))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Échéance de la requête dépassée."""
+
+
+def route_budget_ms(rule: str) -> float:
+    for pattern, ms in DEADLINE_ROUTES:
+        if fnmatchcase(rule, pattern):
+            return float(ms)
+    return DEADLINE_DEFAULT_MS
+
+
+def remaining_ms():
+    """Budget restant (ms) de la requête en cours, None si pas d'échéance."""
+    if not has_request_context():
+        return None
+    d = g.get("_deadline")
+    return None if d is None else (d - time.monotonic()) * 1000.0
+
+
+def _exceeded(stage: str):
+    if not g.get("_deadline_exceeded"):
+        g._deadline_exceeded = stage
+        EXCEEDED.inc(metrics.current_route(), stage)
+
+
+def check(stage: str = "model"):
+    """Lève DeadlineExceeded si l'échéance de la requête est passée."""
+    left = remaining_ms()
+    if left is not None and left <= 0:
+        _exceeded(stage)
+        raise DeadlineExceeded(f"échéance dépassée ({stage})")
+
+
+# ----------------------------------------------------------------------------
+# Engine : statement_timeout = budget restant
+# ----------------------------------------------------------------------------
+def _on_begin(conn):
+    left = remaining_ms()
+    if left is None:
+        return
+    if left < MIN_STATEMENT_MS:
+        _exceeded("db")
+        raise DeadlineExceeded("échéance dépassée avant la requête SQL")
+    # curseur DBAPI direct : exécuter via `conn` relancerait l'autobegin
+    cur = conn.connection.driver_connection.cursor()
+    try:
+        cur.execute(f"SET LOCAL statement_timeout = {int(math.ceil(left))}")
+    finally:
+        cur.close()
+
+
+def _on_error(ctx):
+    orig = ctx.original_exception
+    if getattr(orig, "pgcode", None) == _PG_QUERY_CANCELED and remaining_ms() is not None:
+        _exceeded("pg")
+
+
+def install(eng):
+    """Branche la propagation d'échéance sur l'engine (idempotent)."""
+    if getattr(eng, "_deadline_installed", False):
+        return eng
+    eng._deadline_installed = True
+    event.listen(eng, "begin", _on_begin)
+    event.listen(eng, "handle_error", _on_error)
+    return eng
+
+
+# ----------------------------------------------------------------------------
+# Hooks Flask
+# ----------------------------------------------------------------------------
+def _before_request():
+    budget = route_budget_ms(metrics.current_route())
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            asked = float(header)
+        except ValueError:
+            asked = None
+        if asked is not None and asked > 0:
+            budget = min(asked, DEADLINE_MAX_MS) if budget <= 0 else min(asked, budget, DEADLINE_MAX_MS)
+    if budget > 0:
+        g._deadline = time.monotonic() + budget / 1000.0
+        g._deadline_budget_ms = budget
+
+
+def _timeout_response():
+    resp = jsonify(message="Délai de la requête dépassé", stage=g.get("_deadline_exceeded"),
+                   budget_ms=g.get("_deadline_budget_ms"))
+    resp.status_code = 504
+    return resp
+
+
+def _after_request(resp):
+    if g.get("_deadline_exceeded") and resp.status_code != 504:
+        return _timeout_response()
+    return resp
+
+
+def _handle_exceeded(e):
+    if not g.get("_deadline_exceeded"):
+        g._deadline_exceeded = "request"
+    return _timeout_response()
+
+
+def init_app(app, engine=None):
+    """
+    À enregistrer avant admission.init_app : l'attente en file consomme le budget.
+    Les predict() instrumentés vérifient l'échéance via metrics.PREDICT_GUARDS.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.register_error_handler(DeadlineExceeded, _handle_exceeded)
+    if check not in metrics.PREDICT_GUARDS:
+        metrics.PREDICT_GUARDS.append(check)
+    if engine is not None:
+        install(engine)
@@ -0,0 +1,198 @@
+# server/export_api.py
+"""
+Exports en flux (CSV ou Parquet) des listes retard / anomalies / prédictions ETA.
+
+`/api/ml/delay/list?limit=100000` chargeait tout, scorait tout puis sérialisait
+tout en mémoire. Ici la requête de la liste est lue par un curseur serveur
+(`extract.iter_query`), chaque chunk est scoré puis écrit dans la réponse :
+mémoire constante quel que soit le volume.
+
+  GET /api/export/<dataset>?format=csv|parquet&from=...&to=...&cursor=...&limit=...
+      dataset : delay | anomalies | eta
+
+Mêmes filtres que les listes (cf. pagination.py), sans plafond de taille par
+défaut. Si le client se déconnecte, le serveur WSGI ferme le générateur : le
+curseur serveur est fermé et le scoring s'arrête au chunk courant.
+
+  POST /api/export/<dataset>?...  même export en traitement asynchrone (jobs.py) :
+      202 + /api/jobs/<id>, fichier récupéré via /api/jobs/<id>/result
+"""
+import io
+import os
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, jsonify, request
+from flask_jwt_extended import jwt_required
+
+import db
+import extract
+import jobs
+import ml_anomaly_api
+import ml_delay_api
+from jobs_api import accepted
+from pagination import parse_page
+
+bp_export = Blueprint("bp_export", __name__, url_prefix="/api/export")
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "20000"))
+jobs.register("export", "export_api:export_job", concurrency=2, memory_mb=2048, per_user=3)
+
+ETA_COLUMNS = [
+    "shipment_id", "ship_dt", "origin", "destination_zone", "carrier",
+    "service_level", "eta_pred_h",
+]
+
+
+def _eta_only(df):
+    return ml_delay_api.score_frame(df)[ETA_COLUMNS]
+
+
+# dataset -> (requête de la liste ou fonction eng -> requête, clés du curseur,
+#             fonction de scoring d'un chunk)
+DATASETS = {
+    "delay": (ml_delay_api.SQL_LIST, ml_delay_api.LIST_KEYS, ml_delay_api.score_frame),
+    "anomalies": (ml_anomaly_api.list_sql, ml_anomaly_api.LIST_KEYS, ml_anomaly_api.annotate),
+    "eta": (ml_delay_api.SQL_LIST, ml_delay_api.LIST_KEYS, _eta_only),
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _Sink(io.RawIOBase):
+    """Fichier en écriture seule dont on vide le contenu après chaque row group."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        out, self._parts = b"".join(self._parts), []
+        return out
+
+
+def _csv_stream(frames):
+    header = True
+    for df in frames:
+        yield df.to_csv(index=False, header=header, date_format="%Y-%m-%dT%H:%M:%S%z").encode()
+        header = False
+
+
+def _parquet_stream(frames):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink, writer, schema = _Sink(), None, None
+    try:
+        for df in frames:
+            if writer is None:
+                # colonnes entièrement nulles dans le 1er chunk : typées texte
+                schema = pa.Schema.from_pandas(df, preserve_index=False)
+                schema = pa.schema([
+                    pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                    for f in schema
+                ])
+                writer = pq.ParquetWriter(sink, schema, compression="zstd")
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            yield sink.drain()
+        if writer is not None:
+            writer.close()
+            writer = None
+            yield sink.drain()
+    finally:
+        if writer is not None:  # export interrompu
+            writer.close()
+
+
+def _scored(eng, sql, params, score):
+    if callable(sql):
+        sql = sql(eng)
+    frames = extract.iter_query(eng, sql, params, batch_rows=EXPORT_CHUNK_ROWS)
+    try:
+        for chunk in frames:
+            if not chunk.empty:
+                yield score(chunk)
+    finally:
+        frames.close()  # curseur serveur fermé même en cas de déconnexion
+
+
+def _request_params(dataset):
+    """(format, paramètres SQL) lus dans la query string ; PageError / ValueError si invalides."""
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in CONTENT_TYPES:
+        raise ValueError("format attendu : csv ou parquet")
+    page = parse_page(DATASETS[dataset][1], default_limit=None, max_limit=None)
+    params = page.params()
+    params["lim"] = page.limit  # pas de ligne sentinelle : on exporte exactement `limit`
+    return fmt, params
+
+
+def export_job(ctx):
+    """Traitement "export" : même flux que GET, écrit dans le fichier résultat du job."""
+    dataset, fmt, params = ctx.params["dataset"], ctx.params["format"], ctx.params["sql"]
+    sql, _, score = DATASETS[dataset]
+    total = params.get("lim")
+    rows = 0
+
+    def tracked(frames):
+        nonlocal rows
+        for df in frames:
+            yield df
+            rows += len(df)
+            ctx.progress(rows, total, message=f"{rows} lignes", partial={"rows": rows})
+
+    frames = _scored(ctx.eng, sql, params, score)
+    body = _csv_stream(tracked(frames)) if fmt == "csv" else _parquet_stream(tracked(frames))
+    try:
+        with open(ctx.path(fmt, CONTENT_TYPES[fmt]), "wb") as out:
+            for part in body:
+                out.write(part)
+                out.flush()
+    finally:
+        body.close()
+        frames.close()
+    return {"dataset": dataset, "format": fmt, "rows": rows}
+
+
+@bp_export.post("/<dataset>")
+@jwt_required()
+def export_async(dataset):
+    if dataset not in DATASETS:
+        return jsonify(message=f"dataset inconnu (attendu : {', '.join(DATASETS)})"), 404
+    try:
+        fmt, params = _request_params(dataset)
+    except ValueError as e:  # PageError compris
+        return jsonify(message=str(e)), 400
+    return accepted("export", {"dataset": dataset, "format": fmt, "sql": params})
+
+
+@bp_export.get("/<dataset>")
+@jwt_required()
+def export(dataset):
+    if dataset not in DATASETS:
+        return jsonify(message=f"dataset inconnu (attendu : {', '.join(DATASETS)})"), 404
+    try:
+        fmt, params = _request_params(dataset)
+    except ValueError as e:  # PageError compris
+        return jsonify(message=str(e)), 400
+
+    sql, _, score = DATASETS[dataset]
+    eng = db.get_engine("batch")
+    frames = _scored(eng, sql, params, score)
+    body = _csv_stream(frames) if fmt == "csv" else _parquet_stream(frames)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    resp = Response(body, content_type=CONTENT_TYPES[fmt], direct_passthrough=True)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{dataset}_{stamp}.{fmt}"'
+    resp.headers["X-Accel-Buffering"] = "no"  # pas de bufferisation côté proxy
+    resp.call_on_close(frames.close)
+    return resp
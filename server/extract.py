@@ -0,0 +1,269 @@
+# server/extract.py
+"""
+Extraction en masse des vues de features via `COPY (SELECT ...) TO STDOUT`.
+
+`pd.read_sql` sur fv_train_eta / fv_train_delay / fv_train_carrier_choice charge
+tout en mémoire via le fetch ligne à ligne de psycopg2 (pic = plusieurs fois la
+taille des données). Ici le flux CSV de COPY passe par un pipe et est découpé en
+DataFrames typés de `batch_rows` lignes : mémoire constante (le pipe fait
+contre-pression sur Postgres), catégorielles dictionnaire-encodées, rapport
+lignes/seconde.
+
+Consommateurs :
+  - entraînement : `read_frame(...)` (concatène les batches en fusionnant les catégories)
+  - scoring batch / export : `iter_batches(...)` chunk par chunk, ou `iter_query(...)`
+    (curseur serveur) pour les requêtes de liste avec jointures
+  - fichiers : `to_parquet(...)` ou `python extract.py fv_train_eta out.parquet`
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import lazy
+
+pd = lazy.module("pandas")  # chargé à la première extraction (voir lazy.py)
+
+# OIDs Postgres -> dtype pandas
+_INT_OIDS = {20, 21, 23}
+_FLOAT_OIDS = {700, 701, 1700}
+_BOOL_OIDS = {16}
+_TIME_OIDS = {1082, 1114, 1184}
+_TEXT_OIDS = {25, 1042, 1043}
+
+DEFAULT_BATCH_ROWS = 50_000
+
+
+class Progress:
+    """Rapport périodique (lignes, débit) ; `report` peut être remplacé."""
+
+    def __init__(self, label: str, every_s: float = 5.0, stream=sys.stderr):
+        self.label = label
+        self.every_s = every_s
+        self.stream = stream
+        self.rows = 0
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.t0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def update(self, n: int):
+        self.rows += n
+        now = time.perf_counter()
+        if now - self._last >= self.every_s:
+            self._last = now
+            self.report()
+
+    def report(self, final: bool = False):
+        if self.stream is None:
+            return
+        tag = "terminé" if final else "en cours"
+        print(f"[extract] {self.label} {tag}: {self.rows} lignes en {self.elapsed:.1f}s "
+              f"({self.rows_per_s:,.0f} lignes/s)", file=self.stream)
+
+
+def _select_sql(view: str, columns=None, where: str = None, order_by: str = None) -> str:
+    cols = ", ".join(columns) if columns else "*"
+    sql = f"SELECT {cols} FROM {view}"
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    return sql
+
+
+def _column_types(cur, select_sql: str) -> list:
+    """(nom, oid) des colonnes via un `LIMIT 0` (aucune ligne transférée)."""
+    cur.execute(f"SELECT * FROM ({select_sql}) _q LIMIT 0")
+    return [(d.name, d.type_code) for d in cur.description]
+
+
+def _read_csv_kwargs(types: list, categorical) -> tuple:
+    dtype, dates = {}, []
+    for name, oid in types:
+        if oid in _INT_OIDS:
+            dtype[name] = "Int64"
+        elif oid in _FLOAT_OIDS:
+            dtype[name] = "float64"
+        elif oid in _BOOL_OIDS:
+            dtype[name] = "boolean"
+        elif oid in _TIME_OIDS:
+            dates.append(name)
+            dtype[name] = "string"
+        elif oid in _TEXT_OIDS and name in categorical:
+            dtype[name] = "category"
+        else:
+            dtype[name] = "object"
+    return {"dtype": dtype, "true_values": ["t"], "false_values": ["f"]}, dates
+
+
+def iter_batches(eng, view: str, columns=None, where: str = None, params: dict = None,
+                 order_by: str = None, batch_rows: int = DEFAULT_BATCH_ROWS,
+                 categorical=(), progress: Progress = None):
+    """
+    Générateur de DataFrames typés de `batch_rows` lignes au plus.
+    `where` accepte des paramètres nommés psycopg2 (`%(x)s`) liés via `params`.
+    Fermer le générateur (break / close) annule le COPY côté serveur.
+    """
+    categorical = set(categorical or ())
+    raw = eng.raw_connection()
+    progress = progress if progress is not None else Progress(view)
+    r_fd, w_fd = os.pipe()
+    reader = os.fdopen(r_fd, "rb")
+    writer = os.fdopen(w_fd, "wb")
+    error = []
+    t = None
+    try:
+        cur = raw.cursor()
+        select_sql = cur.mogrify(_select_sql(view, columns, where, order_by), params or {}).decode()
+        types = _column_types(cur, select_sql)
+        csv_kwargs, dates = _read_csv_kwargs(types, categorical)
+
+        def _copy():
+            try:
+                cur.copy_expert(f"COPY ({select_sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+            except Exception as e:  # BrokenPipe si le consommateur a arrêté
+                error.append(e)
+            finally:
+                try:
+                    writer.close()
+                except OSError:
+                    pass
+
+        t = threading.Thread(target=_copy, name=f"copy-{view}", daemon=True)
+        t.start()
+
+        for chunk in pd.read_csv(reader, chunksize=batch_rows, **csv_kwargs):
+            for c in dates:
+                chunk[c] = pd.to_datetime(chunk[c], utc=True, format="ISO8601")
+            progress.update(len(chunk))
+            yield chunk
+
+        t.join()
+        if error:
+            raise error[0]
+        progress.report(final=True)
+    finally:
+        reader.close()
+        if t is None:  # échec avant le COPY (mogrify, types) : le thread ne fermera pas writer
+            writer.close()
+        if t is not None and t.is_alive():
+            # consommateur parti en cours de route : on coupe le COPY
+            raw.dbapi_connection.cancel()
+            t.join(timeout=5)
+            raw.invalidate()
+        else:
+            raw.close()
+
+
+def iter_query(eng, sql: str, params: dict = None, batch_rows: int = DEFAULT_BATCH_ROWS,
+               progress: Progress = None):
+    """
+    Générateur de DataFrames pour une requête SQLAlchemy quelconque (jointures,
+    paramètres `:nom`) via un curseur serveur (`stream_results`) : seules
+    `batch_rows` lignes sont en mémoire à la fois. Fermer le générateur ferme
+    le curseur. Pour une vue entière, `iter_batches` (COPY) reste plus rapide.
+    """
+    from db import stmt
+
+    progress = progress if progress is not None else Progress("query", stream=None)
+    with eng.connect() as c:
+        res = c.execution_options(stream_results=True, max_row_buffer=batch_rows) \
+               .execute(stmt(sql), params or {})
+        try:
+            cols = list(res.keys())
+            for rows in res.partitions(batch_rows):
+                # coerce_float : numeric (Decimal) -> float, comme read_sql
+                chunk = pd.DataFrame.from_records(rows, columns=cols, coerce_float=True)
+                progress.update(len(chunk))
+                yield chunk
+            progress.report(final=True)
+        finally:
+            res.close()
+
+
+def read_frame(eng, view: str, transform=None, **kwargs) -> pd.DataFrame:
+    """
+    Concatène les batches (catégories fusionnées) : entrée des entraînements.
+    `transform(batch) -> batch` est appliqué à chaque batch avant de le garder
+    (filtrage, réduction des types) : le pic mémoire suit le résultat réduit.
+    """
+    from pandas.api.types import union_categoricals
+
+    batches = iter_batches(eng, view, **kwargs)
+    parts = [transform(b) for b in batches] if transform is not None else list(batches)
+    if not parts:
+        return pd.DataFrame()
+    cats = [c for c in parts[0].columns if isinstance(parts[0][c].dtype, pd.CategoricalDtype)]
+    merged = {c: union_categoricals([p[c] for p in parts], ignore_order=True) for c in cats}
+    df = pd.concat([p.drop(columns=cats) for p in parts], ignore_index=True)
+    for c in cats:
+        df[c] = merged[c]
+    return df[parts[0].columns]
+
+
+def to_parquet(eng, path: str, view: str, **kwargs) -> int:
+    """Écrit la vue dans un fichier Parquet (un row group par batch). Renvoie le nb de lignes."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer, schema, n = None, None, 0
+    try:
+        for batch in iter_batches(eng, view, **kwargs):
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if writer is None:
+                # index de dictionnaire fixés en int32 : schéma identique d'un batch à l'autre
+                schema = pa.schema([
+                    pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type))
+                    if pa.types.is_dictionary(f.type) else f
+                    for f in table.schema
+                ])
+                writer = pq.ParquetWriter(path, schema, compression="zstd")
+            writer.write_table(table.cast(schema))
+            n += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n
+
+
+def meta_categoricals(meta: dict) -> list:
+    """Colonnes catégorielles d'un fichier *_feature_meta.json."""
+    return list(meta.get("categorical") or [])
+
+
+def main():
+    from sqlalchemy import create_engine
+    from db import DATABASE_URL
+
+    ap = argparse.ArgumentParser(description="Extraction COPY d'une vue vers Parquet/CSV.")
+    ap.add_argument("view")
+    ap.add_argument("out", help="fichier .parquet ou .csv")
+    ap.add_argument("--where", default=None)
+    ap.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS)
+    ap.add_argument("--categorical", default="origin,destination_zone,carrier,service_level")
+    args = ap.parse_args()
+
+    eng = create_engine(DATABASE_URL)
+    kwargs = dict(where=args.where, batch_rows=args.batch_rows,
+                  categorical=[c for c in args.categorical.split(",") if c])
+    if args.out.endswith(".parquet"):
+        to_parquet(eng, args.out, args.view, **kwargs)
+    else:
+        header = True
+        for batch in iter_batches(eng, args.view, **kwargs):
+            batch.to_csv(args.out, mode="w" if header else "a", header=header, index=False)
+            header = False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# server/health.py
+"""
+/api/health servi depuis un état maintenu par une sonde de fond.
+
+L'ancienne route ouvrait une connexion du pool et exécutait `select 1` à chaque
+appel : avec des sondes fréquentes (plusieurs orchestrateurs) et un Postgres
+qui hoquette, les sondes s'empilaient sur le pool oltp et faisaient échouer
+des workers sains. Ici un thread (`start`) exécute `select 1` toutes les
+HEALTH_INTERVAL_S sur sa propre connexion (hors pool, connect_timeout et
+statement_timeout = HEALTH_TIMEOUT_MS) et pré-encode la réponse ; la route ne
+fait que la renvoyer.
+
+  ok        dernière sonde réussie                                   200
+  starting  première sonde pas encore terminée                       200
+  degraded  échec(s) récent(s), moins de HEALTH_FAIL_AFTER d'affilée 200
+  error     HEALTH_FAIL_AFTER échecs d'affilée, ou sonde bloquée     500
+
+`?deep=1` (diagnostic : `Authorization: Bearer $METRICS_TOKEN` ou JWT
+superviseur, jamais ouvert) ajoute : pools de connexions, réplicas, état et
+version des modèles, dernier rafraîchissement des vues matérialisées (lu par la
+sonde sur sa connexion toutes les HEALTH_VIEWS_INTERVAL_S, jamais via le pool),
+p50 / p99 par route sur les HEALTH_LATENCY_WINDOW_S dernières secondes
+(différence entre l'histogramme courant et un instantané pris par la sonde).
+"""
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import Response, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+import matviews
+import metrics
+import model_store
+from admin_api import ADMIN_PROFILES
+from serialization import dumps, json_response
+
+HEALTH_INTERVAL_S = float(os.getenv("HEALTH_INTERVAL_S", "5"))
+HEALTH_TIMEOUT_MS = int(os.getenv("HEALTH_TIMEOUT_MS", "1000"))
+HEALTH_FAIL_AFTER = int(os.getenv("HEALTH_FAIL_AFTER", "3"))
+LATENCY_WINDOW_S = float(os.getenv("HEALTH_LATENCY_WINDOW_S", "300"))
+VIEWS_INTERVAL_S = float(os.getenv("HEALTH_VIEWS_INTERVAL_S", "60"))
+INSTANCE = f"{socket.gethostname()}:{os.getpid()}"
+# routes de sonde / scrape exclues des latences rapportées
+_PROBE_ROUTES = {"/api/health", "/api/ready", "/api/metrics"}
+
+PROBES = metrics.register(metrics.Counter(
+    "logiops_health_probe_total", "Sondes de santé de fond par résultat", ("outcome",)))
+
+_lock = threading.Lock()
+_state = {"status": "starting", "checked_at": None, "db": None, "consecutive_failures": 0}
+_body = dumps({"status": "starting", "instance": INSTANCE})
+_code = 200
+_last_probe = None           # time.monotonic() de la dernière sonde terminée
+_snapshots = deque()         # (monotonic, {route: comptes par seau}) pour les latences récentes
+_views_state = {"checked_at": None, "views": None, "error": None}
+_views_read = None           # time.monotonic() de la dernière lecture des vues
+_thread = None
+_started = time.time()
+
+
+# ----------------------------------------------------------------------------
+# Sonde
+# ----------------------------------------------------------------------------
+SQL_VIEWS = f"""
+    SELECT c.relname, r.refreshed_at, r.status
+    FROM pg_class c
+    LEFT JOIN {matviews.REFRESH_TABLE} r ON r.view_name = c.relname
+    WHERE c.relname = ANY(%(names)s) AND c.relkind = 'm'
+      AND pg_table_is_visible(c.oid)
+"""
+
+
+def _connect(eng):
+    """Connexion DBAPI dédiée, hors pool (une sonde ne doit jamais attendre un checkout)."""
+    cargs, cparams = eng.dialect.create_connect_args(eng.url)
+    cparams.update(connect_timeout=max(1, round(HEALTH_TIMEOUT_MS / 1000)),
+                   application_name="logiops-health")
+    conn = eng.dialect.connect(*cargs, **cparams)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"SET statement_timeout = {int(HEALTH_TIMEOUT_MS)}")
+    cur.close()
+    return conn
+
+
+def _by_route() -> dict:
+    """Histogramme des latences HTTP agrégé par route (toutes méthodes / statuts)."""
+    out = {}
+    for labels, (counts, _, _) in metrics.HTTP_LATENCY.snapshot().items():
+        route = labels[0]
+        if route in _PROBE_ROUTES:
+            continue
+        acc = out.get(route)
+        out[route] = counts if acc is None else [a + b for a, b in zip(acc, counts)]
+    return out
+
+
+def _read_views(conn):
+    """Instantané des vues matérialisées, lu sur la connexion de la sonde."""
+    global _views_read
+    try:
+        cur = conn.cursor()
+        cur.execute(SQL_VIEWS, {"names": list(matviews.FEATURE_VIEWS)})
+        views = {name: {"kind": "materialized", "refreshed_at": at, "status": status}
+                 for name, at, status in cur.fetchall()}
+        cur.close()
+        snap = {"views": views, "error": None}
+    except Exception as e:
+        snap = {"views": None, "error": str(e).strip()[:500]}
+    with _lock:
+        _views_state.update(checked_at=datetime.now(timezone.utc), **snap)
+    _views_read = time.monotonic()
+
+
+def _publish(db: dict):
+    global _body, _code, _last_probe
+    with _lock:
+        fails = 0 if db["ok"] else _state["consecutive_failures"] + 1
+        if db["ok"]:
+            status = "ok"
+        elif fails >= HEALTH_FAIL_AFTER:
+            status = "error"
+        else:
+            status = "degraded"
+        _state.update(status=status, checked_at=datetime.now(timezone.utc), db=db,
+                      consecutive_failures=fails)
+        _body = dumps({**_state, "instance": INSTANCE})
+        _code = 500 if status == "error" else 200
+        _last_probe = time.monotonic()
+
+
+def _run(eng):
+    conn = None
+    while True:
+        t0 = time.perf_counter()
+        try:
+            if conn is None:
+                conn = _connect(eng)
+            cur = conn.cursor()
+            cur.execute("select 1")
+            cur.fetchone()
+            cur.close()
+            db = {"ok": True, "latency_ms": round((time.perf_counter() - t0) * 1000.0, 3)}
+            PROBES.inc("ok")
+            if _views_read is None or time.monotonic() - _views_read >= VIEWS_INTERVAL_S:
+                _read_views(conn)
+        except Exception as e:
+            db = {"ok": False, "latency_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                  "error": str(e).strip()[:500]}
+            PROBES.inc("error")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+        try:
+            _publish(db)
+            now = time.monotonic()
+            _snapshots.append((now, _by_route()))
+            # on garde un instantané antérieur à la fenêtre comme base de calcul
+            while len(_snapshots) > 2 and _snapshots[1][0] <= now - LATENCY_WINDOW_S:
+                _snapshots.popleft()
+        except Exception as e:
+            print(f"[health] publication en échec : {e}", file=sys.stderr)
+        time.sleep(HEALTH_INTERVAL_S)
+
+
+def start(eng):
+    """Démarre la sonde (une par process)."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=_run, args=(eng,), name="health", daemon=True)
+        _thread.start()
+    return _thread
+
+
+# ----------------------------------------------------------------------------
+# Diagnostic (?deep=1)
+# ----------------------------------------------------------------------------
+def _quantile(buckets, counts, q: float):
+    total = sum(counts)
+    if not total:
+        return None
+    target, acc = q * total, 0
+    for i, n in enumerate(counts):
+        acc += n
+        if acc >= target:
+            return buckets[i] if i < len(buckets) else float("inf")
+    return float("inf")
+
+
+def recent_latencies() -> dict:
+    """{route: {"count", "p50_s", "p99_s"}} sur la fenêtre glissante (bornes hautes de seaux)."""
+    now = time.monotonic()
+    current = _by_route()
+    base_t, base = (_snapshots[0] if _snapshots else (_started, {}))
+    buckets = metrics.HTTP_LATENCY.buckets
+    out = {}
+    for route, counts in current.items():
+        prev = base.get(route)
+        delta = counts if prev is None else [a - b for a, b in zip(counts, prev)]
+        n = sum(delta)
+        if n:
+            out[route] = {"count": n, "p50_s": _quantile(buckets, delta, 0.50),
+                          "p99_s": _quantile(buckets, delta, 0.99)}
+    return {"window_s": round(now - base_t, 1) if _snapshots else None, "routes": out}
+
+
+def deep(router=None) -> dict:
+    with _lock:
+        base = dict(_state)
+        views = dict(_views_state)
+    models = model_store.status()
+    return {
+        **base,
+        "instance": INSTANCE,
+        "uptime_s": round(time.time() - _started, 1),
+        "pools": {n: {"size": s, "checked_out": c, "overflow": o}
+                  for n, (s, c, o) in metrics.pool_stats().items()},
+        "replicas": router.status() if router is not None else None,
+        "models": {"ready": models["ready"], "mode": models["mode"], "models": models["models"]},
+        "views": views,
+        "latency": recent_latencies(),
+    }
+
+
+# ----------------------------------------------------------------------------
+# Flask
+# ----------------------------------------------------------------------------
+def _deep_allowed() -> bool:
+    """Jeton METRICS_TOKEN (s'il est défini) ou JWT d'un profil superviseur."""
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization") == f"Bearer {metrics.METRICS_TOKEN}":
+        return True
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt().get("type_profil") in ADMIN_PROFILES
+    except Exception:  # jeton absent, expiré ou invalide
+        return False
+
+
+def init_app(app, router=None):
+    """Enregistre GET /api/health (état en cache ; `?deep=1` pour le diagnostic complet)."""
+
+    def health():
+        if request.args.get("deep") in ("1", "true"):
+            if not _deep_allowed():
+                return Response(b'{"message":"forbidden"}', status=403, mimetype="application/json")
+            return json_response(deep(router))
+        with _lock:
+            body, code, last = _body, _code, _last_probe
+        # sonde bloquée (thread mort, connexion suspendue) : l'état en cache n'est plus fiable
+        if last is not None and time.monotonic() - last > 3 * HEALTH_INTERVAL_S + HEALTH_TIMEOUT_MS / 1000.0:
+            return Response(dumps({"status": "error", "error": "sonde de santé bloquée",
+                                   "instance": INSTANCE}), status=500, mimetype="application/json")
+        return Response(body, status=code, mimetype="application/json")
+
+    app.add_url_rule("/api/health", "health", health, methods=["GET"])
@@ -0,0 +1,200 @@
+# server/invalidation.py
+"""
+Bus d'invalidation piloté par LISTEN / NOTIFY Postgres.
+
+Les triggers de la migration v0011 envoient sur `logiops_changes` un JSON
+{"table", "op", "keys"} à chaque instruction modifiant shipments,
+shipment_events ou carrier_profiles (keys = null : toute la table).
+
+Chaque worker ouvre une connexion dédiée (hors pool, autocommit) et l'écoute
+dans un thread. Les notifications sont coalescées par table : clés réunies,
+« toute la table » l'emporte, puis livrées après DEBOUNCE_MS sans nouvel
+évènement (au plus MAX_DELAY_MS après le premier) ; une rafale de COPY produit
+donc un seul appel par cache abonné.
+
+Après une reconnexion, des notifications ont pu être perdues : un évènement
+de resynchronisation (keys=None, op="resync") est livré pour toutes les tables.
+
+    invalidation.subscribe(["carrier_profiles"], lambda ev: cache.clear())
+    invalidation.start(engine)
+
+Configuration : INVALIDATION_ENABLED (1), INVALIDATION_DEBOUNCE_MS (200),
+INVALIDATION_MAX_DELAY_MS (2000).
+"""
+import json
+import os
+import select
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import metrics
+
+INVALIDATION_ENABLED = os.getenv("INVALIDATION_ENABLED", "1") == "1"
+DEBOUNCE_S = float(os.getenv("INVALIDATION_DEBOUNCE_MS", "200")) / 1000.0
+MAX_DELAY_S = float(os.getenv("INVALIDATION_MAX_DELAY_MS", "2000")) / 1000.0
+CHANNEL = "logiops_changes"
+TABLES = ("shipments", "shipment_events", "carrier_profiles")
+RECONNECT_MAX_S = 30.0
+
+EVENTS = metrics.register(metrics.Counter(
+    "logiops_invalidation_total", "Invalidations livrées aux caches abonnés", ("table", "scope")))
+NOTIFIES = metrics.register(metrics.Counter(
+    "logiops_invalidation_notify_total", "Notifications reçues (avant coalescence)", ("table",)))
+
+
+@dataclass(frozen=True)
+class Invalidation:
+    table: str
+    keys: frozenset = None    # None = toute la table
+    ops: frozenset = frozenset()
+
+    @property
+    def all(self) -> bool:
+        return self.keys is None
+
+
+_subscribers = []              # [(tables | None, fn)]
+_sub_lock = threading.Lock()
+_thread = None
+_listening = threading.Event()  # LISTEN actif sur la connexion courante
+
+
+def listening(timeout: float = None) -> bool:
+    """Attend (au plus `timeout` s) que l'écoute soit établie ; True si c'est le cas."""
+    return _listening.wait(timeout)
+
+
+def subscribe(tables, fn):
+    """`fn(Invalidation)` pour les tables données (None = toutes)."""
+    with _sub_lock:
+        _subscribers.append((frozenset(tables) if tables else None, fn))
+    return fn
+
+
+def dispatch(ev: Invalidation):
+    EVENTS.inc(ev.table, "all" if ev.all else "keys")
+    with _sub_lock:
+        subs = list(_subscribers)
+    for tables, fn in subs:
+        if tables is None or ev.table in tables:
+            try:
+                fn(ev)
+            except Exception as e:  # un cache défaillant ne bloque pas les autres
+                print(f"[invalidation] abonné {getattr(fn, '__name__', fn)} : {e}", file=sys.stderr)
+
+
+class _Pending:
+    """Coalescence des notifications par table entre deux livraisons."""
+
+    def __init__(self):
+        self.tables = {}       # table -> [keys set | None, ops set]
+        self.first = None
+        self.last = None
+
+    def add(self, table: str, op: str, keys):
+        now = time.monotonic()
+        self.first = self.first or now
+        self.last = now
+        cur = self.tables.setdefault(table, [set(), set()])
+        cur[1].add(op)
+        if keys is None or cur[0] is None:
+            cur[0] = None
+        else:
+            cur[0].update(keys)
+
+    def due(self) -> bool:
+        if self.first is None:
+            return False
+        now = time.monotonic()
+        return now - self.last >= DEBOUNCE_S or now - self.first >= MAX_DELAY_S
+
+    def timeout(self) -> float:
+        if self.first is None:
+            return 1.0
+        now = time.monotonic()
+        return max(0.0, min(self.last + DEBOUNCE_S, self.first + MAX_DELAY_S) - now)
+
+    def drain(self) -> list:
+        out = [Invalidation(t, None if k is None else frozenset(k), frozenset(ops))
+               for t, (k, ops) in self.tables.items()]
+        self.tables.clear()
+        self.first = self.last = None
+        return out
+
+
+def _parse(payload: str):
+    try:
+        d = json.loads(payload)
+        return d["table"], d.get("op") or "?", d.get("keys")
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _listen(eng):
+    """Connexion DBAPI dédiée, ouverte hors pool (comme health._connect), en écoute."""
+    cargs, cparams = eng.dialect.create_connect_args(eng.url)
+    cparams.update(application_name="logiops-invalidation")
+    conn = eng.dialect.connect(*cargs, **cparams)
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {CHANNEL}")
+        cur.close()
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+def _run(eng):
+    pending = _Pending()
+    backoff = 1.0
+    first = True
+    while True:
+        conn = None
+        try:
+            conn = _listen(eng)
+            _listening.set()
+            backoff = 1.0
+            if not first:
+                for t in TABLES:
+                    pending.add(t, "resync", None)
+            first = False
+            while True:
+                if select.select([conn], [], [], pending.timeout()) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        n = conn.notifies.pop(0)
+                        parsed = _parse(n.payload)
+                        if parsed is not None:
+                            NOTIFIES.inc(parsed[0])
+                            pending.add(*parsed)
+                if pending.due():
+                    for ev in pending.drain():
+                        dispatch(ev)
+        except Exception as e:
+            _listening.clear()
+            print(f"[invalidation] écoute interrompue ({e}), reconnexion dans {backoff:.0f}s",
+                  file=sys.stderr)
+            for ev in pending.drain():
+                dispatch(ev)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX_S)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def start(eng):
+    """Démarre le thread d'écoute (une fois par process ; INVALIDATION_ENABLED=0 : rien)."""
+    global _thread
+    if not INVALIDATION_ENABLED or _thread is not None:
+        return None
+    _thread = threading.Thread(target=_run, args=(eng,), name="invalidation", daemon=True)
+    _thread.start()
+    return _thread
@@ -0,0 +1,437 @@
+# server/jobs.py
+"""
+Traitements asynchrones : prédiction ETA en masse, exports, simulations what-if.
+
+Ces opérations duraient plus longtemps que le timeout du proxy et occupaient un
+thread HTTP pendant tout le calcul. Ici la requête ne fait qu'enregistrer le
+traitement (`submit`) et répond 202 avec un identifiant ; l'état durable est
+dans Postgres (table `jobs`, migration v0013) :
+
+  queued -> running -> succeeded | failed | cancelled
+
+Exécution : chaque process Flask tourne un répartiteur (`start`) qui réclame
+les traitements en file (`FOR UPDATE SKIP LOCKED` : un seul preneur, même à
+plusieurs instances) dans la limite de concurrence de leur type, comptée sur
+tout le cluster (lignes `running` du type, sous verrou consultatif par type
+le temps de la réclamation), et les confie
+à un pool de processus par type (contexte forkserver : les enfants ne
+reprennent ni les threads ni les connexions du worker HTTP). Chaque enfant
+applique la limite mémoire du type (RLIMIT_AS) et est recyclé après
+JOBS_MAX_TASKS_PER_CHILD traitements.
+
+Côté traitement, `fn(ctx)` reçoit un JobContext :
+  ctx.params, ctx.eng        paramètres, engine dédié au process enfant
+  ctx.path("csv")            fichier résultat (JOBS_DIR), lisible pendant l'écriture
+  ctx.progress(done, total, message=..., partial={...})
+                             avancement + résumé partiel ; lève JobCancelled
+                             si une annulation a été demandée
+et renvoie un dict (résumé stocké en `result`).
+
+Types : `register("eta.predict", "ml_eta_api:bulk_predict_job", concurrency=2,
+memory_mb=4096, per_user=2)` ; la cible est importée dans l'enfant. Limites
+surchargeables par JOBS_<TYPE>_CONCURRENCY / _MEMORY_MB / _PER_USER
+(TYPE en majuscules, "." -> "_").
+
+Une instance qui disparaît cesse de rafraîchir `heartbeat_at` : ses traitements
+sont marqués en échec après JOBS_STALE_S. Résultats et lignes sont purgés après
+JOBS_RETENTION_HOURS (`cleanup`, tâche du planificateur).
+
+Configuration : JOBS_ENABLED (1), JOBS_DIR, JOBS_POLL_S (1), JOBS_STALE_S (120),
+JOBS_PROGRESS_INTERVAL_S (1), JOBS_MAX_TASKS_PER_CHILD (20),
+JOBS_RETENTION_HOURS (24).
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import text
+
+import metrics
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "1") == "1"
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "logiops_jobs"))
+POLL_S = float(os.getenv("JOBS_POLL_S", "1"))
+STALE_S = float(os.getenv("JOBS_STALE_S", "120"))
+PROGRESS_INTERVAL_S = float(os.getenv("JOBS_PROGRESS_INTERVAL_S", "1"))
+MAX_TASKS_PER_CHILD = int(os.getenv("JOBS_MAX_TASKS_PER_CHILD", "20"))
+RETENTION_HOURS = float(os.getenv("JOBS_RETENTION_HOURS", "24"))
+INSTANCE = f"{socket.gethostname()}:{os.getpid()}"
+_LOCK_CLASS = 360_0011   # pg_advisory_xact_lock(classe, hashtext(owner)) : quota par utilisateur
+_CLAIM_LOCK_CLASS = 360_0012   # pg_advisory_xact_lock(classe, hashtext(type)) : concurrence par type
+
+# colonnes d'état (GET / liste / insert) : `params` (corps de requête, plusieurs Mo pour
+# eta.predict) n'est lu qu'à la réclamation (SQL_CLAIM)
+COLUMNS = """job_id, type, owner, status, progress, message, partial, result,
+             result_path, result_type, error, cancel_requested, instance,
+             created_at, started_at, finished_at"""
+
+SQL_INSERT = f"""
+    INSERT INTO jobs (job_id, type, owner, params)
+    VALUES (:job_id, :type, :owner, CAST(:params AS jsonb))
+    RETURNING {COLUMNS}
+"""
+SQL_ACTIVE_FOR_OWNER = """
+    SELECT count(*) FROM jobs
+    WHERE owner = :owner AND type = :type AND status IN ('queued', 'running')
+"""
+SQL_GET = f"SELECT {COLUMNS} FROM jobs WHERE job_id = :job_id"
+SQL_LIST = f"""
+    SELECT {COLUMNS} FROM jobs
+    WHERE owner IS NOT DISTINCT FROM :owner
+      AND (CAST(:status AS text) IS NULL OR status = :status)
+    ORDER BY created_at DESC
+    LIMIT :lim
+"""
+SQL_RUNNING_FOR_TYPE = "SELECT count(*) FROM jobs WHERE type = :type AND status = 'running'"
+SQL_CLAIM = """
+    UPDATE jobs SET status = 'running', instance = :instance,
+                    started_at = now(), heartbeat_at = now()
+    WHERE job_id IN (
+      SELECT job_id FROM jobs
+      WHERE status = 'queued' AND type = :type
+      ORDER BY created_at
+      LIMIT :n
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING job_id, params
+"""
+SQL_HEARTBEAT = """
+    UPDATE jobs SET heartbeat_at = now()
+    WHERE job_id = ANY(CAST(:ids AS uuid[])) AND status = 'running'
+"""
+SQL_REAP = """
+    UPDATE jobs SET status = 'failed', finished_at = now(),
+                    error = 'instance ' || coalesce(instance, '?') || ' perdue en cours de traitement'
+    WHERE status = 'running' AND heartbeat_at < now() - make_interval(secs => :stale)
+"""
+SQL_PROGRESS = """
+    UPDATE jobs SET progress = :progress, message = :message,
+                    partial = coalesce(CAST(:partial AS jsonb), partial)
+    WHERE job_id = :job_id
+    RETURNING cancel_requested
+"""
+SQL_RESULT_FILE = "UPDATE jobs SET result_path = :path, result_type = :type WHERE job_id = :job_id"
+SQL_FINISH = """
+    UPDATE jobs SET status = :status, finished_at = now(), error = :error,
+                    result = CAST(:result AS jsonb),
+                    progress = CASE WHEN :status = 'succeeded' THEN 1 ELSE progress END
+    WHERE job_id = :job_id AND status = 'running'
+"""
+SQL_CANCEL = """
+    UPDATE jobs SET cancel_requested = true,
+                    status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                    finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END
+    WHERE job_id = :job_id AND status IN ('queued', 'running')
+    RETURNING status
+"""
+SQL_EXPIRED = """
+    DELETE FROM jobs
+    WHERE status NOT IN ('queued', 'running')
+      AND finished_at < now() - make_interval(secs => :secs)
+    RETURNING result_path
+"""
+
+RUNS = metrics.register(metrics.Counter(
+    "logiops_jobs_total", "Traitements asynchrones terminés (par cette instance)", ("type", "status")))
+RUN_DURATION = metrics.register(metrics.Histogram(
+    "logiops_job_duration_seconds", "Durée des traitements asynchrones", ("type",),
+    (1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)))
+
+
+class UnknownJobType(KeyError):
+    """Aucun type de traitement de ce nom n'est enregistré."""
+
+
+class QuotaExceeded(Exception):
+    """L'utilisateur a déjà trop de traitements actifs de ce type (-> 429)."""
+
+
+class JobCancelled(Exception):
+    """Levée par `JobContext.progress` quand une annulation a été demandée."""
+
+
+class JobType:
+    def __init__(self, name: str, target: str, concurrency: int = 1, memory_mb: int = 0,
+                 per_user: int = 2):
+        env = name.upper().replace(".", "_")
+        self.name = name
+        self.target = target              # "module:fonction", importée dans l'enfant
+        self.concurrency = max(1, int(os.getenv(f"JOBS_{env}_CONCURRENCY", concurrency)))
+        self.memory_mb = int(os.getenv(f"JOBS_{env}_MEMORY_MB", memory_mb))      # 0 = sans limite
+        self.per_user = int(os.getenv(f"JOBS_{env}_PER_USER", per_user))         # 0 = sans limite
+
+
+_types = {}
+_pools = {}          # type -> ProcessPoolExecutor
+_running = {}        # job_id -> type (traitements de cette instance)
+_lock = threading.Lock()
+_wake = threading.Event()
+_thread = None
+
+
+def register(name: str, target: str, **limits) -> JobType:
+    jt = JobType(name, target, **limits)
+    _types[name] = jt
+    return jt
+
+
+def types() -> dict:
+    return dict(_types)
+
+
+def _type(name: str) -> JobType:
+    jt = _types.get(name)
+    if jt is None:
+        raise UnknownJobType(name)
+    return jt
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, default=str)
+
+
+# ----------------------------------------------------------------------------
+# Côté process enfant
+# ----------------------------------------------------------------------------
+_child_eng = None
+_child_memory_mb = 0
+
+
+def _child_init(memory_mb: int):
+    global _child_memory_mb
+    _child_memory_mb = memory_mb
+    if memory_mb > 0:
+        import resource
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 2**20, hard))
+
+
+def _engine():
+    global _child_eng
+    if _child_eng is None:
+        import db
+        _child_eng = db.make_engine("jobs")
+    return _child_eng
+
+
+class JobContext:
+    """Vue d'un traitement depuis le process enfant."""
+
+    def __init__(self, eng, job_id: str, params: dict):
+        self.eng = eng
+        self.job_id = job_id
+        self.params = params
+        self.result_path = None
+        self._last = 0.0
+
+    def path(self, ext: str, content_type: str = "application/octet-stream") -> str:
+        """Fichier résultat du traitement ; enregistré tout de suite (lecture partielle possible)."""
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        self.result_path = os.path.join(JOBS_DIR, f"{self.job_id}.{ext}")
+        with self.eng.begin() as c:
+            c.execute(text(SQL_RESULT_FILE), {"job_id": self.job_id, "path": self.result_path,
+                                              "type": content_type})
+        return self.result_path
+
+    def progress(self, done: float, total: float = None, message: str = None,
+                 partial: dict = None, force: bool = False):
+        """Avancement (au plus une écriture par JOBS_PROGRESS_INTERVAL_S) ; JobCancelled si annulé."""
+        now = time.monotonic()
+        if not force and now - self._last < PROGRESS_INTERVAL_S:
+            return
+        self._last = now
+        frac = min(1.0, done / total) if total else 0.0
+        with self.eng.begin() as c:
+            cancel = c.execute(text(SQL_PROGRESS), {
+                "job_id": self.job_id, "progress": frac, "message": message,
+                "partial": None if partial is None else _dumps(partial),
+            }).scalar()
+        if cancel:
+            raise JobCancelled(self.job_id)
+
+
+def _resolve(target: str):
+    mod, _, fn = target.partition(":")
+    return getattr(importlib.import_module(mod), fn)
+
+
+def _child_run(job_id: str, target: str, params: dict) -> str:
+    """Point d'entrée dans l'enfant : exécute, écrit l'état final, renvoie le statut."""
+    eng = _engine()
+    ctx = JobContext(eng, job_id, params)
+    result, error, status = None, None, "succeeded"
+    try:
+        result = _resolve(target)(ctx)
+    except JobCancelled:
+        status = "cancelled"
+    except MemoryError:
+        status, error = "failed", f"limite mémoire du type atteinte ({_child_memory_mb} Mo)"
+    except Exception as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"[:4000]
+    with eng.begin() as c:
+        c.execute(text(SQL_FINISH), {"job_id": job_id, "status": status, "error": error,
+                                     "result": _dumps(result)})
+    return status
+
+
+# ----------------------------------------------------------------------------
+# Côté worker HTTP : file, répartiteur
+# ----------------------------------------------------------------------------
+def submit(eng, type_name: str, params: dict, owner: str = None) -> dict:
+    """Enregistre un traitement (status queued) ; QuotaExceeded au-delà de `per_user`."""
+    jt = _type(type_name)
+    with eng.begin() as c:
+        if owner is not None and jt.per_user > 0:
+            # sérialise les soumissions d'un même utilisateur le temps du comptage
+            c.execute(text("SELECT pg_advisory_xact_lock(:c, hashtext(:owner))"),
+                      {"c": _LOCK_CLASS, "owner": owner})
+            n = c.execute(text(SQL_ACTIVE_FOR_OWNER), {"owner": owner, "type": jt.name}).scalar()
+            if n >= jt.per_user:
+                raise QuotaExceeded(f"{n} traitement(s) {jt.name} déjà actif(s) (limite {jt.per_user})")
+        row = c.execute(text(SQL_INSERT), {"job_id": str(uuid.uuid4()), "type": jt.name,
+                                           "owner": owner, "params": _dumps(params)}).mappings().one()
+    _wake.set()
+    return dict(row)
+
+
+def get(eng, job_id: str):
+    with eng.connect() as c:
+        row = c.execute(text(SQL_GET), {"job_id": job_id}).mappings().first()
+    return dict(row) if row is not None else None
+
+
+def list_jobs(eng, owner: str, status: str = None, limit: int = 50) -> list:
+    with eng.connect() as c:
+        return [dict(r) for r in c.execute(text(SQL_LIST), {"owner": owner, "status": status,
+                                                            "lim": limit}).mappings()]
+
+
+def cancel(eng, job_id: str):
+    """Annule (file) ou demande l'arrêt (en cours) ; statut résultant, None si déjà terminé."""
+    with eng.begin() as c:
+        return c.execute(text(SQL_CANCEL), {"job_id": job_id}).scalar()
+
+
+def _pool(jt: JobType) -> ProcessPoolExecutor:
+    pool = _pools.get(jt.name)
+    if pool is None:
+        pool = _pools[jt.name] = ProcessPoolExecutor(
+            max_workers=jt.concurrency,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=_child_init, initargs=(jt.memory_mb,),
+            max_tasks_per_child=MAX_TASKS_PER_CHILD,
+        )
+    return pool
+
+
+def _done(eng, jt: JobType, job_id: str, t0: float, fut):
+    try:
+        status = fut.result()
+    except Exception as e:  # enfant tué (OOM killer, signal) : le pool est inutilisable
+        status = "failed"
+        print(f"[jobs] {jt.name} {job_id} : process enfant perdu ({e})", file=sys.stderr)
+        with _lock:
+            pool = _pools.pop(jt.name, None)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=False)
+        try:
+            with eng.begin() as c:
+                c.execute(text(SQL_FINISH), {"job_id": job_id, "status": status, "result": "null",
+                                             "error": f"process de traitement interrompu : {e}"[:4000]})
+        except Exception as db_err:
+            print(f"[jobs] {job_id} : état final non écrit ({db_err})", file=sys.stderr)
+    RUNS.inc(jt.name, status)
+    RUN_DURATION.observe(time.perf_counter() - t0, jt.name)
+    with _lock:
+        _running.pop(job_id, None)
+    _wake.set()
+
+
+def _claim(eng):
+    for jt in list(_types.values()):
+        with _lock:
+            free = jt.concurrency - sum(1 for t in _running.values() if t == jt.name)
+        if free <= 0:
+            continue
+        with eng.begin() as c:
+            # limite de concurrence du type pour tout le cluster : comptage et réclamation
+            # sérialisés entre répartiteurs (workers, instances)
+            c.execute(text("SELECT pg_advisory_xact_lock(:c, hashtext(:type))"),
+                      {"c": _CLAIM_LOCK_CLASS, "type": jt.name})
+            busy = c.execute(text(SQL_RUNNING_FOR_TYPE), {"type": jt.name}).scalar()
+            n = min(free, jt.concurrency - busy)
+            if n <= 0:
+                continue
+            rows = c.execute(text(SQL_CLAIM), {"type": jt.name, "n": n,
+                                               "instance": INSTANCE}).all()
+        for job_id, params in rows:
+            job_id = str(job_id)
+            with _lock:
+                _running[job_id] = jt.name
+                pool = _pool(jt)
+            t0 = time.perf_counter()
+            fut = pool.submit(_child_run, job_id, jt.target, params)
+            fut.add_done_callback(lambda f, jt=jt, job_id=job_id, t0=t0: _done(eng, jt, job_id, t0, f))
+
+
+def _loop(eng):
+    while True:
+        try:
+            with _lock:
+                ids = list(_running)
+            with eng.begin() as c:
+                if ids:
+                    c.execute(text(SQL_HEARTBEAT), {"ids": ids})
+                c.execute(text(SQL_REAP), {"stale": STALE_S})
+            _claim(eng)
+        except Exception as e:
+            print(f"[jobs] répartiteur : {e}", file=sys.stderr)
+        _wake.wait(POLL_S)
+        _wake.clear()
+
+
+def start(eng):
+    """Démarre le répartiteur (un par process) ; no-op si aucun type ou JOBS_ENABLED=0."""
+    global _thread
+    if not JOBS_ENABLED or not _types or _thread is not None:
+        return None
+    _thread = threading.Thread(target=_loop, args=(eng,), name="jobs", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def running() -> dict:
+    """{type: traitements en cours sur cette instance}."""
+    with _lock:
+        out = {name: 0 for name in _types}
+        for t in _running.values():
+            out[t] = out.get(t, 0) + 1
+    return out
+
+
+metrics.register(metrics.Gauge(
+    "logiops_jobs_running", "Traitements en cours sur cette instance par type",
+    lambda: {(t,): n for t, n in running().items()}, ("type",)))
+
+
+def cleanup(eng) -> dict:
+    """Supprime les traitements terminés depuis plus de JOBS_RETENTION_HOURS et leurs fichiers."""
+    with eng.begin() as c:
+        paths = [r[0] for r in c.execute(text(SQL_EXPIRED), {"secs": RETENTION_HOURS * 3600.0})]
+    removed = 0
+    for p in paths:
+        if p and os.path.exists(p):
+            try:
+                os.remove(p)
+                removed += 1
+            except OSError:
+                pass
+    return {"jobs": len(paths), "files": removed}
@@ -0,0 +1,155 @@
+# server/jobs_api.py
+"""
+Suivi des traitements asynchrones (voir jobs.py).
+
+  GET  /api/jobs                  mes traitements (?status=running, ?limit=50)
+  GET  /api/jobs/<id>             état, avancement, résumé partiel, erreur
+  POST /api/jobs/<id>/cancel      annulation (immédiate en file, au prochain point d'avancement sinon)
+  GET  /api/jobs/<id>/result      fichier résultat (ou résumé JSON) une fois terminé ;
+                                  ?partial=1 : lignes CSV déjà écrites, pendant le calcul
+
+Les traitements sont créés par les endpoints métier, qui répondent 202 avec
+`Location: /api/jobs/<id>` :
+  POST /api/ml/eta/predict        avec `Prefer: respond-async` ou au-delà de ETA_SYNC_MAX_ITEMS lignes
+  POST /api/export/<dataset>      mêmes paramètres que GET /api/export/<dataset>
+  POST /api/ml/reco-simple/sweep  simulation what-if sur une grille de paramètres
+
+Un traitement n'est visible que de son auteur (et des superviseurs).
+"""
+import os
+import uuid
+
+from flask import Blueprint, Response, jsonify, request, send_file
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+
+import db
+import jobs
+from admin_api import ADMIN_PROFILES
+from serialization import json_response
+
+bp_jobs = Blueprint("bp_jobs", __name__, url_prefix="/api/jobs")
+
+EXTENSIONS = {
+    "text/csv; charset=utf-8": "csv",
+    "application/vnd.apache.parquet": "parquet",
+}
+_TAIL_BYTES = 1 << 16
+
+
+def wants_async() -> bool:
+    """En-tête `Prefer: respond-async` (RFC 7240)."""
+    return "respond-async" in (request.headers.get("Prefer") or "").lower()
+
+
+def accepted(type_name: str, params: dict):
+    """Enregistre le traitement pour l'utilisateur courant -> 202 + Location (429 si quota atteint)."""
+    if not jobs.JOBS_ENABLED:
+        return jsonify(message="traitements asynchrones désactivés (JOBS_ENABLED=0)"), 503
+    try:
+        job = jobs.submit(db.get_engine("batch"), type_name, params, owner=str(get_jwt_identity()))
+    except jobs.QuotaExceeded as e:
+        return jsonify(message=str(e)), 429
+    resp = json_response(_public(job), status=202)
+    resp.headers["Location"] = f"/api/jobs/{job['job_id']}"
+    return resp
+
+
+def _public(job: dict) -> dict:
+    out = {k: v for k, v in job.items() if k not in ("result_path", "owner")}
+    out["links"] = {
+        "self": f"/api/jobs/{job['job_id']}",
+        "result": f"/api/jobs/{job['job_id']}/result",
+        "cancel": f"/api/jobs/{job['job_id']}/cancel",
+    }
+    return out
+
+
+def _load(job_id: str):
+    """(job, None) ou (None, réponse d'erreur) ; 404 aussi pour le traitement d'un autre."""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None, (jsonify(message="traitement inconnu"), 404)
+    job = jobs.get(db.get_engine("batch"), job_id)
+    if job is None or (job["owner"] != str(get_jwt_identity())
+                       and get_jwt().get("type_profil") not in ADMIN_PROFILES):
+        return None, (jsonify(message="traitement inconnu"), 404)
+    return job, None
+
+
+@bp_jobs.get("")
+@jwt_required()
+def list_mine():
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    rows = jobs.list_jobs(db.get_engine("batch"), str(get_jwt_identity()),
+                          request.args.get("status"), limit)
+    return json_response({"jobs": [_public(r) for r in rows]})
+
+
+@bp_jobs.get("/<job_id>")
+@jwt_required()
+def status(job_id):
+    job, err = _load(job_id)
+    if err:
+        return err
+    return json_response(_public(job))
+
+
+@bp_jobs.post("/<job_id>/cancel")
+@jwt_required()
+def cancel(job_id):
+    job, err = _load(job_id)
+    if err:
+        return err
+    st = jobs.cancel(db.get_engine("batch"), job_id)
+    if st is None:
+        return jsonify(message=f"traitement déjà terminé ({job['status']})"), 409
+    # en cours : l'arrêt est effectif au prochain point d'avancement du traitement
+    return jsonify(job_id=job_id, status=st, cancel_requested=True), 202 if st == "running" else 200
+
+
+def _complete_lines(path: str) -> int:
+    """Taille du préfixe de `path` qui se termine par une fin de ligne."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(0, size - _TAIL_BYTES))
+        tail = f.read()
+    return size - len(tail) + tail.rfind(b"\n") + 1
+
+
+def _stream_prefix(path: str, n: int, chunk: int = 1 << 20):
+    with open(path, "rb") as f:
+        while n > 0:
+            buf = f.read(min(chunk, n))
+            if not buf:
+                break
+            n -= len(buf)
+            yield buf
+
+
+@bp_jobs.get("/<job_id>/result")
+@jwt_required()
+def result(job_id):
+    job, err = _load(job_id)
+    if err:
+        return err
+    partial = request.args.get("partial") == "1"
+    path = job["result_path"]
+    if job["status"] != "succeeded" and not (partial and path):
+        return jsonify(message=f"résultat indisponible (statut {job['status']})",
+                       status=job["status"], progress=job["progress"]), 409
+    if not path:
+        return json_response({"job_id": job["job_id"], "result": job["result"]})
+    if not os.path.exists(path):
+        return jsonify(message="fichier résultat absent sur cette instance (JOBS_DIR partagé ?)"), 404
+
+    ext = EXTENSIONS.get(job["result_type"], os.path.splitext(path)[1].lstrip("."))
+    name = f"{job['type'].replace('.', '_')}_{job_id}.{ext}"
+    if job["status"] == "succeeded":
+        return send_file(path, mimetype=job["result_type"], as_attachment=True, download_name=name)
+    if ext != "csv":
+        return jsonify(message="lecture partielle réservée aux résultats CSV"), 409
+    resp = Response(_stream_prefix(path, _complete_lines(path)), content_type=job["result_type"],
+                    direct_passthrough=True)
+    resp.headers["Content-Disposition"] = f'attachment; filename="partial_{name}"'
+    return resp
@@ -0,0 +1,61 @@
+# server/lazy.py
+"""
+Imports différés des bibliothèques lourdes (pandas, NumPy).
+
+    pd = lazy.module("pandas")
+
+`pd` est un module « proxy » : le vrai `import pandas` n'a lieu qu'au premier
+accès à un attribut (`pd.DataFrame`), puis le proxy recopie l'espace de noms
+du module réel (les accès suivants ne passent plus par le proxy). L'import est
+protégé par un verrou : le thread de préchauffage (model_store) et une
+première requête peuvent y toucher en même temps.
+
+Les annotations de type (`df: pd.DataFrame`) ne doivent pas être évaluées à
+l'import : les modules concernés utilisent `from __future__ import annotations`.
+
+LAZY_IMPORTS=0 : import immédiat (comportement historique, pour comparer avec
+`python -m bench.importtime`).
+"""
+import importlib
+import os
+import sys
+import threading
+import types
+
+LAZY_IMPORTS = os.getenv("LAZY_IMPORTS", "1") == "1"
+
+
+class _LazyModule(types.ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_lock"] = threading.Lock()
+        self.__dict__["_lazy_loaded"] = False
+
+    def _lazy_load(self):
+        with self._lazy_lock:
+            if not self._lazy_loaded:
+                real = importlib.import_module(self.__name__)
+                self.__dict__.update(real.__dict__)
+                self.__dict__["_lazy_loaded"] = True
+
+    def __getattr__(self, attr):
+        if self.__dict__["_lazy_loaded"]:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {attr!r}")
+        self._lazy_load()
+        return getattr(self, attr)
+
+    def __repr__(self):
+        state = "chargé" if self.__dict__["_lazy_loaded"] else "différé"
+        return f"<module {self.__name__!r} ({state})>"
+
+
+def module(name: str):
+    """Module `name`, importé au premier usage (ou tout de suite si déjà chargé / LAZY_IMPORTS=0)."""
+    if not LAZY_IMPORTS or name in sys.modules:
+        return importlib.import_module(name)
+    return _LazyModule(name)
+
+
+def loaded(name: str) -> bool:
+    """Le module réel est-il importé dans ce process ?"""
+    return name in sys.modules
@@ -0,0 +1,333 @@
+# server/matviews.py
+"""
+Vues de features matérialisées : déclaration, rafraîchissement ordonné, fraîcheur.
+
+fv_train_eta, fv_lane_carrier_stats, fv_phase_durations -> fv_phase_stats ->
+fv_phase_enriched… sont des vues simples : chaque requête API recalcule jointures,
+fenêtres et percentiles sur les tables brutes. Ce module permet de basculer
+n'importe laquelle en MATERIALIZED VIEW (avec l'index unique requis par
+`REFRESH ... CONCURRENTLY`), en recréant à l'identique les vues qui en dépendent.
+
+  - `materialize` / `dematerialize` : DDL (CLI `python matviews.py ...`)
+  - `refresh` : ordre topologique, CONCURRENTLY, durée tracée dans fv_matview_refresh
+  - `as_of` : date de fraîcheur effective d'une vue (None = calculée en direct),
+    renvoyée par les endpoints dans le champ `as_of`
+  - rafraîchissement périodique : tâche `matviews.refresh` du planificateur
+    (scheduler.py), toutes les REFRESH_SECONDS (MATVIEW_REFRESH_SECONDS, 0 = off)
+
+La source de vérité « matérialisée ou non » est le catalogue Postgres (relkind).
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+REFRESH_TABLE = "fv_matview_refresh"
+_REFRESH_LOCK_KEY = 360_0002  # pg_try_advisory_lock : un seul rafraîchissement à la fois
+REFRESH_SECONDS = float(os.getenv("MATVIEW_REFRESH_SECONDS", "0"))
+
+# vue -> (dépendances directes parmi les vues de features, colonnes de l'index unique)
+FEATURE_VIEWS = {
+    "fv_train_eta":            ((), ("shipment_id",)),
+    "fv_train_delay":          (("fv_train_eta",), ("shipment_id",)),
+    "fv_lane_carrier_stats":   ((), ("origin", "destination_zone", "carrier", "service_level")),
+    "fv_train_carrier_choice": (("fv_lane_carrier_stats",), ("shipment_id",)),
+    "fv_phase_durations":      ((), ("event_id",)),
+    "fv_phase_stats":          (("fv_phase_durations",), ("carrier", "phase")),
+    "fv_phase_enriched":       (("fv_phase_durations", "fv_phase_stats"), ("event_id",)),
+}
+
+AS_OF_CACHE_SECONDS = 5.0
+_state_cache = {"at": 0.0, "state": None}
+_state_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------------
+# Graphe de dépendances
+# ----------------------------------------------------------------------------
+def deps(name: str) -> tuple:
+    return FEATURE_VIEWS[name][0]
+
+
+def topo_order(names=None) -> list:
+    """Vues triées dépendances d'abord (restreint à `names` si fourni)."""
+    order, seen = [], set()
+
+    def visit(n):
+        if n in seen:
+            return
+        seen.add(n)
+        for d in deps(n):
+            visit(d)
+        order.append(n)
+
+    for n in FEATURE_VIEWS:
+        visit(n)
+    if names is None:
+        return order
+    wanted = set(names)
+    return [n for n in order if n in wanted]
+
+
+def ancestors(name: str) -> set:
+    out = set()
+    for d in deps(name):
+        out.add(d)
+        out |= ancestors(d)
+    return out
+
+
+def dependents(name: str) -> list:
+    """Vues qui dépendent (transitivement) de `name`, en ordre topologique."""
+    return [n for n in topo_order() if name in ancestors(n)]
+
+
+# ----------------------------------------------------------------------------
+# Catalogue
+# ----------------------------------------------------------------------------
+def _kinds(conn) -> dict:
+    rows = conn.execute(text("""
+        SELECT c.relname, c.relkind
+        FROM pg_class c
+        WHERE c.relname = ANY(:names) AND c.relkind IN ('v', 'm')
+          AND pg_table_is_visible(c.oid)
+    """), {"names": list(FEATURE_VIEWS)})
+    return {r[0]: ("materialized" if r[1] == "m" else "view") for r in rows}
+
+
+def _definition(conn, name: str) -> str:
+    sql = conn.execute(text("SELECT pg_get_viewdef(CAST(:n AS regclass), true)"), {"n": name}).scalar()
+    return sql.strip().rstrip(";")
+
+
+def _unique_index_name(name: str) -> str:
+    return f"ux_{name}"
+
+
+def _drop(conn, name: str, kind: str):
+    what = "MATERIALIZED VIEW" if kind == "materialized" else "VIEW"
+    conn.execute(text(f"DROP {what} IF EXISTS {name}"))
+
+
+def _create(conn, name: str, kind: str, definition: str):
+    if kind == "materialized":
+        conn.execute(text(f"CREATE MATERIALIZED VIEW {name} AS {definition} WITH DATA"))
+        cols = ", ".join(FEATURE_VIEWS[name][1])
+        conn.execute(text(f"CREATE UNIQUE INDEX {_unique_index_name(name)} ON {name} ({cols})"))
+        _record(conn, name, 0.0, "created")
+    else:
+        conn.execute(text(f"CREATE VIEW {name} AS {definition}"))
+        conn.execute(text(f"DELETE FROM {REFRESH_TABLE} WHERE view_name = :n"), {"n": name})
+
+
+def _record(conn, name: str, duration_ms: float, status: str, error: str = None):
+    conn.execute(text(f"""
+        INSERT INTO {REFRESH_TABLE} (view_name, refreshed_at, duration_ms, status, error)
+        VALUES (:n, now(), :d, :s, :e)
+        ON CONFLICT (view_name) DO UPDATE
+          SET refreshed_at = CASE WHEN EXCLUDED.status = 'error'
+                                  THEN {REFRESH_TABLE}.refreshed_at
+                                  ELSE EXCLUDED.refreshed_at END,
+              duration_ms = EXCLUDED.duration_ms,
+              status = EXCLUDED.status,
+              error = EXCLUDED.error
+    """), {"n": name, "d": duration_ms, "s": status, "e": error})
+
+
+def _set_kind(eng, name: str, kind: str):
+    """Bascule `name` en vue simple / matérialisée en recréant ses dépendants à l'identique."""
+    if name not in FEATURE_VIEWS:
+        raise ValueError(f"Vue inconnue : {name} (attendu : {', '.join(FEATURE_VIEWS)})")
+    with eng.begin() as conn:
+        kinds = _kinds(conn)
+        if name not in kinds:
+            raise ValueError(f"{name} n'existe pas (migrations appliquées ?)")
+        if kinds[name] == kind:
+            return False
+        chain = [name] + [d for d in dependents(name) if d in kinds]
+        defs = {n: _definition(conn, n) for n in chain}
+        for n in reversed(chain):
+            _drop(conn, n, kinds[n])
+        for n in chain:
+            _create(conn, n, kind if n == name else kinds[n], defs[n])
+    invalidate_state()
+    return True
+
+
+@contextmanager
+def views_detached(conn, root: str):
+    """
+    Supprime `root` et ses dépendants puis les recrée (même type, même définition)
+    à la sortie du bloc, dans la transaction `conn`. Sert aux opérations qui
+    remplacent une table sous-jacente (ex. partitionnement de shipment_events).
+    """
+    kinds = _kinds(conn)
+    chain = [n for n in [root] + dependents(root) if n in kinds]
+    defs = {n: _definition(conn, n) for n in chain}
+    for n in reversed(chain):
+        _drop(conn, n, kinds[n])
+    yield chain
+    for n in chain:
+        _create(conn, n, kinds[n], defs[n])
+    invalidate_state()
+
+
+def materialize(eng, name: str) -> bool:
+    return _set_kind(eng, name, "materialized")
+
+
+def dematerialize(eng, name: str) -> bool:
+    return _set_kind(eng, name, "view")
+
+
+# ----------------------------------------------------------------------------
+# Rafraîchissement
+# ----------------------------------------------------------------------------
+def refresh(eng, names=None, concurrently: bool = True, out=None) -> dict:
+    """
+    Rafraîchit les vues matérialisées (toutes, ou `names` + leurs ancêtres et dépendants
+    matérialisés) en ordre topologique. Une vue en échec saute ses dépendants.
+    Renvoie {vue: {"status", "duration_ms"[, "error"]}} ; {} si un autre process rafraîchit déjà.
+    """
+    unknown = [n for n in (names or ()) if n not in FEATURE_VIEWS]
+    if unknown:
+        raise ValueError(f"Vue(s) inconnue(s) : {unknown}")
+    lock = eng.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        if not lock.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _REFRESH_LOCK_KEY}).scalar():
+            return {}
+        with eng.connect() as conn:
+            kinds = _kinds(conn)
+        targets = set(FEATURE_VIEWS) if names is None else set(names)
+        for n in list(targets):
+            # ancêtres d'abord, puis dépendants pour rester cohérent
+            targets |= ancestors(n) | set(dependents(n))
+        results, failed = {}, set()
+        for n in topo_order(targets):
+            if kinds.get(n) != "materialized":
+                continue
+            if ancestors(n) & failed:
+                results[n] = {"status": "skipped", "duration_ms": 0.0}
+                failed.add(n)
+                continue
+            t0 = time.perf_counter()
+            try:
+                with eng.begin() as conn:
+                    conc = " CONCURRENTLY" if concurrently else ""
+                    conn.execute(text(f"REFRESH MATERIALIZED VIEW{conc} {n}"))
+                    dur = (time.perf_counter() - t0) * 1000.0
+                    _record(conn, n, dur, "ok")
+                results[n] = {"status": "ok", "duration_ms": round(dur, 1)}
+            except Exception as e:
+                dur = (time.perf_counter() - t0) * 1000.0
+                with eng.begin() as conn:
+                    _record(conn, n, dur, "error", str(e)[:2000])
+                results[n] = {"status": "error", "duration_ms": round(dur, 1), "error": str(e)}
+                failed.add(n)
+            if out is not None:
+                print(f"  {n:<26} {results[n]['status']:<7} {results[n]['duration_ms']:10.1f} ms", file=out)
+        invalidate_state()
+        return results
+    finally:
+        try:
+            lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _REFRESH_LOCK_KEY})
+        finally:
+            lock.close()
+
+
+# ----------------------------------------------------------------------------
+# Fraîcheur (exposée à l'API)
+# ----------------------------------------------------------------------------
+def invalidate_state():
+    with _state_lock:
+        _state_cache["at"] = 0.0
+
+
+def state(eng) -> dict:
+    """{vue: {"kind", "refreshed_at", "duration_ms", "status", "error"}} (cache de quelques secondes)."""
+    now = time.monotonic()
+    with _state_lock:
+        if _state_cache["state"] is not None and now - _state_cache["at"] < AS_OF_CACHE_SECONDS:
+            return _state_cache["state"]
+    with eng.connect() as conn:
+        kinds = _kinds(conn)
+        rows = conn.execute(text(
+            f"SELECT view_name, refreshed_at, duration_ms, status, error FROM {REFRESH_TABLE}"
+        )).mappings().all()
+    log = {r["view_name"]: r for r in rows}
+    st = {}
+    for n in FEATURE_VIEWS:
+        r = log.get(n) or {}
+        st[n] = {
+            "kind": kinds.get(n, "missing"),
+            "refreshed_at": r.get("refreshed_at"),
+            "duration_ms": r.get("duration_ms"),
+            "status": r.get("status"),
+            "error": r.get("error"),
+        }
+    with _state_lock:
+        _state_cache.update(at=now, state=st)
+    return st
+
+
+def as_of(eng, name: str):
+    """
+    Horodatage ISO des données servies par `name` : le plus ancien rafraîchissement
+    parmi elle et ses ancêtres matérialisés ; None si tout est calculé en direct.
+    """
+    try:
+        st = state(eng)
+    except Exception:
+        return None
+    stamps = [
+        st[n]["refreshed_at"] for n in {name} | ancestors(name)
+        if st[n]["kind"] == "materialized" and st[n]["refreshed_at"] is not None
+    ]
+    return min(stamps).isoformat() if stamps else None
+
+
+def _fmt_ts(v):
+    if isinstance(v, datetime):
+        return v.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    return "-"
+
+
+def main() -> int:
+    from sqlalchemy import create_engine
+    from db import DATABASE_URL
+
+    ap = argparse.ArgumentParser(description="Vues de features matérialisées")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status")
+    for cmd in ("materialize", "dematerialize"):
+        p = sub.add_parser(cmd)
+        p.add_argument("views", nargs="+")
+    r = sub.add_parser("refresh")
+    r.add_argument("views", nargs="*")
+    r.add_argument("--blocking", action="store_true", help="sans CONCURRENTLY")
+    args = ap.parse_args()
+
+    eng = create_engine(DATABASE_URL, pool_pre_ping=True)
+    if args.cmd == "status":
+        for n, s in state(eng).items():
+            print(f"  {n:<26} {s['kind']:<13} as_of={_fmt_ts(s['refreshed_at'])} "
+                  f"durée={s['duration_ms'] or 0:.0f}ms {s['status'] or ''}")
+    elif args.cmd in ("materialize", "dematerialize"):
+        fn = materialize if args.cmd == "materialize" else dematerialize
+        for n in topo_order(args.views):
+            print(f"  {n}: {'modifiée' if fn(eng, n) else 'inchangée'}")
+    elif args.cmd == "refresh":
+        res = refresh(eng, names=args.views or None, concurrently=not args.blocking, out=sys.stdout)
+        if not res:
+            print("Rien à rafraîchir (aucune vue matérialisée, ou rafraîchissement déjà en cours).")
+        return 1 if any(v["status"] == "error" for v in res.values()) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
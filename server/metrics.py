@@ -0,0 +1,314 @@
+# server/metrics.py
+"""
+Instrumentation légère exposée au format texte Prometheus sur `/api/metrics`.
+
+  logiops_http_request_duration_seconds{route,method,status}   latence par route Flask
+  logiops_db_query_duration_seconds{route}                     temps SQL (events cursor_execute)
+  logiops_db_pool_checkout_wait_seconds                        attente d'une connexion du pool
+  logiops_db_pool_{size,checked_out,overflow}                  état du pool au moment du scrape
+  logiops_model_predict_duration_seconds{model}                temps de predict()
+  logiops_model_predict_batch_rows{model}                      taille des batchs prédits
+  logiops_json_encode_duration_seconds{route}                  sérialisation (json_response)
+
+Coût par observation : un bisect + deux incréments sous un verrou, sans
+allocation ; on peut laisser l'instrumentation active en production. Les
+compteurs sont par process (un scrape par worker gunicorn).
+
+Si METRICS_TOKEN est défini, `/api/metrics` exige `Authorization: Bearer <token>`.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def _fmt_labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Histogram:
+    """Histogramme cumulatif à seaux fixes, une série par combinaison de labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def snapshot(self) -> dict:
+        """{labels: (comptes par seau non cumulés, somme, nb)} (copie)."""
+        with self._lock:
+            return {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+
+    def quantile(self, q: float, *labels):
+        """Quantile approché (borne haute du seau), None si aucune observation."""
+        s = self.snapshot().get(labels)
+        if not s or not s[2]:
+            return None
+        target, acc = q * s[2], 0
+        for i, n in enumerate(s[0]):
+            acc += n
+            if acc >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, n) in sorted(self.snapshot().items()):
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                bucket = _fmt_labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket} {acc}")
+            bucket = _fmt_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {n}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, n: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_num(v)}")
+        return lines
+
+
+class Gauge:
+    """Jauge calculée au scrape : `fn()` renvoie {labels: valeur}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, fn, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.fn() or {}
+        except Exception:
+            values = {}
+        for labels, v in sorted(values.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_num(v)}")
+        return lines
+
+
+# ----------------------------------------------------------------------------
+# Registre
+# ----------------------------------------------------------------------------
+REGISTRY = {}
+
+
+def register(metric):
+    REGISTRY.setdefault(metric.name, metric)
+    return REGISTRY[metric.name]
+
+
+HTTP_LATENCY = register(Histogram(
+    "logiops_http_request_duration_seconds", "Latence des requêtes HTTP par route",
+    ("route", "method", "status")))
+DB_QUERY = register(Histogram(
+    "logiops_db_query_duration_seconds", "Durée des requêtes SQL par route appelante", ("route",)))
+POOL_WAIT = register(Histogram(
+    "logiops_db_pool_checkout_wait_seconds", "Attente d'une connexion du pool", ("engine",)))
+PREDICT = register(Histogram(
+    "logiops_model_predict_duration_seconds", "Durée des appels predict()", ("model",)))
+PREDICT_ROWS = register(Histogram(
+    "logiops_model_predict_batch_rows", "Lignes par appel predict()", ("model",), ROWS_BUCKETS))
+JSON_ENCODE = register(Histogram(
+    "logiops_json_encode_duration_seconds", "Sérialisation JSON des réponses", ("route",)))
+
+
+def current_route() -> str:
+    """Règle Flask de la requête en cours ("-" hors requête : threads de fond, CLI)."""
+    if not has_request_context():
+        return "-"
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+# ----------------------------------------------------------------------------
+# Modèles : proxy chronométré autour de predict()
+# ----------------------------------------------------------------------------
+# appelés avant chaque predict() (ex. deadline.check : lèvent pour sauter l'appel)
+PREDICT_GUARDS = []
+
+
+class TimedModel:
+    """Délègue tout au modèle ; `predict` est chronométré avec la taille du batch."""
+
+    def __init__(self, name: str, model):
+        self._name = name
+        self._model = model
+
+    def predict(self, X, *args, **kwargs):
+        for guard in PREDICT_GUARDS:
+            guard("model")
+        t0 = time.perf_counter()
+        try:
+            return self._model.predict(X, *args, **kwargs)
+        finally:
+            PREDICT.observe(time.perf_counter() - t0, self._name)
+            PREDICT_ROWS.observe(len(X), self._name)
+
+    def __getattr__(self, item):
+        return getattr(self._model, item)
+
+
+def instrument_model(name: str, model):
+    return model if model is None or isinstance(model, TimedModel) else TimedModel(name, model)
+
+
+# ----------------------------------------------------------------------------
+# Base de données
+# ----------------------------------------------------------------------------
+class TimedQueuePool(QueuePool):
+    """QueuePool qui mesure l'attente de checkout (`poolclass=` de create_engine)."""
+
+    metrics_name = "default"
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - t0, self.metrics_name)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics_name = self.metrics_name
+        return pool
+
+
+_ENGINES = {}
+
+
+def pool_stats() -> dict:
+    """{engine: (taille, empruntées, overflow)} des pools instrumentés."""
+    out = {}
+    for name, eng in list(_ENGINES.items()):
+        p = eng.pool
+        if isinstance(p, QueuePool):
+            out[name] = (p.size(), p.checkedout(), p.overflow())
+    return out
+
+
+register(Gauge("logiops_db_pool_size", "Taille configurée du pool",
+               lambda: {(n,): s[0] for n, s in pool_stats().items()}, ("engine",)))
+register(Gauge("logiops_db_pool_checked_out", "Connexions empruntées",
+               lambda: {(n,): s[1] for n, s in pool_stats().items()}, ("engine",)))
+register(Gauge("logiops_db_pool_overflow", "Connexions au-delà de pool_size",
+               lambda: {(n,): s[2] for n, s in pool_stats().items()}, ("engine",)))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_metrics_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("_metrics_t0")
+    if stack:
+        DB_QUERY.observe(time.perf_counter() - stack.pop(), current_route())
+
+
+def instrument_engine(eng, name: str = "default"):
+    """Events SQL + jauges de pool (idempotent)."""
+    if name in _ENGINES:
+        return eng
+    _ENGINES[name] = eng
+    if isinstance(eng.pool, TimedQueuePool):
+        eng.pool.metrics_name = name
+    event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+    event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+    return eng
+
+
+# ----------------------------------------------------------------------------
+# Flask
+# ----------------------------------------------------------------------------
+def _before_request():
+    g._metrics_t0 = time.perf_counter()
+
+
+def _after_request(resp):
+    t0 = g.pop("_metrics_t0", None)
+    if t0 is not None:
+        HTTP_LATENCY.observe(time.perf_counter() - t0, current_route(), request.method, resp.status_code)
+    return resp
+
+
+def render() -> str:
+    lines = []
+    for m in REGISTRY.values():
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return Response("forbidden\n", status=403, mimetype="text/plain")
+    return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def init_app(app, engine=None):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/api/metrics", "metrics", metrics_endpoint, methods=["GET"])
+    if engine is not None:
+        instrument_engine(engine)
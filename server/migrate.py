@@ -0,0 +1,51 @@
+# server/migrate.py
+"""
+Runner des migrations de schéma (remplace les scripts « Views SQL/ »).
+
+    python migrate.py status
+    python migrate.py up [--to N]
+    python migrate.py down --to N
+    python migrate.py check [--rows 20000]   # EXPLAIN : index utilisés par l'API
+
+Utilise la même configuration DB que l'application (voir db.py).
+"""
+import argparse
+import sys
+
+from sqlalchemy import create_engine
+
+import migrations
+from db import DATABASE_URL
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Migrations de schéma Logiops360")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status")
+    up = sub.add_parser("up")
+    up.add_argument("--to", type=int, default=None)
+    down = sub.add_parser("down")
+    down.add_argument("--to", type=int, required=True)
+    chk = sub.add_parser("check")
+    chk.add_argument("--rows", type=int, default=20_000)
+    args = ap.parse_args()
+
+    eng = create_engine(DATABASE_URL, pool_pre_ping=True)
+
+    if args.cmd == "status":
+        for version, name, applied in migrations.status(eng):
+            print(f"  [{'x' if applied else ' '}] v{version:04d} {name}")
+    elif args.cmd == "up":
+        applied = migrations.upgrade(eng, target=args.to)
+        print(f"{len(applied)} migration(s) appliquée(s).")
+    elif args.cmd == "down":
+        reverted = migrations.downgrade(eng, target=args.to)
+        print(f"{len(reverted)} migration(s) annulée(s).")
+    elif args.cmd == "check":
+        from migrations import check
+        return 0 if check.run(eng, n_shipments=args.rows) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# server/migrations/__init__.py
+"""
+Migrations de schéma versionnées (vues, colonnes typées, index).
+
+Chaque module `vNNNN_<nom>.py` du package définit :
+  - DESCRIPTION : libellé court
+  - UP / DOWN   : listes d'instructions SQL (DOWN = rollback de UP)
+  - TRANSACTIONAL (optionnel, True par défaut) : False pour les instructions
+    interdites en transaction (CREATE INDEX CONCURRENTLY…), exécutées en autocommit
+  - ou bien `upgrade(eng, out)` / `downgrade(eng, out)` pour les migrations longues
+    qui gèrent elles-mêmes leurs transactions (conversion par lots…)
+
+Les versions appliquées sont tracées dans `schema_migrations` ; un verrou
+consultatif évite que deux process migrent en même temps.
+Point d'entrée : `python migrate.py` (voir server/migrate.py).
+"""
+import importlib
+import pkgutil
+import re
+import sys
+import time
+
+from sqlalchemy import text
+
+MIGRATIONS_TABLE = "schema_migrations"
+_LOCK_KEY = 360_0001  # pg_advisory_lock : une seule migration à la fois
+_NAME_RE = re.compile(r"^v(\d{4})_(\w+)$")
+
+
+class Migration:
+    def __init__(self, version: int, name: str, module):
+        self.version = version
+        self.name = name
+        self.description = getattr(module, "DESCRIPTION", name)
+        self.up = list(getattr(module, "UP", []))
+        self.down = list(getattr(module, "DOWN", []))
+        self.transactional = getattr(module, "TRANSACTIONAL", True)
+        self.upgrade_fn = getattr(module, "upgrade", None)
+        self.downgrade_fn = getattr(module, "downgrade", None)
+
+    def __repr__(self) -> str:
+        return f"<Migration v{self.version:04d} {self.name}>"
+
+
+def discover() -> list:
+    """Migrations du package, triées par version."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        m = _NAME_RE.match(info.name)
+        if not m:
+            continue
+        module = importlib.import_module(f"{__name__}.{info.name}")
+        found.append(Migration(int(m.group(1)), m.group(2), module))
+    found.sort(key=lambda x: x.version)
+    versions = [m.version for m in found]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Versions de migration dupliquées : {versions}")
+    return found
+
+
+def _ensure_table(conn):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+          version     integer PRIMARY KEY,
+          name        text NOT NULL,
+          applied_at  timestamptz NOT NULL DEFAULT now(),
+          duration_ms double precision
+        )
+    """))
+
+
+def applied_versions(eng) -> set:
+    with eng.begin() as conn:
+        _ensure_table(conn)
+        return {r[0] for r in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+
+def _run(eng, statements: list, transactional: bool, record):
+    """Exécute les instructions puis `record(conn)` (même transaction si possible)."""
+    if transactional:
+        with eng.begin() as conn:
+            for sql in statements:
+                conn.execute(text(sql))
+            record(conn)
+        return
+    with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for sql in statements:
+            conn.execute(text(sql))
+    with eng.begin() as conn:
+        record(conn)
+
+
+def _locked(eng):
+    conn = eng.connect().execution_options(isolation_level="AUTOCOMMIT")
+    conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _LOCK_KEY})
+    return conn
+
+
+def _unlock(conn):
+    try:
+        conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+    finally:
+        conn.close()
+
+
+def upgrade(eng, target: int = None, out=sys.stdout) -> list:
+    """Applique les migrations manquantes jusqu'à `target` (incluse). Renvoie les versions appliquées."""
+    lock = _locked(eng)
+    try:
+        done = applied_versions(eng)
+        applied = []
+        for m in discover():
+            if m.version in done or (target is not None and m.version > target):
+                continue
+            t0 = time.perf_counter()
+
+            def record(conn, m=m, t0=t0):
+                conn.execute(
+                    text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name, duration_ms) "
+                         "VALUES (:v, :n, :d)"),
+                    {"v": m.version, "n": m.name, "d": (time.perf_counter() - t0) * 1000.0},
+                )
+
+            if m.upgrade_fn is not None:
+                m.upgrade_fn(eng, out)
+                with eng.begin() as conn:
+                    record(conn)
+            else:
+                _run(eng, m.up, m.transactional, record)
+            applied.append(m.version)
+            print(f"  ↑ v{m.version:04d} {m.description} ({time.perf_counter() - t0:.2f}s)", file=out)
+        return applied
+    finally:
+        _unlock(lock)
+
+
+def downgrade(eng, target: int, out=sys.stdout) -> list:
+    """Annule les migrations de version > `target`, de la plus récente à la plus ancienne."""
+    lock = _locked(eng)
+    try:
+        done = applied_versions(eng)
+        reverted = []
+        for m in reversed(discover()):
+            if m.version not in done or m.version <= target:
+                continue
+
+            def record(conn, m=m):
+                conn.execute(text(f"DELETE FROM {MIGRATIONS_TABLE} WHERE version = :v"),
+                             {"v": m.version})
+
+            if m.downgrade_fn is not None:
+                m.downgrade_fn(eng, out)
+                with eng.begin() as conn:
+                    record(conn)
+            else:
+                _run(eng, m.down, m.transactional, record)
+            reverted.append(m.version)
+            print(f"  ↓ v{m.version:04d} {m.description}", file=out)
+        return reverted
+    finally:
+        _unlock(lock)
+
+
+def status(eng) -> list:
+    """[(version, nom, appliquée?)]"""
+    done = applied_versions(eng)
+    return [(m.version, m.name, m.version in done) for m in discover()]
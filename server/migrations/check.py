@@ -0,0 +1,197 @@
+# server/migrations/check.py
+"""
+Vérifie par EXPLAIN que les requêtes de l'API utilisent bien les index.
+
+Dans une transaction annulée à la fin : on insère un jeu de données (préfixe CHK),
+on lance ANALYZE, puis EXPLAIN (FORMAT JSON) sur chaque requête des handlers et on
+cherche un parcours d'index sur la relation / l'index attendu. Sur une table
+partitionnée (shipment_events, migration v0008), les plans nomment les partitions
+et leurs index (shipment_events_p202501_…_idx) : ils sont ramenés à la table et à
+l'index parents (pg_partition_root) avant la comparaison. Les requêtes bornées sur
+la clé de partition (PRUNED) doivent en plus écarter des partitions : aucun Append
+de leurs parcours par shipment (Index Cond sur shipment_id) ne doit lister toutes
+les partitions de la table ; l'agrégat fv_phase_stats, lui, lit toute la fenêtre.
+
+Les requêtes qui lisent toute une table (kpi sur la fenêtre active) ou une table de
+quelques lignes (carrier_profiles pour reco) ont un Seq Scan légitime : elles sont
+expliquées avec enable_seqscan = off, ce qui vérifie que l'index existe et que son
+expression correspond bien au prédicat / au tri de la requête.
+
+    python migrate.py check [--rows 20000]
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from kpi_api import SQL_IN_PROGRESS
+from ml_anomaly_api import SQL_DETAIL_EVENT, SQL_DETAIL_PHASES, SQL_LIST_LIVE as SQL_ANOM_LIST, detail_params
+from ml_delay_api import SQL_DETAIL, SQL_LIST as SQL_DELAY_LIST
+from ml_reco_simple_api import SQL_STAGE1
+
+PREFIX = "CHK"
+_PHASES = "ARRAY['created','picked','in_transit','out_for_delivery','delivered']"
+_INDEX_NODES = {"Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan"}
+# checks dont la requête borne event_time : pruning des partitions attendu
+PRUNED = {"anom.detail (event)", "anom.detail (phases)"}
+
+
+def seed(conn, n_shipments: int = 20_000, prefix: str = PREFIX) -> dict:
+    """Jeu minimal : 8 transporteurs x 3 services, n shipments, 5 évènements chacun."""
+    conn.execute(text("""
+        INSERT INTO carrier_profiles (carrier, service_level, sla_hours, exception_rate,
+                                      base_rate_per_km, surcharge_per_kg)
+        SELECT :p || '_CARRIER_' || c, s, 24 + 4 * c, 0.05 + 0.01 * c, 0.5 + 0.05 * c, 0.1
+        FROM generate_series(0, 7) AS c,
+             unnest(ARRAY['EXPRESS','STANDARD','ECONOMY']) AS s
+        ON CONFLICT DO NOTHING
+    """), {"p": prefix})
+    conn.execute(text("""
+        INSERT INTO shipments (shipment_id, ordernumber, origin, destination_zone, carrier,
+                               service_level, distance_km, weight_kg, volume_m3, total_units,
+                               n_lines, ship_datetime, delivery_datetime, cost_estimated)
+        SELECT :p || lpad(i::text, 9, '0'), 'ORD' || i,
+               'ORIG_' || (i % 20), 'ZONE_' || (i % 15),
+               :p || '_CARRIER_' || (i % 8),
+               (ARRAY['EXPRESS','STANDARD','ECONOMY'])[1 + i % 3],
+               50 + (i % 900), 1 + (i % 300), 0.1 * (1 + i % 30), 1 + i % 50, 1 + i % 10,
+               now() - make_interval(mins => i),
+               now() - make_interval(mins => i) + make_interval(hours => 12 + i % 60),
+               20 + (i % 900) * 0.4
+        FROM generate_series(1, :n) AS i
+    """), {"p": prefix, "n": n_shipments})
+    base = conn.execute(text("SELECT COALESCE(MAX(event_id), 0) FROM shipment_events")).scalar()
+    conn.execute(text(f"""
+        INSERT INTO shipment_events (event_id, shipment_id, event_type, event_time)
+        SELECT :base + (i - 1) * 5 + ph.ord, :p || lpad(i::text, 9, '0'), ph.phase,
+               now() - make_interval(mins => i)
+                     + make_interval(hours => ((ph.ord - 1) * (2 + i % 7))::int)
+        FROM generate_series(1, :n) AS i
+        CROSS JOIN unnest({_PHASES}) WITH ORDINALITY AS ph(phase, ord)
+    """), {"p": prefix, "n": n_shipments, "base": int(base)})
+    for t in ("shipments", "shipment_events", "carrier_profiles"):
+        conn.execute(text(f"ANALYZE {t}"))
+    sid = f"{prefix}{1:09d}"
+    eid_time = conn.execute(text("SELECT event_time FROM shipment_events WHERE event_id = :e"),
+                            {"e": int(base) + 2}).scalar()
+    return {"sid": sid, "eid": int(base) + 2, "eid_time": eid_time, "mid_sid": f"{prefix}{n_shipments // 2:09d}",
+            "mid_dt": datetime.now(timezone.utc) - timedelta(minutes=n_shipments // 2),
+            "mid_eid": int(base) + (n_shipments // 2) * 5}
+
+
+def _page(lim: int, **cursor) -> dict:
+    """Paramètres d'une page keyset (cf. pagination.Page.params)."""
+    p = {"lim": lim + 1, "t_from": None, "t_to": None}
+    p.update(cursor)
+    return p
+
+
+def checks(sample: dict) -> list:
+    """(nom, sql, params, relation attendue, index attendu, enable_seqscan = off)."""
+    sid, eid = sample["sid"], sample["eid"]
+    reco = {"origin": "ORIG_1", "dest": "ZONE_1", "dist": 500.0, "wt": 100.0,
+            "svcalias": ["EXPRESS", "PRIORITY", "FAST"]}
+    return [
+        ("eta.predict_by_id / delay.detail", SQL_DETAIL, {"sid": sid}, "shipments", None, False),
+        ("delay.list / eta.shipments (p1)", SQL_DELAY_LIST, _page(40, c_ship_dt=None, c_shipment_id=None),
+         "shipments", "ix_shipments_ship_seek", False),
+        ("delay.list / eta.shipments (pN)", SQL_DELAY_LIST,
+         _page(40, c_ship_dt=sample["mid_dt"], c_shipment_id=sample["mid_sid"]),
+         "shipments", "ix_shipments_ship_seek", False),
+        ("anom.detail (event)", SQL_DETAIL_EVENT, detail_params(sid, eid, sample["eid_time"]),
+         "shipment_events", "ix_shipment_events_shipment_time", False),
+        ("anom.detail (phases)", SQL_DETAIL_PHASES, detail_params(sid, eid, sample["eid_time"]),
+         "shipment_events", "ix_shipment_events_shipment_time", False),
+        # seek event_id puis évènement suivant du shipment (vue non matérialisée)
+        ("anom.list (page N, seek)", SQL_ANOM_LIST, _page(30, c_event_id=sample["mid_eid"]),
+         "shipment_events", "ix_shipment_events_event_id", False),
+        ("anom.list (page N, next event)", SQL_ANOM_LIST, _page(30, c_event_id=sample["mid_eid"]),
+         "shipment_events", "ix_shipment_events_shipment_time", False),
+        ("reco.recommend (stage 1)", SQL_STAGE1, reco,
+         "carrier_profiles", "ix_carrier_profiles_service_norm", True),
+        ("kpi.counters", SQL_IN_PROGRESS, {},
+         "shipment_events", "ix_shipment_events_shipment_time", True),
+    ]
+
+
+SQL_PARTITION_ROOTS = """
+    SELECT c.relname, r.relname
+    FROM pg_class c
+    JOIN pg_class r ON r.oid = pg_partition_root(c.oid)
+    WHERE c.relispartition AND pg_table_is_visible(c.oid)
+"""
+
+
+def partition_roots(conn) -> dict:
+    """{partition ou index de partition: table / index parent racine}."""
+    return dict(conn.execute(text(SQL_PARTITION_ROOTS)).all())
+
+
+def _walk(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def _scans(plan: dict, roots: dict = None) -> list:
+    """[(type de nœud, relation, index)] ; partitions ramenées à leur parent via `roots`."""
+    roots = roots or {}
+    return [
+        (n["Node Type"], roots.get(n.get("Relation Name"), n.get("Relation Name")),
+         roots.get(n.get("Index Name"), n.get("Index Name")))
+        for n in _walk(plan)
+        if "Scan" in n["Node Type"]
+    ]
+
+
+def _prunes(plan: dict, roots: dict, relation: str, key: str = "shipment_id") -> bool:
+    """Aucun Append / Merge Append de parcours sur `key` ne lit toutes les partitions de `relation`."""
+    parts = {child for child, root in roots.items() if root == relation}
+    if not parts:  # table non partitionnée
+        return True
+    for n in _walk(plan):
+        if n["Node Type"] not in ("Append", "Merge Append"):
+            continue
+        below = [m for child in n.get("Plans", []) for m in _walk(child)]
+        if not any(key in m.get("Index Cond", "") for m in below):
+            continue
+        if parts <= {m.get("Relation Name") for m in below}:
+            return False
+    return True
+
+
+def _uses_index(scans: list, relation: str, index: str) -> bool:
+    for node, rel, idx in scans:
+        if node not in _INDEX_NODES:
+            continue
+        if index is not None and idx == index:
+            return True
+        if index is None and rel == relation:
+            return True
+    return False
+
+
+def run(eng, n_shipments: int = 20_000, out=sys.stdout) -> bool:
+    ok = True
+    with eng.connect() as conn:
+        trans = conn.begin()
+        try:
+            sample = seed(conn, n_shipments)
+            roots = partition_roots(conn)
+            for name, sql, params, relation, index, force in checks(sample):
+                conn.execute(text(f"SET LOCAL enable_seqscan = {'off' if force else 'on'}"))
+                plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+                scans = _scans(plan[0]["Plan"], roots)
+                seq = sorted({rel for node, rel, _ in scans if node == "Seq Scan" and rel})
+                if _uses_index(scans, relation, index) and (
+                        name not in PRUNED or _prunes(plan[0]["Plan"], roots, relation)):
+                    status = "OK  "
+                else:
+                    status, ok = "FAIL", False
+                expected = (index or relation) + (" (seqscan off)" if force else "") \
+                    + (" + pruning" if name in PRUNED else "")
+                print(f"[{status}] {name:<34} attendu={expected:<34} seq_scan={','.join(seq) or '-'}",
+                      file=out)
+        finally:
+            trans.rollback()
+    return ok
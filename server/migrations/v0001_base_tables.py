@@ -0,0 +1,59 @@
+# server/migrations/v0001_base_tables.py
+"""Tables de base (no-op sur une base existante : IF NOT EXISTS)."""
+
+DESCRIPTION = "tables de base shipments / shipment_events / carrier_profiles / users"
+
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS shipments (
+      shipment_id       text PRIMARY KEY,
+      ordernumber       text,
+      origin            text,
+      destination_zone  text,
+      carrier           text,
+      service_level     text,
+      distance_km       double precision,
+      weight_kg         double precision,
+      volume_m3         double precision,
+      total_units       integer,
+      n_lines           integer,
+      ship_datetime     timestamptz,
+      delivery_datetime timestamptz,
+      cost_estimated    double precision
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS shipment_events (
+      event_id    bigint PRIMARY KEY,
+      shipment_id text NOT NULL,
+      event_type  text NOT NULL,
+      event_time  timestamptz NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS carrier_profiles (
+      carrier          text NOT NULL,
+      service_level    text NOT NULL,
+      sla_hours        double precision,
+      exception_rate   double precision,
+      base_rate_per_km double precision,
+      surcharge_per_kg double precision,
+      PRIMARY KEY (carrier, service_level)
+    )
+    """,
+    # même définition que models.User (créée aussi par app.init_db)
+    """
+    CREATE TABLE IF NOT EXISTS users (
+      id                uuid PRIMARY KEY,
+      nom               varchar NOT NULL,
+      email             varchar NOT NULL,
+      mot_de_passe_hash varchar NOT NULL,
+      type_profil       varchar NOT NULL,
+      date_creation     timestamptz NOT NULL DEFAULT now(),
+      CONSTRAINT uq_user_email_profile UNIQUE (email, type_profil)
+    )
+    """,
+]
+
+# Jamais de DROP des tables métier : le rollback de cette version est un no-op.
+DOWN = []
@@ -0,0 +1,48 @@
+# server/migrations/v0002_typed_timestamps.py
+"""
+Colonnes horodatées typées (timestamptz) au lieu de text.
+
+Les vues castaient `(col)::timestamptz` à chaque requête, ce qui empêche l'usage
+d'un index sur la colonne. La conversion est conditionnelle (seulement si la colonne
+est encore en text/varchar) et supprime d'abord les vues dépendantes, recréées par
+les migrations suivantes.
+"""
+
+DESCRIPTION = "ship_datetime / delivery_datetime / event_time en timestamptz"
+
+# Vues historiques créées par les anciens scripts « Views SQL » (dépendent des colonnes)
+_DROP_VIEWS = """
+DROP VIEW IF EXISTS fv_reco_candidates, fv_train_carrier_choice, fv_lane_carrier_stats,
+                    fv_phase_enriched, fv_phase_stats, fv_phase_durations,
+                    fv_train_delay, fv_train_eta CASCADE
+"""
+
+_CONVERT = """
+DO $$
+DECLARE
+  c record;
+BEGIN
+  FOR c IN
+    SELECT table_name, column_name
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+      AND (table_name, column_name) IN (('shipments', 'ship_datetime'),
+                                        ('shipments', 'delivery_datetime'),
+                                        ('shipment_events', 'event_time'))
+      AND data_type IN ('{src}')
+  LOOP
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN %I TYPE {dst} USING %I::{dst}',
+                   c.table_name, c.column_name, c.column_name);
+  END LOOP;
+END $$;
+"""
+
+UP = [
+    _DROP_VIEWS,
+    _CONVERT.format(src="text', 'character varying", dst="timestamptz"),
+]
+
+DOWN = [
+    _DROP_VIEWS,
+    _CONVERT.format(src="timestamp with time zone", dst="text"),
+]
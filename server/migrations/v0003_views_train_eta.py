@@ -0,0 +1,67 @@
+# server/migrations/v0003_views_train_eta.py
+"""Vues d'entraînement ETA / retard (ex « Views SQL/fv_train_eta.py » et « fv_train_delay.py »)."""
+
+DESCRIPTION = "vues fv_train_eta / fv_train_delay"
+
+UP = [
+    """
+    CREATE OR REPLACE VIEW fv_train_eta AS
+    SELECT
+        s.shipment_id,
+        s.ordernumber,
+        s.origin,
+        s.destination_zone,
+        s.carrier,
+        s.service_level,
+        s.distance_km,
+        s.weight_kg,
+        s.volume_m3,
+        s.total_units,
+        s.n_lines,
+        s.ship_datetime AS ship_dt,
+        DATE_TRUNC('day', s.ship_datetime) AS ship_day,
+        EXTRACT(DOW  FROM s.ship_datetime)::int AS ship_dow,
+        EXTRACT(HOUR FROM s.ship_datetime)::int AS ship_hour,
+        cp.sla_hours,
+        EXTRACT(EPOCH FROM (s.delivery_datetime - s.ship_datetime)) / 3600.0 AS target_eta_hours
+    FROM shipments s
+    LEFT JOIN carrier_profiles cp
+      ON cp.carrier = s.carrier
+     AND cp.service_level = s.service_level
+    WHERE s.delivery_datetime IS NOT NULL
+    """,
+    """
+    CREATE OR REPLACE VIEW fv_train_delay AS
+    SELECT
+        shipment_id,
+        ordernumber,
+        origin,
+        destination_zone,
+        carrier,
+        service_level,
+        distance_km,
+        weight_kg,
+        volume_m3,
+        total_units,
+        n_lines,
+        ship_dt,
+        ship_day,
+        ship_dow,
+        ship_hour,
+        sla_hours,
+        target_eta_hours,
+        CASE
+            WHEN target_eta_hours IS NULL OR sla_hours IS NULL THEN NULL
+            WHEN target_eta_hours > sla_hours THEN 1
+            ELSE 0
+        END AS is_late
+    FROM fv_train_eta
+    WHERE target_eta_hours IS NOT NULL
+      AND sla_hours IS NOT NULL
+    """,
+]
+
+DOWN = [
+    "DROP VIEW IF EXISTS fv_train_delay",
+    "DROP VIEW IF EXISTS fv_train_eta",
+]
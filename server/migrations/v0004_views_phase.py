@@ -0,0 +1,82 @@
+# server/migrations/v0004_views_phase.py
+"""Vues de durées de phase + règle P90 (ex « Views SQL/view_anomaly.py »)."""
+
+DESCRIPTION = "vues fv_phase_durations / fv_phase_stats / fv_phase_enriched"
+
+UP = [
+    # 1) Durées brutes : on NE filtre PAS 'delivered' ici
+    #    -> ainsi la phase N-1 a comme durée le delta jusqu'à delivered
+    """
+    CREATE OR REPLACE VIEW fv_phase_durations AS
+    WITH raw AS (
+      SELECT
+        e.shipment_id,
+        e.event_id,
+        e.event_type,
+        LOWER(TRIM(e.event_type)) AS phase_norm,
+        e.event_time,
+        LEAD(e.event_time) OVER (
+          PARTITION BY e.shipment_id
+          ORDER BY e.event_time, e.event_id
+        ) AS next_time
+      FROM shipment_events e
+    )
+    SELECT
+      shipment_id,
+      event_id,
+      event_type AS phase,   -- libellé d'origine pour l'UI
+      phase_norm,            -- libellé normalisé pour jointures/filtres
+      event_time,
+      EXTRACT(EPOCH FROM (next_time - event_time))/3600.0 AS duration_h
+    FROM raw
+    """,
+    # 2) Stats par (carrier, phase_norm) en EXCLUANT delivered, et en ignorant les NULL
+    """
+    CREATE OR REPLACE VIEW fv_phase_stats AS
+    SELECT
+      s.carrier,
+      d.phase_norm AS phase,
+      AVG(d.duration_h) AS avg_duration_h,
+      PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY d.duration_h) AS p50_duration_h,
+      PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY d.duration_h) AS p90_duration_h,
+      STDDEV(d.duration_h) AS std_duration_h,
+      COUNT(*) AS n_obs
+    FROM fv_phase_durations d
+    JOIN shipments s ON s.shipment_id = d.shipment_id
+    WHERE d.duration_h IS NOT NULL
+      AND d.phase_norm <> 'delivered'
+    GROUP BY s.carrier, d.phase_norm
+    """,
+    # 3) Évènements enrichis (sans delivered) + règle P90
+    """
+    CREATE OR REPLACE VIEW fv_phase_enriched AS
+    SELECT
+      d.shipment_id,
+      d.event_id,
+      d.phase,               -- libellé d'origine (pour l'UI)
+      s.carrier,
+      d.duration_h,
+      ps.avg_duration_h,
+      ps.p50_duration_h,
+      ps.p90_duration_h,
+      ps.std_duration_h,
+      CASE
+        WHEN d.duration_h IS NULL THEN NULL
+        WHEN d.duration_h > ps.p90_duration_h THEN 1
+        ELSE 0
+      END AS is_anomaly_rule
+    FROM fv_phase_durations d
+    JOIN shipments s ON s.shipment_id = d.shipment_id
+    LEFT JOIN fv_phase_stats ps
+      ON ps.carrier = s.carrier
+     AND ps.phase   = d.phase_norm
+    WHERE d.duration_h IS NOT NULL
+    """,
+]
+
+# ordre inverse des dépendances
+DOWN = [
+    "DROP VIEW IF EXISTS fv_phase_enriched",
+    "DROP VIEW IF EXISTS fv_phase_stats",
+    "DROP VIEW IF EXISTS fv_phase_durations",
+]
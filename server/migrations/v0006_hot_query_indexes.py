@@ -0,0 +1,59 @@
+# server/migrations/v0006_hot_query_indexes.py
+"""
+Index des requêtes chaudes de l'API (créés CONCURRENTLY : pas de verrou d'écriture).
+
+  - shipment_events (shipment_id, event_time, event_id) INCLUDE (event_type)
+      fenêtres LEAD / FIRST_VALUE par shipment (fv_phase_durations, kpi counters)
+      + détail anomalie par shipment_id
+  - shipment_events (event_id)        : tri « dernières anomalies » (ORDER BY event_id DESC)
+  - shipments (ship_datetime DESC NULLS LAST) partiel sur delivery_datetime IS NOT NULL
+      « derniers N » de fv_train_eta (eta/shipments, delay/list)
+  - shipments (origin, destination_zone, carrier, service_level) : stats par lane
+  - carrier_profiles (carrier, service_level) INCLUDE (...) + expression UPPER(TRIM(service_level))
+      jointures et filtre d'alias de service de /recommend
+"""
+
+DESCRIPTION = "index des requêtes chaudes"
+
+TRANSACTIONAL = False
+
+UP = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shipment_events_shipment_time
+      ON shipment_events (shipment_id, event_time, event_id) INCLUDE (event_type)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shipment_events_event_id
+      ON shipment_events (event_id)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shipments_ship_datetime
+      ON shipments (ship_datetime DESC NULLS LAST)
+      WHERE delivery_datetime IS NOT NULL
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shipments_lane
+      ON shipments (origin, destination_zone, carrier, service_level)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_carrier_profiles_carrier_service
+      ON carrier_profiles (carrier, service_level)
+      INCLUDE (sla_hours, exception_rate, base_rate_per_km, surcharge_per_kg)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_carrier_profiles_service_norm
+      ON carrier_profiles ((UPPER(TRIM(service_level))))
+    """,
+    "ANALYZE shipments",
+    "ANALYZE shipment_events",
+    "ANALYZE carrier_profiles",
+]
+
+DOWN = [
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_carrier_profiles_service_norm",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_carrier_profiles_carrier_service",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_shipments_lane",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_shipments_ship_datetime",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_shipment_events_event_id",
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_shipment_events_shipment_time",
+]
@@ -0,0 +1,20 @@
+# server/migrations/v0007_matview_refresh_log.py
+"""Journal de rafraîchissement des vues matérialisées (voir matviews.py)."""
+
+DESCRIPTION = "table fv_matview_refresh"
+
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS fv_matview_refresh (
+      view_name    text PRIMARY KEY,
+      refreshed_at timestamptz,
+      duration_ms  double precision,
+      status       text,
+      error        text
+    )
+    """,
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS fv_matview_refresh",
+]
@@ -0,0 +1,18 @@
+# server/migrations/v0008_partition_shipment_events.py
+"""
+Conversion en ligne de shipment_events en table partitionnée par event_time
+(voir partitions.py) : copie par lots + trigger de capture, bascule courte.
+"""
+import sys
+
+DESCRIPTION = "shipment_events partitionnée par event_time"
+
+
+def upgrade(eng, out=sys.stdout):
+    import partitions
+    partitions.convert(eng, out=out)
+
+
+def downgrade(eng, out=sys.stdout):
+    import partitions
+    partitions.unconvert(eng, out=out)
@@ -0,0 +1,54 @@
+# server/migrations/v0009_active_window.py
+"""
+Fenêtre active sur fv_phase_durations : seuls les évènements récents sont lus,
+ce qui permet l'élagage des partitions de shipment_events.
+
+`logiops_active_since()` est STABLE : évaluée une fois à l'exécution, elle
+déclenche le pruning « runtime » (visible dans EXPLAIN : Subplans Removed).
+La fenêtre se règle par `SET logiops.active_window_days = N` (180 par défaut).
+Les vues doivent être de simples vues (pas matérialisées) lors de l'application.
+"""
+
+DESCRIPTION = "fenêtre active (logiops_active_since) sur fv_phase_durations"
+
+_DURATIONS = """
+    CREATE OR REPLACE VIEW fv_phase_durations AS
+    WITH raw AS (
+      SELECT
+        e.shipment_id,
+        e.event_id,
+        e.event_type,
+        LOWER(TRIM(e.event_type)) AS phase_norm,
+        e.event_time,
+        LEAD(e.event_time) OVER (
+          PARTITION BY e.shipment_id
+          ORDER BY e.event_time, e.event_id
+        ) AS next_time
+      FROM shipment_events e
+      {where}
+    )
+    SELECT
+      shipment_id,
+      event_id,
+      event_type AS phase,   -- libellé d'origine pour l'UI
+      phase_norm,            -- libellé normalisé pour jointures/filtres
+      event_time,
+      EXTRACT(EPOCH FROM (next_time - event_time))/3600.0 AS duration_h
+    FROM raw
+"""
+
+UP = [
+    """
+    CREATE OR REPLACE FUNCTION logiops_active_since() RETURNS timestamptz
+    LANGUAGE sql STABLE AS $$
+      SELECT now() - make_interval(days =>
+        COALESCE(NULLIF(current_setting('logiops.active_window_days', true), ''), '180')::int)
+    $$
+    """,
+    _DURATIONS.format(where="WHERE e.event_time >= logiops_active_since()"),
+]
+
+DOWN = [
+    _DURATIONS.format(where=""),
+    "DROP FUNCTION IF EXISTS logiops_active_since()",
+]
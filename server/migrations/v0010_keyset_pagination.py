@@ -0,0 +1,64 @@
+# server/migrations/v0010_keyset_pagination.py
+"""
+Pagination keyset des listes (voir pagination.py).
+
+  - shipments (ship_datetime DESC, shipment_id DESC) partiel : tri + seek
+    `(ship_dt, shipment_id) < (...)` de eta/shipments et delay/list ;
+    remplace ix_shipments_ship_datetime (même préfixe, même prédicat)
+  - fv_phase_enriched expose event_time : fenêtre from / to de anom/list
+    (le seek sur event_id utilise ux_fv_phase_enriched une fois matérialisée)
+
+Appliquer avec fv_phase_enriched en vue simple (pas matérialisée).
+"""
+
+DESCRIPTION = "index de seek shipments + event_time dans fv_phase_enriched"
+
+TRANSACTIONAL = False
+
+_ENRICHED = """
+    {verb} VIEW fv_phase_enriched AS
+    SELECT
+      d.shipment_id,
+      d.event_id,
+      d.phase,               -- libellé d'origine (pour l'UI)
+      s.carrier,
+      d.duration_h,
+      ps.avg_duration_h,
+      ps.p50_duration_h,
+      ps.p90_duration_h,
+      ps.std_duration_h,
+      CASE
+        WHEN d.duration_h IS NULL THEN NULL
+        WHEN d.duration_h > ps.p90_duration_h THEN 1
+        ELSE 0
+      END AS is_anomaly_rule{extra}
+    FROM fv_phase_durations d
+    JOIN shipments s ON s.shipment_id = d.shipment_id
+    LEFT JOIN fv_phase_stats ps
+      ON ps.carrier = s.carrier
+     AND ps.phase   = d.phase_norm
+    WHERE d.duration_h IS NOT NULL
+"""
+
+UP = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shipments_ship_seek
+      ON shipments (ship_datetime DESC, shipment_id DESC)
+      WHERE delivery_datetime IS NOT NULL AND ship_datetime IS NOT NULL
+    """,
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_shipments_ship_datetime",
+    _ENRICHED.format(verb="CREATE OR REPLACE", extra=",\n      d.event_time"),
+    "ANALYZE shipments",
+]
+
+DOWN = [
+    # CREATE OR REPLACE ne peut pas retirer une colonne
+    "DROP VIEW IF EXISTS fv_phase_enriched",
+    _ENRICHED.format(verb="CREATE", extra=""),
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_shipments_ship_datetime
+      ON shipments (ship_datetime DESC NULLS LAST)
+      WHERE delivery_datetime IS NOT NULL
+    """,
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_shipments_ship_seek",
+]
@@ -0,0 +1,83 @@
+# server/migrations/v0011_change_notify.py
+"""
+NOTIFY `logiops_changes` à chaque modification de shipments, shipment_events et
+carrier_profiles (voir invalidation.py).
+
+Triggers *par instruction* avec tables de transition : un INSERT / COPY de
+100 000 lignes envoie une seule notification. La charge utile JSON porte la
+table, l'opération et les clés distinctes touchées ; au-delà de MAX_KEYS clés
+(ou pour un TRUNCATE), `keys` vaut null = « toute la table ».
+Une table de transition n'est permise que pour un seul évènement par trigger,
+d'où un trigger par opération.
+"""
+
+DESCRIPTION = "triggers NOTIFY logiops_changes (shipments, shipment_events, carrier_profiles)"
+
+CHANNEL = "logiops_changes"
+MAX_KEYS = 100
+
+# table -> colonne clé transmise aux caches
+TABLES = {
+    "shipments": "shipment_id",
+    "shipment_events": "shipment_id",
+    "carrier_profiles": "carrier",
+}
+
+_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION logiops_notify_change() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+      keys jsonb;
+      n    int;
+    BEGIN
+      IF TG_OP <> 'TRUNCATE' THEN
+        EXECUTE format(
+          'SELECT count(*), jsonb_agg(k) FROM (SELECT DISTINCT %I AS k FROM changed LIMIT {MAX_KEYS + 1}) s',
+          TG_ARGV[0]) INTO n, keys;
+        IF n = 0 THEN
+          RETURN NULL;
+        END IF;
+        IF n > {MAX_KEYS} THEN
+          keys := NULL;
+        END IF;
+      END IF;
+      PERFORM pg_notify('{CHANNEL}', json_build_object(
+        'table', TG_TABLE_NAME, 'op', lower(TG_OP), 'keys', keys)::text);
+      RETURN NULL;
+    END
+    $$
+"""
+
+# (suffixe, évènement, table de transition)
+_EVENTS = (
+    ("ins", "INSERT", "NEW"),
+    ("upd", "UPDATE", "NEW"),
+    ("del", "DELETE", "OLD"),
+)
+
+
+def triggers(table: str, key: str = None) -> list:
+    """DROP / CREATE des triggers de notification d'une table (réutilisé par partitions.py)."""
+    key = key or TABLES[table]
+    out = []
+    for suffix, ev, ref in _EVENTS:
+        out.append(f"DROP TRIGGER IF EXISTS trg_{table}_notify_{suffix} ON {table}")
+        out.append(
+            f"CREATE TRIGGER trg_{table}_notify_{suffix} AFTER {ev} ON {table} "
+            f"REFERENCING {ref} TABLE AS changed "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION logiops_notify_change('{key}')"
+        )
+    out.append(f"DROP TRIGGER IF EXISTS trg_{table}_notify_trunc ON {table}")
+    out.append(
+        f"CREATE TRIGGER trg_{table}_notify_trunc AFTER TRUNCATE ON {table} "
+        f"FOR EACH STATEMENT EXECUTE FUNCTION logiops_notify_change('{key}')"
+    )
+    return out
+
+
+UP = [_FUNCTION] + [stmt for t, k in TABLES.items() for stmt in triggers(t, k)]
+
+DOWN = [
+    f"DROP TRIGGER IF EXISTS trg_{t}_notify_{s} ON {t}"
+    for t in TABLES for s in ("ins", "upd", "del", "trunc")
+] + ["DROP FUNCTION IF EXISTS logiops_notify_change()"]
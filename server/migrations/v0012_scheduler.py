@@ -0,0 +1,39 @@
+# server/migrations/v0012_scheduler.py
+"""
+État partagé du planificateur (voir scheduler.py) : prochaine échéance et pause
+par tâche, historique des exécutions avec durée et erreur.
+"""
+
+DESCRIPTION = "tables scheduler_jobs / scheduler_runs"
+
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_jobs (
+      name        text PRIMARY KEY,
+      schedule    text NOT NULL,
+      next_run_at timestamptz NOT NULL,
+      paused      boolean NOT NULL DEFAULT false,
+      updated_at  timestamptz NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scheduler_runs (
+      run_id      bigserial PRIMARY KEY,
+      job         text NOT NULL,
+      instance    text NOT NULL,
+      trigger     text NOT NULL,
+      started_at  timestamptz NOT NULL,
+      finished_at timestamptz,
+      duration_ms double precision,
+      status      text NOT NULL,
+      result      jsonb,
+      error       text
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_scheduler_runs_job ON scheduler_runs (job, started_at DESC)",
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS scheduler_runs",
+    "DROP TABLE IF EXISTS scheduler_jobs",
+]
@@ -0,0 +1,41 @@
+# server/migrations/v0013_jobs.py
+"""
+État durable des traitements asynchrones (voir jobs.py) : paramètres,
+avancement, résumé partiel, fichier résultat, demande d'annulation.
+La file est lue par `status = 'queued'` (index partiel, claim SKIP LOCKED) ;
+les traitements en cours sont comptés par type à chaque réclamation.
+"""
+
+DESCRIPTION = "table jobs (traitements asynchrones)"
+
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+      job_id       uuid PRIMARY KEY,
+      type         text NOT NULL,
+      owner        text,
+      status       text NOT NULL DEFAULT 'queued',
+      params       jsonb NOT NULL DEFAULT '{}'::jsonb,
+      progress     double precision NOT NULL DEFAULT 0,
+      message      text,
+      partial      jsonb,
+      result       jsonb,
+      result_path  text,
+      result_type  text,
+      error        text,
+      cancel_requested boolean NOT NULL DEFAULT false,
+      instance     text,
+      created_at   timestamptz NOT NULL DEFAULT now(),
+      started_at   timestamptz,
+      heartbeat_at timestamptz,
+      finished_at  timestamptz
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_jobs_queued ON jobs (type, created_at) WHERE status = 'queued'",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_running ON jobs (type) WHERE status = 'running'",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_owner ON jobs (owner, created_at DESC)",
+]
+
+DOWN = [
+    "DROP TABLE IF EXISTS jobs",
+]
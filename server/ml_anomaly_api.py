@@ -1,12 +1,29 @@
 # server/ml_anomaly_api.py
+from __future__ import annotations
+
 import math
-from flask import Blueprint, jsonify, request, current_app
+import os
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
-import pandas as pd
 from sqlalchemy import text
 
+import db
+import lazy
+import matviews
+import shared_cache
+from pagination import PageError, parse_page
+from serialization import json_response
+
+pd = lazy.module("pandas")
+
 bp_anom = Blueprint("bp_anom", __name__, url_prefix="/api/ml/anom")
 
+LIST_CACHE_TTL = 60  # s, cache partagé entre workers (shared_cache)
+# détail : évènements lus à ± N jours de l'anomalie (durée max d'un shipment)
+DETAIL_SPAN_DAYS = int(os.getenv("ANOM_DETAIL_SPAN_DAYS", "30"))
+
 # --- helpers ---
 def severity_from_ratio(ratio: float) -> str:
     """Bucket simple selon l’écart au P90 (ratio = duration_h / p90_duration_h)."""
@@ -19,61 +36,195 @@ def severity_from_ratio(ratio: float) -> str:
     return "basse"  # >P90 mais léger (ex : 1.00–1.10)
 
 # --------- LIST ----------
+# fv_phase_enriched matérialisée : seek sur event_id via ux_fv_phase_enriched.
+SQL_LIST = """
+    SELECT
+      e.shipment_id,
+      e.event_id,
+      e.phase,
+      s.carrier,
+      e.duration_h,
+      e.avg_duration_h,
+      e.p50_duration_h,
+      e.p90_duration_h,
+      e.event_time,
+      s.origin,
+      s.destination_zone,
+      s.distance_km,
+      s.weight_kg
+    FROM fv_phase_enriched e
+    JOIN shipments s ON s.shipment_id = e.shipment_id
+    WHERE e.is_anomaly_rule = 1             -- uniquement les > P90
+      AND e.duration_h IS NOT NULL
+      AND e.p90_duration_h IS NOT NULL
+      AND (CAST(:t_from AS timestamptz) IS NULL OR e.event_time >= :t_from)
+      AND (CAST(:t_to AS timestamptz) IS NULL OR e.event_time < :t_to)
+      AND (CAST(:c_event_id AS bigint) IS NULL OR e.event_id < :c_event_id)
+    ORDER BY e.event_id DESC
+    LIMIT :lim
+"""
+
+# Vue simple : le seek porté par fv_phase_enriched s'appliquerait après la fenêtre
+# LEAD sur tout shipment_events. On parcourt donc shipment_events par event_id
+# décroissant (ix_shipment_events_event_id) et on cherche l'évènement suivant du
+# même shipment par ix_shipment_events_shipment_time ; même résultat que la vue.
+SQL_LIST_LIVE = """
+    SELECT
+      e.shipment_id,
+      e.event_id,
+      e.event_type AS phase,
+      s.carrier,
+      nx.duration_h,
+      ps.avg_duration_h,
+      ps.p50_duration_h,
+      ps.p90_duration_h,
+      e.event_time,
+      s.origin,
+      s.destination_zone,
+      s.distance_km,
+      s.weight_kg
+    FROM shipment_events e
+    CROSS JOIN LATERAL (
+      SELECT EXTRACT(EPOCH FROM (n.event_time - e.event_time))/3600.0 AS duration_h
+      FROM shipment_events n
+      WHERE n.shipment_id = e.shipment_id
+        AND n.event_time >= e.event_time
+        AND (n.event_time, n.event_id) > (e.event_time, e.event_id)
+      ORDER BY n.event_time, n.event_id
+      LIMIT 1
+    ) nx
+    JOIN shipments s ON s.shipment_id = e.shipment_id
+    JOIN fv_phase_stats ps
+      ON ps.carrier = s.carrier
+     AND ps.phase   = LOWER(TRIM(e.event_type))
+    WHERE e.event_time >= logiops_active_since()
+      AND nx.duration_h > ps.p90_duration_h   -- uniquement les > P90
+      AND (CAST(:t_from AS timestamptz) IS NULL OR e.event_time >= :t_from)
+      AND (CAST(:t_to AS timestamptz) IS NULL OR e.event_time < :t_to)
+      AND (CAST(:c_event_id AS bigint) IS NULL OR e.event_id < :c_event_id)
+    ORDER BY e.event_id DESC
+    LIMIT :lim
+"""
+LIST_KEYS = ("event_id",)
+
+
+def list_sql(eng) -> str:
+    """SQL_LIST si fv_phase_enriched est matérialisée (index de seek), sinon SQL_LIST_LIVE."""
+    try:
+        kind = matviews.state(eng)["fv_phase_enriched"]["kind"]
+    except Exception:
+        kind = None
+    return SQL_LIST if kind == "materialized" else SQL_LIST_LIVE
+
+LIST_COLUMNS = [
+    "shipment_id","event_id","event_time","phase","carrier",
+    "origin","destination_zone","distance_km","weight_kg",
+    "duration_h","avg_duration_h","p50_duration_h","p90_duration_h",
+    "ratio_p90","severity"
+]
+
+def annotate(df: pd.DataFrame) -> pd.DataFrame:
+    """ratio / p90 + sévérité sur des lignes de list_sql() (liste et export)."""
+    df = df.copy()
+    df["ratio_p90"] = df["duration_h"] / df["p90_duration_h"]
+    df["severity"] = df["ratio_p90"].apply(severity_from_ratio)
+    return df[LIST_COLUMNS]
+
 @bp_anom.get("/list")
 @jwt_required()
+@shared_cache.cached(ttl=LIST_CACHE_TTL, tables=("shipment_events", "shipments"))
 def list_anomalies():
     """
     Retourne les anomalies P90 récentes (une tuile par événement anormal).
     Query:
-      - limit (int, def=30)
+      - limit (int, def=30), cursor, from, to (sur event_time, cf. pagination.py)
     """
-    eng = current_app.config.get("_ENGINE")
-    lim = int(request.args.get("limit", 30))
-
-    q = text("""
-        SELECT
-          e.shipment_id,
-          e.event_id,
-          e.phase,
-          s.carrier,
-          e.duration_h,
-          e.avg_duration_h,
-          e.p50_duration_h,
-          e.p90_duration_h,
-          s.origin,
-          s.destination_zone,
-          s.distance_km,
-          s.weight_kg
-        FROM fv_phase_enriched e
-        JOIN shipments s ON s.shipment_id = e.shipment_id
-        WHERE e.is_anomaly_rule = 1             -- uniquement les > P90
-          AND e.duration_h IS NOT NULL
-          AND e.p90_duration_h IS NOT NULL
-        ORDER BY e.event_id DESC
-        LIMIT :lim
-    """)
+    eng = db.get_engine("analytics")
+    try:
+        page = parse_page(LIST_KEYS, default_limit=30)
+    except PageError as e:
+        return jsonify(message=str(e)), 400
 
     with eng.connect() as c:
-        df = pd.read_sql(q, c, params={"lim": lim})
+        df = pd.read_sql(text(list_sql(eng)), c, params=page.params())
 
     if df.empty:
-        return jsonify(items=[])
+        return jsonify(items=[], next_cursor=None)
+    df, next_cursor = page.split(df)
 
-    # ratio / p90 + sévérité
-    df["ratio_p90"] = df["duration_h"] / df["p90_duration_h"]
-    df["severity"] = df["ratio_p90"].apply(severity_from_ratio)
+    return json_response({"items": annotate(df), "next_cursor": next_cursor,
+                          "as_of": matviews.as_of(eng, "fv_phase_enriched")})
 
-    cols = [
-        "shipment_id","event_id","phase","carrier",
-        "origin","destination_zone","distance_km","weight_kg", 
-        "duration_h","avg_duration_h","p50_duration_h","p90_duration_h",
-        "ratio_p90","severity"
-    ]
-    out = df[cols].copy()
+# --------- DETAIL ----------
+# Lu sur shipment_events (partitionnée par event_time) et non sur fv_phase_enriched :
+# un filtre sur la vue n'atteint pas la clé de partition, toutes les partitions
+# étaient parcourues. Ici chaque parcours est borné sur event_time à ± DETAIL_SPAN_DAYS
+# de l'anomalie (pruning au planning : psycopg2 envoie des littéraux) ; mêmes durées
+# et stats que la vue, hors phases de plus de DETAIL_SPAN_DAYS.
+SQL_EVENT_TIME = """
+    SELECT event_time FROM shipment_events
+    WHERE shipment_id = :sid AND event_id = :eid
+    LIMIT 1
+"""
 
-    return jsonify(items=out.to_dict(orient="records"))
+SQL_DETAIL_EVENT = """
+    SELECT
+      e.shipment_id, e.event_id, e.event_type AS phase, nx.duration_h,
+      ps.avg_duration_h, ps.p50_duration_h, ps.p90_duration_h, ps.std_duration_h,
+      CASE WHEN nx.duration_h > ps.p90_duration_h THEN 1 ELSE 0 END AS is_anomaly_rule,
+      s.origin, s.destination_zone, s.carrier, s.distance_km, s.weight_kg
+    FROM shipment_events e
+    CROSS JOIN LATERAL (
+      SELECT EXTRACT(EPOCH FROM (n.event_time - e.event_time))/3600.0 AS duration_h
+      FROM shipment_events n
+      WHERE n.shipment_id = e.shipment_id
+        AND n.event_time >= :event_time AND n.event_time < :span_to
+        AND (n.event_time, n.event_id) > (e.event_time, e.event_id)
+      ORDER BY n.event_time, n.event_id
+      LIMIT 1
+    ) nx
+    JOIN shipments s ON s.shipment_id = e.shipment_id
+    LEFT JOIN fv_phase_stats ps
+      ON ps.carrier = s.carrier
+     AND ps.phase   = LOWER(TRIM(e.event_type))
+    WHERE e.shipment_id = :sid AND e.event_id = :eid
+      AND e.event_time = :event_time           -- une seule partition
+      AND e.event_time >= logiops_active_since()
+    LIMIT 1
+"""
+
+SQL_DETAIL_PHASES = """
+    SELECT
+      e.event_id, e.event_type AS phase, nx.duration_h,
+      ps.avg_duration_h, ps.p50_duration_h, ps.p90_duration_h
+    FROM shipment_events e
+    CROSS JOIN LATERAL (
+      SELECT EXTRACT(EPOCH FROM (n.event_time - e.event_time))/3600.0 AS duration_h
+      FROM shipment_events n
+      WHERE n.shipment_id = e.shipment_id
+        AND n.event_time >= :span_from AND n.event_time < :span_to
+        AND (n.event_time, n.event_id) > (e.event_time, e.event_id)
+      ORDER BY n.event_time, n.event_id
+      LIMIT 1
+    ) nx
+    JOIN shipments s ON s.shipment_id = e.shipment_id
+    LEFT JOIN fv_phase_stats ps
+      ON ps.carrier = s.carrier
+     AND ps.phase   = LOWER(TRIM(e.event_type))
+    WHERE e.shipment_id = :sid
+      AND e.event_time >= :span_from AND e.event_time < :span_to
+      AND e.event_time >= logiops_active_since()
+    ORDER BY e.event_id ASC
+    LIMIT 100
+"""
+
+
+def detail_params(sid: str, eid: int, event_time: datetime) -> dict:
+    """Paramètres de SQL_DETAIL_EVENT / SQL_DETAIL_PHASES pour un évènement."""
+    span = timedelta(days=DETAIL_SPAN_DAYS)
+    return {"sid": sid, "eid": eid, "event_time": event_time,
+            "span_from": event_time - span, "span_to": event_time + span}
 
-# --------- DETAIL ----------
 @bp_anom.get("/detail")
 @jwt_required()
 def detail():
@@ -82,32 +233,36 @@ def detail():
     Query:
       - shipment_id (str)
       - event_id (int)
+      - event_time (ISO 8601, optionnel : renvoyé par /list ; évite une recherche
+        dans toutes les partitions)
     """
     shipment_id = (request.args.get("shipment_id") or "").strip()
     event_id     = request.args.get("event_id")
+    event_time   = (request.args.get("event_time") or "").strip()
 
     if not shipment_id or event_id is None:
         return jsonify(message="shipment_id et event_id requis"), 400
+    try:
+        event_id = int(event_id)
+        event_time = datetime.fromisoformat(event_time.replace("Z", "+00:00")) if event_time else None
+    except ValueError:
+        return jsonify(message="event_id (entier) ou event_time (ISO 8601) invalide"), 400
+    if event_time is not None and event_time.tzinfo is None:
+        event_time = event_time.replace(tzinfo=timezone.utc)
 
-    eng = current_app.config.get("_ENGINE")
-
-    # 1) L’évènement anormal
-    q1 = text("""
-        SELECT
-          e.*,
-          s.origin, s.destination_zone, s.carrier, s.distance_km, s.weight_kg
-        FROM fv_phase_enriched e
-        JOIN shipments s ON s.shipment_id = e.shipment_id
-        WHERE e.shipment_id = :sid AND e.event_id = :eid
-        LIMIT 1
-    """)
-    with eng.connect() as c:
-        row = pd.read_sql(q1, c, params={"sid": shipment_id, "eid": int(event_id)})
+    eng = db.get_engine("analytics")
+    if event_time is None:
+        event_time = db.fetch_scalar(SQL_EVENT_TIME, {"sid": shipment_id, "eid": event_id}, eng=eng)
+        if event_time is None:
+            return jsonify(message="anomalie introuvable"), 404
+    params = detail_params(shipment_id, event_id, event_time)
+
+    # 1) L’évènement anormal (une ligne : pas de DataFrame)
+    r = db.fetch_one_dict(SQL_DETAIL_EVENT, params, eng=eng)
 
-    if row.empty:
+    if r is None:
         return jsonify(message="anomalie introuvable"), 404
 
-    r = row.iloc[0].to_dict()
     ratio_p90 = None
     try:
         ratio_p90 = float(r["duration_h"]) / float(r["p90_duration_h"]) if r.get("p90_duration_h") else None
@@ -115,22 +270,17 @@ def detail():
         ratio_p90 = None
 
     # 2) Les 4–6 dernières phases de ce shipment (contexte)
-    q2 = text("""
-        SELECT event_id, phase, duration_h, avg_duration_h, p50_duration_h, p90_duration_h
-        FROM fv_phase_enriched
-        WHERE shipment_id = :sid
-        ORDER BY event_id ASC
-        LIMIT 100
-    """)
-    with eng.connect() as c:
-        phases = pd.read_sql(q2, c, params={"sid": shipment_id})
+    phases = db.fetch_dicts(SQL_DETAIL_PHASES, params, eng=eng)
 
     # marquer la phase en anomalie
-    phases["is_anom_p90"] = (phases["duration_h"] > phases["p90_duration_h"]).astype(int)
+    for p in phases:
+        d, p90 = p["duration_h"], p["p90_duration_h"]
+        p["is_anom_p90"] = int(d is not None and p90 is not None and d > p90)
 
     payload = {
         "shipment_id": r.get("shipment_id"),
         "event_id": int(r.get("event_id")),
+        "event_time": event_time,
         "phase": r.get("phase"),
         "carrier": r.get("carrier"),
         "origin": r.get("origin"),
@@ -143,6 +293,6 @@ def detail():
         "p90_duration_h": r.get("p90_duration_h"),
         "ratio_p90": ratio_p90,
         "severity": severity_from_ratio(ratio_p90),
-        "phases": phases.to_dict(orient="records")
+        "phases": phases,
     }
-    return jsonify(payload)
+    return json_response(payload)
@@ -1,22 +1,54 @@
 # server/ml_delay_api.py
-import os, json
-import numpy as np
-import pandas as pd
-import joblib
-from flask import Blueprint, jsonify, request, current_app
+from __future__ import annotations
+
+import os
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
 from sqlalchemy import text
 
+import db
+import lazy
+import matviews
+import model_store
+import shared_cache
+from pagination import PageError, parse_page
+from serialization import json_response
+
 bp_delay = Blueprint("bp_delay", __name__, url_prefix="/api/ml/delay")
 
+LIST_CACHE_TTL = 60  # s, cache partagé entre workers (shared_cache)
+
 HERE = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(HERE, "models", "eta_lgbm.joblib")
 META_PATH  = os.path.join(HERE, "models", "delay_feature_meta.json")
+model_store.register("delay_eta", MODEL_PATH, META_PATH)
+
+np = lazy.module("numpy")
+pd = lazy.module("pandas")
 
 # --- Hack permanent pour créer artificiellement des retards ---
 # Mettre 0.0 pour revenir au comportement réel.
 SHIFT_SLA_HOURS = 10.0
 
+SQL_LIST = """
+    SELECT shipment_id, origin, destination_zone, carrier, service_level,
+           distance_km, weight_kg, volume_m3, total_units, n_lines,
+           ship_dow, ship_hour, ship_dt, sla_hours
+    FROM fv_train_eta
+    WHERE shipment_id IS NOT NULL
+      AND ship_dt IS NOT NULL
+      AND (CAST(:t_from AS timestamptz) IS NULL OR ship_dt >= :t_from)
+      AND (CAST(:t_to AS timestamptz) IS NULL OR ship_dt < :t_to)
+      AND (CAST(:c_ship_dt AS timestamptz) IS NULL
+           OR (ship_dt, shipment_id) < (CAST(:c_ship_dt AS timestamptz), :c_shipment_id))
+    ORDER BY ship_dt DESC, shipment_id DESC
+    LIMIT :lim
+"""
+# clé de tri de SQL_LIST (curseur de pagination)
+LIST_KEYS = ("ship_dt", "shipment_id")
+
+SQL_DETAIL = "SELECT * FROM fv_train_eta WHERE shipment_id=:sid LIMIT 1"
+
 _PIPE = None
 _META = None
 _FEATURES = None
@@ -24,11 +56,10 @@ _FEATURES = None
 def _load():
     global _PIPE, _META, _FEATURES
     if _META is None:
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            _META = json.load(f)
+        _META = model_store.meta("delay_eta")
         _FEATURES = _META["features"]  # doit matcher l'entraînement
     if _PIPE is None:
-        _PIPE = joblib.load(MODEL_PATH)
+        _PIPE = model_store.get("delay_eta")
 
 def classify_risk(delta_h):
     """Bande de risque (même logique partout)."""
@@ -42,63 +73,67 @@ def classify_risk(delta_h):
         return "limite"
     return "en_temps"
 
+# Payload “léger” pour la carte (ne pas exposer le hack : on ne renvoie pas sla_eff)
+LIST_COLUMNS = [
+    "shipment_id","origin","destination_zone","carrier","service_level",
+    "distance_km","weight_kg","eta_pred_h","sla_hours","delta_h","risk","ship_dt"
+]
+
+def score_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Prédiction ETA + Δ SLA + risque sur des lignes de SQL_LIST (liste et export)."""
+    _load()
+    df = df.copy()
+
+    # Prédiction ETA
+    X = df[_FEATURES]
+    eta_pred = _PIPE.predict(X)
+    df["eta_pred_h"] = eta_pred.astype(float)
+
+    # SLA effectif (truqué): SLA_eff = SLA - SHIFT
+    sla_num = pd.to_numeric(df.get("sla_hours"), errors="coerce")
+    df["sla_eff"] = np.where(sla_num.notna(), sla_num.astype(float) - float(SHIFT_SLA_HOURS), np.nan)
+
+    # Δ = ETA - SLA_eff
+    df["delta_h"] = np.where(df["sla_eff"].notna(), df["eta_pred_h"] - df["sla_eff"], np.nan)
+
+    # Risque
+    df["risk"] = df["delta_h"].apply(lambda v: classify_risk(float(v)) if pd.notna(v) else classify_risk(None))
+
+    # ship_dt est sérialisé en ISO par serialization.json_response
+    return df[LIST_COLUMNS]
+
 @bp_delay.get("/list")
 @jwt_required()
+@shared_cache.cached(ttl=LIST_CACHE_TTL, tables=("shipments", "shipment_events", "carrier_profiles"))
 def list_items():
     """
     Renvoie une liste de shipments récents avec risque de retard.
     Query params:
-      limit (def=40)
+      limit (def=40), cursor, from, to (cf. pagination.py)
     """
     _load()
-    eng = current_app.config.get("_ENGINE")
-    lim = int(request.args.get("limit", 40))
-
-    q = text("""
-        SELECT shipment_id, origin, destination_zone, carrier, service_level,
-               distance_km, weight_kg, volume_m3, total_units, n_lines,
-               ship_dow, ship_hour, ship_dt, sla_hours
-        FROM fv_train_eta
-        WHERE shipment_id IS NOT NULL
-        ORDER BY ship_dt DESC NULLS LAST
-        LIMIT :lim
-    """)
+    eng = db.get_engine("analytics")
+    try:
+        page = parse_page(LIST_KEYS, default_limit=40)
+    except PageError as e:
+        return jsonify(message=str(e)), 400
 
     with eng.connect() as c:
-        df = pd.read_sql(q, c, params={"lim": lim})
+        df = pd.read_sql(text(SQL_LIST), c, params=page.params())
 
     if df.empty:
-        return jsonify(items=[])
+        return jsonify(items=[], next_cursor=None)
+    df, next_cursor = page.split(df)
 
     # Vérif colonnes features
     missing = [c for c in _FEATURES if c not in df.columns]
     if missing:
         return jsonify(message=f"Colonnes manquantes dans fv_train_eta: {missing}"), 400
 
-    # Prédiction ETA
-    X = df[_FEATURES].copy()
-    eta_pred = _PIPE.predict(X)
-    df["eta_pred_h"] = eta_pred.astype(float)
+    out = score_frame(df)
 
-    # SLA effectif (truqué): SLA_eff = SLA - SHIFT
-    sla_num = pd.to_numeric(df.get("sla_hours"), errors="coerce")
-    df["sla_eff"] = np.where(sla_num.notna(), sla_num.astype(float) - float(SHIFT_SLA_HOURS), np.nan)
-
-    # Δ = ETA - SLA_eff
-    df["delta_h"] = np.where(df["sla_eff"].notna(), df["eta_pred_h"] - df["sla_eff"], np.nan)
-
-    # Risque
-    df["risk"] = df["delta_h"].apply(lambda v: classify_risk(float(v)) if pd.notna(v) else classify_risk(None))
-
-    # Payload “léger” pour la carte (ne pas exposer le hack si tu veux : on ne renvoie pas sla_eff)
-    out = df.assign(
-        ship_dt=df["ship_dt"].astype(str)
-    )[[
-        "shipment_id","origin","destination_zone","carrier","service_level",
-        "distance_km","weight_kg","eta_pred_h","sla_hours","delta_h","risk","ship_dt"
-    ]]
-
-    return jsonify(items=out.to_dict(orient="records"))
+    return json_response({"items": out, "next_cursor": next_cursor,
+                          "as_of": matviews.as_of(eng, "fv_train_eta")})
 
 @bp_delay.get("/detail")
 @jwt_required()
@@ -112,24 +147,23 @@ def detail():
     if not sid:
         return jsonify(message="shipment_id requis"), 400
 
-    eng = current_app.config.get("_ENGINE")
-    with eng.connect() as c:
-        row = pd.read_sql(text("SELECT * FROM fv_train_eta WHERE shipment_id=:sid LIMIT 1"),
-                          c, params={"sid": sid})
+    # Une seule ligne : pas de DataFrame pour la lecture (db.fetch_one_dict)
+    row = db.fetch_one_dict(SQL_DETAIL, {"sid": sid})
 
-    if row.empty:
+    if row is None:
         return jsonify(message="shipment_id introuvable"), 404
 
     # Vérif colonnes features
-    missing = [c for c in _FEATURES if c not in row.columns]
+    missing = [c for c in _FEATURES if c not in row]
     if missing:
         return jsonify(message=f"Colonnes manquantes: {missing}"), 400
 
     # Prédiction ETA
-    eta = float(_PIPE.predict(row[_FEATURES])[0])
+    X = pd.DataFrame([{c: row[c] for c in _FEATURES}])
+    eta = float(_PIPE.predict(X)[0])
 
     # SLA (réel) puis SLA effectif (truqué)
-    raw_sla = row["sla_hours"].iloc[0]
+    raw_sla = row.get("sla_hours")
     sla = float(raw_sla) if pd.notnull(raw_sla) else None
     sla_eff = (sla - float(SHIFT_SLA_HOURS)) if sla is not None else None
 
@@ -140,7 +174,7 @@ def detail():
     risk = classify_risk(delta)
 
     # Construit le payload
-    payload = row.iloc[0].to_dict()
+    payload = dict(row)
     payload.update({
         "eta_pred_h": eta,
         "sla_hours": sla,      # valeur réelle (on ne renvoie pas sla_eff pour cacher le hack)
@@ -153,4 +187,4 @@ def detail():
         if hasattr(v, "isoformat"):
             payload[k] = v.isoformat()
 
-    return jsonify(payload)
+    return json_response(payload)
@@ -1,31 +1,61 @@
 # ml_eta_api.py
-import os, json
+from __future__ import annotations
+
+import os
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from sqlalchemy import text
-import pandas as pd
-import joblib
+
+import db
+import jobs
+import lazy
+import model_store
+import shared_cache
+from jobs_api import accepted, wants_async
+from pagination import PageError, parse_page
 
 bp_eta = Blueprint("bp_eta", __name__, url_prefix="/api/ml/eta")
 
+DISTINCTS_CACHE_TTL = 300  # s, cache partagé entre workers (shared_cache)
+
+# Au-delà, /predict répond 202 + traitement asynchrone (jobs.py) ; 0 = jamais automatique
+ETA_SYNC_MAX_ITEMS = int(os.getenv("ETA_SYNC_MAX_ITEMS", "20000"))
+ETA_JOB_CHUNK_ROWS = int(os.getenv("ETA_JOB_CHUNK_ROWS", "10000"))
+jobs.register("eta.predict", "ml_eta_api:bulk_predict_job", concurrency=2, memory_mb=4096, per_user=2)
+
 # --- Config / chemins ---
 HERE = os.path.dirname(os.path.abspath(__file__))
 ETA_MODEL_PATH  = os.path.join(HERE, "models", "eta_lgbm.joblib")
 ETA_META_PATH   = os.path.join(HERE, "models", "eta_feature_meta.json")
-# --- Artefacts chargés une fois ---
-_PIPE = joblib.load(ETA_MODEL_PATH)
-with open(ETA_META_PATH, "r", encoding="utf-8") as f:
-    _META = json.load(f)
+# --- Artefacts : métadonnées lues à l'import, modèle chargé par model_store (préchauffage) ---
+pd = lazy.module("pandas")
+model_store.register("eta", ETA_MODEL_PATH, ETA_META_PATH)
+_META = model_store.meta("eta")
 _FEATURES = _META["features"]
 _MODEL_VERSION = _META.get("generated_at", "v1")
 
+SQL_BY_ID = "SELECT * FROM fv_train_eta WHERE shipment_id = :sid LIMIT 1"
+
+SQL_SHIPMENTS = """
+    SELECT shipment_id, ship_dt
+    FROM fv_train_eta
+    WHERE shipment_id IS NOT NULL
+      AND ship_dt IS NOT NULL
+      AND (CAST(:t_from AS timestamptz) IS NULL OR ship_dt >= :t_from)
+      AND (CAST(:t_to AS timestamptz) IS NULL OR ship_dt < :t_to)
+      AND (CAST(:c_ship_dt AS timestamptz) IS NULL
+           OR (ship_dt, shipment_id) < (CAST(:c_ship_dt AS timestamptz), :c_shipment_id))
+    ORDER BY ship_dt DESC, shipment_id DESC
+    LIMIT :lim
+"""
+SHIPMENTS_KEYS = ("ship_dt", "shipment_id")
+
 def _predict_dataframe(df: pd.DataFrame):
     # vérif colonnes & ordre
     missing = [c for c in _FEATURES if c not in df.columns]
     if missing:
         raise ValueError(f"Missing features in payload: {missing}")
     df = df[_FEATURES]
-    y = _PIPE.predict(df)
+    y = model_store.get("eta").predict(df)
     return [round(float(v), 2) for v in y]
 
 @bp_eta.get("/meta")
@@ -45,6 +75,8 @@ def predict():
     items = data.get("items", [])
     if not isinstance(items, list) or len(items) == 0:
         return jsonify(message="Body must contain 'items': [ {...}, ... ]"), 400
+    if wants_async() or (ETA_SYNC_MAX_ITEMS and len(items) > ETA_SYNC_MAX_ITEMS):
+        return accepted("eta.predict", {"items": items})
     try:
         df = pd.DataFrame(items)
         preds = _predict_dataframe(df)
@@ -52,6 +84,21 @@ def predict():
     except Exception as e:
         return jsonify(message="Prediction error", error=str(e)), 400
 
+def bulk_predict_job(ctx):
+    """Traitement "eta.predict" : prédiction par chunks, CSV (index, eta_hours) écrit au fil de l'eau."""
+    items = ctx.params["items"]
+    total = len(items)
+    path = ctx.path("csv", "text/csv; charset=utf-8")
+    with open(path, "w", encoding="utf-8") as out:
+        out.write("index,eta_hours\n")
+        for start in range(0, total, ETA_JOB_CHUNK_ROWS):
+            preds = _predict_dataframe(pd.DataFrame(items[start:start + ETA_JOB_CHUNK_ROWS]))
+            out.writelines(f"{start + i},{v}\n" for i, v in enumerate(preds))
+            out.flush()
+            done = start + len(preds)
+            ctx.progress(done, total, message=f"{done}/{total} lignes", partial={"n_done": done})
+    return {"n": total, "model_version": _MODEL_VERSION}
+
 @bp_eta.get("/predict-by-id")
 @jwt_required()
 def predict_by_id():
@@ -60,18 +107,16 @@ def predict_by_id():
     if not shipment_id:
         return jsonify(message="shipment_id is required"), 400
 
-    # l'objet engine vient de app.py (on l'injectera via current_app)
-    from flask import current_app
-    engine = current_app.config.get("_ENGINE")
+    # engine "analytics" créé par app.py (current_app.config["_ENGINES"])
+    engine = db.get_engine("analytics")
     if engine is None:
         return jsonify(message="DB engine not available"), 500
 
     try:
-        q = text("SELECT * FROM fv_train_eta WHERE shipment_id = :sid LIMIT 1")
-        df = pd.read_sql(q, engine, params={"sid": shipment_id})
-        if df.empty:
+        row = db.fetch_one_dict(SQL_BY_ID, {"sid": shipment_id}, eng=engine)
+        if row is None:
             return jsonify(message="shipment_id not found in fv_train_eta"), 404
-        preds = _predict_dataframe(df)
+        preds = _predict_dataframe(pd.DataFrame([row]))
         return jsonify(shipment_id=shipment_id, eta_hours=preds[0], model_version=_MODEL_VERSION), 200
     except Exception as e:
         return jsonify(message="DB/prediction error", error=str(e)), 400
@@ -80,9 +125,9 @@ def predict_by_id():
 
 @bp_eta.get("/distincts")
 @jwt_required()
+@shared_cache.cached(ttl=DISTINCTS_CACHE_TTL, tables=("shipments", "carrier_profiles"))
 def distincts():
-    from flask import current_app
-    engine = current_app.config.get("_ENGINE")
+    engine = db.get_engine("analytics")
     q = """
     SELECT
       ARRAY(SELECT DISTINCT origin FROM fv_train_eta LIMIT 500) AS origin,
@@ -90,29 +135,21 @@ def distincts():
       ARRAY(SELECT DISTINCT carrier FROM fv_train_eta LIMIT 500) AS carrier,
       ARRAY(SELECT DISTINCT service_level FROM fv_train_eta LIMIT 500) AS service_level
     """
-    df = pd.read_sql(text(q), engine)
-    row = df.iloc[0].to_dict()
+    row = db.fetch_one_dict(q, eng=engine)
     return jsonify({k: [x for x in v if x is not None] for k, v in row.items()})
 
 
 @bp_eta.get("/shipments")
 @jwt_required()
 def list_shipments():
-    from flask import current_app, request, jsonify
-    from sqlalchemy import text
-    import pandas as pd
-
-    engine = current_app.config.get("_ENGINE")
-    lim = int(request.args.get("limit", 200))
-
-    # ship_dt peut s'appeler autrement chez toi ; adapte si besoin
-    q = text("""
-        SELECT shipment_id
-        FROM fv_train_eta
-        WHERE shipment_id IS NOT NULL
-        ORDER BY ship_dt DESC NULLS LAST
-        LIMIT :lim
-    """)
-    df = pd.read_sql(q, engine, params={"lim": lim})
-    ids = df["shipment_id"].astype(str).tolist()
-    return jsonify({"shipment_ids": ids})
+    engine = db.get_engine("analytics")
+    # même tri / curseur que delay/list : (ship_dt, shipment_id) DESC
+    try:
+        page = parse_page(SHIPMENTS_KEYS, default_limit=200)
+    except PageError as e:
+        return jsonify(message=str(e)), 400
+
+    rows = db.fetch_dicts(SQL_SHIPMENTS, page.params(), eng=engine)
+    rows, next_cursor = page.split(rows)
+    ids = [str(r["shipment_id"]) for r in rows]
+    return jsonify({"shipment_ids": ids, "next_cursor": next_cursor})
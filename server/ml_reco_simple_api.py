@@ -1,19 +1,38 @@
 # server/ml_reco_simple_api.py
-import os, json
-import numpy as np
-import pandas as pd
-import joblib
-from flask import Blueprint, jsonify, request, current_app
+from __future__ import annotations
+
+import csv, itertools, math, os
+from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
 from sqlalchemy import text
 
+import db
+import jobs
+import lazy
+import matviews
+import model_store
+import shared_cache
+from jobs_api import accepted
+from serialization import json_response, encode_record
+
 bp_reco_simple = Blueprint("bp_reco_simple", __name__, url_prefix="/api/ml/reco-simple")
 
+DISTINCTS_CACHE_TTL = 300  # s, cache partagé entre workers (shared_cache)
+
+RECO_SWEEP_MAX_SCENARIOS = int(os.getenv("RECO_SWEEP_MAX_SCENARIOS", "2000"))
+jobs.register("reco.sweep", "ml_reco_simple_api:sweep_job", concurrency=1, memory_mb=4096, per_user=1)
+
 HERE = os.path.dirname(os.path.abspath(__file__))
 ETA_MODEL_PATH  = os.path.join(HERE, "models", "eta_carrier_lgbm.joblib")
 COST_MODEL_PATH = os.path.join(HERE, "models", "cost_lgbm.joblib")
 META_PATH       = os.path.join(HERE, "models", "reco_meta.json")
 
+model_store.register("reco_eta", ETA_MODEL_PATH, META_PATH)
+model_store.register("reco_cost", COST_MODEL_PATH, META_PATH, required=False)
+
+np = lazy.module("numpy")
+pd = lazy.module("pandas")
+
 _ETA = None
 _COST = None
 _META = None
@@ -21,14 +40,13 @@ _META = None
 def _load():
     global _ETA, _COST, _META
     if _META is None:
-        with open(META_PATH, "r", encoding="utf-8") as f:
-            _META = json.load(f)
+        _META = model_store.meta("reco_eta")
     if _ETA is None:
-        _ETA = joblib.load(ETA_MODEL_PATH)
-    if _COST is None and os.path.exists(COST_MODEL_PATH):
+        _ETA = model_store.get("reco_eta")
+    if _COST is None:
         try:
-            _COST = joblib.load(COST_MODEL_PATH)
-        except Exception:
+            _COST = model_store.get("reco_cost")  # None si le fichier est absent
+        except model_store.ModelUnavailable:
             _COST = None
 
 # Features d’entrée modèle
@@ -76,22 +94,21 @@ def _alias_bag(s: str) -> set:
     # Si service inconnu → on essaie tel quel + quelques aliases génériques
     return {s2, "STANDARD", "ECONOMY", "EXPRESS"}
 
+SQL_GLOBAL_MEDIANS = """
+    SELECT
+      PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY p50_eta_h) AS med_p50,
+      PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY p90_eta_h) AS med_p90,
+      PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY delay_rate) AS med_delay
+    FROM fv_lane_carrier_stats
+"""
+
 def _fetch_global_lane_medians(eng):
     """
     Médianes globales de secours depuis fv_lane_carrier_stats (toutes lanes confondues).
     """
-    q = text("""
-        SELECT
-          PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY p50_eta_h) AS med_p50,
-          PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY p90_eta_h) AS med_p90,
-          PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY delay_rate) AS med_delay
-        FROM fv_lane_carrier_stats
-    """)
-    with eng.connect() as c:
-        r = pd.read_sql(q, c)
-    if r.empty:
+    x = db.fetch_one_dict(SQL_GLOBAL_MEDIANS, eng=eng)
+    if x is None:
         return {"med_p50": 0.0, "med_p90": 0.0, "med_delay": 0.1}
-    x = r.iloc[0].to_dict()
     return {
         "med_p50": float(x.get("med_p50") or 0.0),
         "med_p90": float(x.get("med_p90") or 0.0),
@@ -137,49 +154,96 @@ def _fill_defaults(df: pd.DataFrame, fallbacks: dict, dist: float, wt: float) ->
 
     return d
 
+# Candidats /recommend, du plus strict au plus large :
+#   1) lane + service (alias) exacts
+#   2) même service (alias), stats “globales” par carrier+service
+#   3) n'importe quel transporteur (service ignoré), stats globales par carrier
+SQL_STAGE1 = """
+    SELECT
+      :origin AS origin, :dest AS destination_zone,
+      cp.carrier,
+      cp.service_level,
+      (1.0 - COALESCE(cp.exception_rate, 0.15))::double precision AS on_time_rate,
+      (COALESCE(cp.base_rate_per_km,0) * :dist
+       + COALESCE(cp.surcharge_per_kg,0) * :wt)::double precision AS cp_cost_baseline_eur,
+      1.0::double precision AS capacity_score,
+      lcs.p50_eta_h, lcs.p90_eta_h, lcs.delay_rate
+    FROM carrier_profiles cp
+    LEFT JOIN fv_lane_carrier_stats lcs
+      ON lcs.carrier=cp.carrier
+     AND lcs.service_level=cp.service_level
+     AND UPPER(lcs.origin)=UPPER(:origin)
+     AND UPPER(lcs.destination_zone)=UPPER(:dest)
+    WHERE UPPER(TRIM(cp.service_level)) = ANY(:svcalias)
+"""
+
+SQL_STAGE2 = """
+    SELECT
+      :origin AS origin, :dest AS destination_zone,
+      cp.carrier,
+      cp.service_level,
+      (1.0 - COALESCE(cp.exception_rate, 0.15))::double precision AS on_time_rate,
+      (COALESCE(cp.base_rate_per_km,0) * :dist
+       + COALESCE(cp.surcharge_per_kg,0) * :wt)::double precision AS cp_cost_baseline_eur,
+      1.0::double precision AS capacity_score,
+      -- agrégation globale par carrier+service
+      AVG(lcs.p50_eta_h) AS p50_eta_h,
+      AVG(lcs.p90_eta_h) AS p90_eta_h,
+      AVG(lcs.delay_rate) AS delay_rate
+    FROM carrier_profiles cp
+    LEFT JOIN fv_lane_carrier_stats lcs
+      ON lcs.carrier=cp.carrier
+     AND lcs.service_level=cp.service_level
+    WHERE UPPER(TRIM(cp.service_level)) = ANY(:svcalias)
+    GROUP BY cp.carrier, cp.service_level, cp.exception_rate, cp.base_rate_per_km, cp.surcharge_per_kg
+"""
+
+SQL_STAGE3 = """
+    SELECT
+      :origin AS origin, :dest AS destination_zone,
+      cp.carrier,
+      cp.service_level,
+      (1.0 - COALESCE(cp.exception_rate, 0.15))::double precision AS on_time_rate,
+      (COALESCE(cp.base_rate_per_km,0) * :dist
+       + COALESCE(cp.surcharge_per_kg,0) * :wt)::double precision AS cp_cost_baseline_eur,
+      1.0::double precision AS capacity_score,
+      -- stats moyennes multi-services par carrier
+      AVG(lcs.p50_eta_h) AS p50_eta_h,
+      AVG(lcs.p90_eta_h) AS p90_eta_h,
+      AVG(lcs.delay_rate) AS delay_rate
+    FROM carrier_profiles cp
+    LEFT JOIN fv_lane_carrier_stats lcs
+      ON lcs.carrier=cp.carrier
+    GROUP BY cp.carrier, cp.service_level, cp.exception_rate, cp.base_rate_per_km, cp.surcharge_per_kg
+"""
+
 # --------------------------------- API ---------------------------------
 
 @bp_reco_simple.get("/distincts")
 @jwt_required()
+@shared_cache.cached(ttl=DISTINCTS_CACHE_TTL, tables=("shipments", "carrier_profiles"))
 def distincts():
     """Options pour listes déroulantes."""
-    eng = current_app.config.get("_ENGINE")
+    eng = db.get_engine("analytics")
     q1 = "SELECT DISTINCT origin FROM shipments WHERE origin IS NOT NULL ORDER BY 1 LIMIT 500"
     q2 = "SELECT DISTINCT destination_zone FROM shipments WHERE destination_zone IS NOT NULL ORDER BY 1 LIMIT 500"
     q3 = "SELECT DISTINCT service_level FROM carrier_profiles WHERE service_level IS NOT NULL ORDER BY 1 LIMIT 200"
-    with eng.connect() as c:
-        o = pd.read_sql(text(q1), c)["origin"].astype(str).tolist()
-        d = pd.read_sql(text(q2), c)["destination_zone"].astype(str).tolist()
-        s = pd.read_sql(text(q3), c)["service_level"].astype(str).tolist()
+    o = [str(v) for v in db.fetch_column(q1, eng=eng)]
+    d = [str(v) for v in db.fetch_column(q2, eng=eng)]
+    s = [str(v) for v in db.fetch_column(q3, eng=eng)]
     return jsonify({"origin": o, "destination_zone": d, "service_level": s})
 
-@bp_reco_simple.post("/recommend")
-@jwt_required()
-def recommend():
+# Poids du score (inchangés)
+W_COST, W_ETA, W_RISK = 0.5, 0.35, 0.15
+REQUIRED = ["origin","destination_zone","service_level","distance_km","weight_kg"]
+
+def rank_candidates(eng, data: dict, glb: dict = None):
     """
-    Body attendu (simple):
-    {
-      "origin": "...", "destination_zone": "...", "service_level": "...",
-      "distance_km": 500, "weight_kg": 120, "volume_m3": 1.2,
-      "total_units": 10, "n_lines": 3, "ship_dow": 2, "ship_hour": 10,
-      "topk": 5
-    }
-    Retourne: best (top 1) + topK (liste) avec score combiné coût+ETA+risque.
-    Garantit une reco même si la lane/service exact n’existe pas (fallbacks).
+    Candidats transporteurs scorés pour un envoi, triés par score croissant.
+    Renvoie (DataFrame | None si aucun transporteur, diagnostics).
+    `glb` : médianes globales déjà lues (réutilisées par les simulations).
     """
     _load()
-    eng = current_app.config.get("_ENGINE")
-    data = request.get_json(force=True) or {}
-
-    required = ["origin","destination_zone","service_level","distance_km","weight_kg"]
-    miss = [k for k in required if k not in data]
-    if miss:
-        return jsonify(message=f"Champs manquants: {miss}"), 400
-
-    # Poids du score (inchangés)
-    w_cost, w_eta, w_risk = 0.5, 0.35, 0.15
-    topk = int(data.get("topk", 5))
-
     origin = (data["origin"] or "").strip()
     dest   = (data["destination_zone"] or "").strip()
     svc_in = (data["service_level"] or "").strip()
@@ -192,32 +256,22 @@ def recommend():
     wt   = float(data.get("weight_kg", 0.0))
 
     # Médianes globales de secours
-    glb = _fetch_global_lane_medians(eng)
-
-    diagnostics = {"stage": None}
+    if glb is None:
+        glb = _fetch_global_lane_medians(eng)
+
+    diagnostics = {
+        "origin": origin,
+        "destination_zone": dest,
+        "service_level_input": svc_in,
+        "service_level_used": svc_canon,
+        "stage": "lane_exact",
+        "fallback_medians": glb,
+    }
 
     # ----------------- STAGE 1: candidats stricts lane + service (alias) -----------------
-    q1 = text("""
-        SELECT
-          :origin AS origin, :dest AS destination_zone,
-          cp.carrier,
-          cp.service_level,
-          (1.0 - COALESCE(cp.exception_rate, 0.15))::double precision AS on_time_rate,
-          (COALESCE(cp.base_rate_per_km,0) * :dist
-           + COALESCE(cp.surcharge_per_kg,0) * :wt)::double precision AS cp_cost_baseline_eur,
-          1.0::double precision AS capacity_score,
-          lcs.p50_eta_h, lcs.p90_eta_h, lcs.delay_rate
-        FROM carrier_profiles cp
-        LEFT JOIN fv_lane_carrier_stats lcs
-          ON lcs.carrier=cp.carrier
-         AND lcs.service_level=cp.service_level
-         AND UPPER(lcs.origin)=UPPER(:origin)
-         AND UPPER(lcs.destination_zone)=UPPER(:dest)
-        WHERE UPPER(TRIM(cp.service_level)) = ANY(:svcalias)
-    """)
     with eng.connect() as c:
         cands = pd.read_sql(
-            q1, c,
+            text(SQL_STAGE1), c,
             params={
                 "origin": origin, "dest": dest, "dist": dist, "wt": wt,
                 "svcalias": list(svc_aliases)
@@ -227,62 +281,23 @@ def recommend():
     if cands.empty:
         diagnostics["stage"] = "fallback_lane_agnostic_same_service"
         # -------- STAGE 2: même service (alias), stats “globales” par carrier+service --------
-        q2 = text("""
-            SELECT
-              :origin AS origin, :dest AS destination_zone,
-              cp.carrier,
-              cp.service_level,
-              (1.0 - COALESCE(cp.exception_rate, 0.15))::double precision AS on_time_rate,
-              (COALESCE(cp.base_rate_per_km,0) * :dist
-               + COALESCE(cp.surcharge_per_kg,0) * :wt)::double precision AS cp_cost_baseline_eur,
-              1.0::double precision AS capacity_score,
-              -- agrégation globale par carrier+service
-              AVG(lcs.p50_eta_h) AS p50_eta_h,
-              AVG(lcs.p90_eta_h) AS p90_eta_h,
-              AVG(lcs.delay_rate) AS delay_rate
-            FROM carrier_profiles cp
-            LEFT JOIN fv_lane_carrier_stats lcs
-              ON lcs.carrier=cp.carrier
-             AND lcs.service_level=cp.service_level
-            WHERE UPPER(TRIM(cp.service_level)) = ANY(:svcalias)
-            GROUP BY cp.carrier, cp.service_level, cp.exception_rate, cp.base_rate_per_km, cp.surcharge_per_kg
-        """)
         with eng.connect() as c:
             cands = pd.read_sql(
-                q2, c,
+                text(SQL_STAGE2), c,
                 params={"origin": origin, "dest": dest, "dist": dist, "wt": wt, "svcalias": list(svc_aliases)}
             )
 
     if cands.empty:
         diagnostics["stage"] = "fallback_any_carrier_any_service"
         # -------- STAGE 3: n'importe quel transporteur (service ignoré), stats globales par carrier --------
-        q3 = text("""
-            SELECT
-              :origin AS origin, :dest AS destination_zone,
-              cp.carrier,
-              cp.service_level,
-              (1.0 - COALESCE(cp.exception_rate, 0.15))::double precision AS on_time_rate,
-              (COALESCE(cp.base_rate_per_km,0) * :dist
-               + COALESCE(cp.surcharge_per_kg,0) * :wt)::double precision AS cp_cost_baseline_eur,
-              1.0::double precision AS capacity_score,
-              -- stats moyennes multi-services par carrier
-              AVG(lcs.p50_eta_h) AS p50_eta_h,
-              AVG(lcs.p90_eta_h) AS p90_eta_h,
-              AVG(lcs.delay_rate) AS delay_rate
-            FROM carrier_profiles cp
-            LEFT JOIN fv_lane_carrier_stats lcs
-              ON lcs.carrier=cp.carrier
-            GROUP BY cp.carrier, cp.service_level, cp.exception_rate, cp.base_rate_per_km, cp.surcharge_per_kg
-        """)
         with eng.connect() as c:
             cands = pd.read_sql(
-                q3, c,
+                text(SQL_STAGE3), c,
                 params={"origin": origin, "dest": dest, "dist": dist, "wt": wt}
             )
 
     if cands.empty:
-        # Si vraiment personne en base → renvoie un message explicite plutôt que 404
-        return jsonify(message="Aucun transporteur disponible dans carrier_profiles."), 200
+        return None, diagnostics
 
     # Remplir valeurs par défaut robustes
     cands = _fill_defaults(cands, glb, dist, wt)
@@ -313,7 +328,7 @@ def recommend():
     eta_n  = _mm(eta_pred)
     risk_n = _mm(risk)  # pour être homogène, même si risk est déjà [0..1] en pratique
 
-    score  = w_cost*cost_n + w_eta*eta_n + w_risk*risk_n
+    score  = W_COST*cost_n + W_ETA*eta_n + W_RISK*risk_n
 
     out = cands.copy()
     out["cost_pred"]  = cost_pred
@@ -322,20 +337,98 @@ def recommend():
     out["score"]      = score
 
     out = out.sort_values("score", ascending=True).reset_index(drop=True)
-    top = out.head(topk).to_dict(orient="records")
-    best = top[0] if top else None
+    diagnostics["n_candidates"] = int(len(out))
+    return out, diagnostics
 
-    return jsonify({
-        "weights": {"cost": w_cost, "eta": w_eta, "risk": w_risk},
-        "best": best,
+@bp_reco_simple.post("/recommend")
+@jwt_required()
+def recommend():
+    """
+    Body attendu (simple):
+    {
+      "origin": "...", "destination_zone": "...", "service_level": "...",
+      "distance_km": 500, "weight_kg": 120, "volume_m3": 1.2,
+      "total_units": 10, "n_lines": 3, "ship_dow": 2, "ship_hour": 10,
+      "topk": 5
+    }
+    Retourne: best (top 1) + topK (liste) avec score combiné coût+ETA+risque.
+    Garantit une reco même si la lane/service exact n’existe pas (fallbacks).
+    """
+    eng = db.get_engine("analytics")
+    data = request.get_json(force=True) or {}
+
+    miss = [k for k in REQUIRED if k not in data]
+    if miss:
+        return jsonify(message=f"Champs manquants: {miss}"), 400
+    topk = int(data.get("topk", 5))
+
+    out, diagnostics = rank_candidates(eng, data)
+    if out is None:
+        # Si vraiment personne en base → renvoie un message explicite plutôt que 404
+        return jsonify(message="Aucun transporteur disponible dans carrier_profiles."), 200
+    top = out.head(topk)
+
+    return json_response({
+        "weights": {"cost": W_COST, "eta": W_ETA, "risk": W_RISK},
+        "best": encode_record(top),
         "topK": top,
-        "diagnostics": {
-            "origin": origin,
-            "destination_zone": dest,
-            "service_level_input": svc_in,
-            "service_level_used": svc_canon,
-            "stage": diagnostics.get("stage") or "lane_exact",
-            "fallback_medians": glb,
-            "n_candidates": int(len(out)),
-        }
+        "as_of": matviews.as_of(eng, "fv_lane_carrier_stats"),
+        "diagnostics": diagnostics,
     })
+
+# ------------------------------ Simulations what-if ------------------------------
+
+SWEEP_COLUMNS = ["carrier", "service_level", "cost_pred", "eta_pred_h", "risk", "score"]
+
+def _scenarios(base: dict, vary: dict):
+    keys = list(vary)
+    for combo in itertools.product(*(vary[k] for k in keys)):
+        yield {**base, **dict(zip(keys, combo))}
+
+def sweep_job(ctx):
+    """
+    Traitement "reco.sweep" : meilleur transporteur pour chaque combinaison de
+    `vary` appliquée à `base` ; une ligne CSV par scénario, écrite au fil de l'eau.
+    """
+    base, vary = ctx.params["base"], ctx.params["vary"]
+    total = math.prod(len(v) for v in vary.values())
+    glb = _fetch_global_lane_medians(ctx.eng)
+    cols = list(vary) + SWEEP_COLUMNS + ["stage", "n_candidates"]
+    best_cost = None
+    with open(ctx.path("csv", "text/csv; charset=utf-8"), "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(cols)
+        for i, data in enumerate(_scenarios(base, vary), start=1):
+            out, diag = rank_candidates(ctx.eng, data, glb)
+            best = {} if out is None else out.iloc[0].to_dict()
+            w.writerow([data[k] for k in vary] + [best.get(c) for c in SWEEP_COLUMNS]
+                       + [diag["stage"], diag.get("n_candidates", 0)])
+            f.flush()
+            if best and (best_cost is None or best["cost_pred"] < best_cost["cost_pred"]):
+                best_cost = {**{k: data[k] for k in vary}, "carrier": best["carrier"],
+                             "cost_pred": float(best["cost_pred"]), "eta_pred_h": float(best["eta_pred_h"])}
+            ctx.progress(i, total, message=f"{i}/{total} scénarios",
+                         partial={"scenarios_done": i, "cheapest": best_cost})
+    return {"scenarios": total, "cheapest": best_cost}
+
+@bp_reco_simple.post("/sweep")
+@jwt_required()
+def sweep():
+    """
+    Simulation what-if asynchrone (202 + /api/jobs/<id>) :
+    { "base": {corps de /recommend}, "vary": {"weight_kg": [100, 500, 1000], "ship_hour": [8, 14]} }
+    Au plus RECO_SWEEP_MAX_SCENARIOS combinaisons.
+    """
+    data = request.get_json(force=True) or {}
+    base, vary = data.get("base") or {}, data.get("vary") or {}
+    if not isinstance(base, dict) or not isinstance(vary, dict) or not vary:
+        return jsonify(message="Body attendu : {'base': {...}, 'vary': {champ: [valeurs]}}"), 400
+    if not all(isinstance(v, list) and v for v in vary.values()):
+        return jsonify(message="Chaque entrée de 'vary' doit être une liste non vide"), 400
+    miss = [k for k in REQUIRED if k not in base and k not in vary]
+    if miss:
+        return jsonify(message=f"Champs manquants: {miss}"), 400
+    n = math.prod(len(v) for v in vary.values())
+    if n > RECO_SWEEP_MAX_SCENARIOS:
+        return jsonify(message=f"{n} scénarios (max {RECO_SWEEP_MAX_SCENARIOS})"), 400
+    return accepted("reco.sweep", {"base": base, "vary": vary})
@@ -0,0 +1,227 @@
+# server/model_store.py
+"""
+Registre des modèles ML : chargement différé, préchauffage en tâche de fond,
+état exposé par /api/ready.
+
+`ml_eta_api` faisait `joblib.load` à l'import : chaque démarrage de conteneur
+bloquait plusieurs secondes (import de sklearn / lightgbm + désérialisation)
+avant d'ouvrir le port, et les autres blueprints chargeaient leur modèle à la
+première requête, aux frais d'un utilisateur. Ici les blueprints déclarent
+leurs modèles (`register`) sans rien charger ; `start()` (app.py) les charge
+selon MODEL_WARMUP :
+  background  thread de fond : chargement puis un predict de préchauffage par
+              modèle (défaut) ; /api/ready répond 503 tant que ce n'est pas fini
+  eager       chargement bloquant au démarrage (échec visible immédiatement)
+  lazy        au premier `get()` ; /api/ready ne dépend pas des modèles
+
+`get(name)` renvoie le modèle instrumenté (metrics.TimedModel), en le chargeant
+si besoin (un seul chargement même si plusieurs threads le demandent). Un même
+fichier servi sous plusieurs noms (eta_lgbm.joblib : eta et delay_eta) n'est
+désérialisé qu'une fois.
+
+États : pending -> loading -> ready | failed | missing (modèle optionnel absent).
+"""
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import lazy
+import metrics
+
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "background")
+# bibliothèques dont /api/ready indique si elles sont déjà importées
+HEAVY_MODULES = ("numpy", "pandas", "sklearn", "lightgbm", "joblib", "pyarrow")
+
+LOAD_SECONDS = metrics.register(metrics.Histogram(
+    "logiops_model_load_seconds", "Chargement d'un modèle (désérialisation + préchauffage)", ("model", "phase"),
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+
+
+class ModelUnavailable(RuntimeError):
+    """Modèle obligatoire absent ou en échec de chargement."""
+
+
+class _Entry:
+    def __init__(self, name: str, path: str, meta_path: str = None, required: bool = True):
+        self.name = name
+        self.path = path
+        self.meta_path = meta_path
+        self.required = required
+        self.state = "pending"
+        self.model = None
+        self.meta = None
+        self.error = None
+        self.warmup_error = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+
+_entries = {}
+_raw = {}                # chemin -> objet désérialisé (partagé entre noms)
+_raw_lock = threading.Lock()
+_thread = None
+_started = time.time()
+
+
+def register(name: str, path: str, meta_path: str = None, required: bool = True):
+    """Déclare un modèle (sans le charger) ; idempotent."""
+    if name not in _entries:
+        _entries[name] = _Entry(name, path, meta_path, required)
+    return _entries[name]
+
+
+def _entry(name: str) -> _Entry:
+    e = _entries.get(name)
+    if e is None:
+        raise KeyError(f"modèle non déclaré : {name}")
+    return e
+
+
+def meta(name: str) -> dict:
+    """Métadonnées JSON du modèle (features, version) ; lecture seule, sans charger le modèle."""
+    e = _entry(name)
+    if e.meta is None and e.meta_path:
+        with open(e.meta_path, "r", encoding="utf-8") as f:
+            e.meta = json.load(f)
+    return e.meta or {}
+
+
+def _deserialize(path: str):
+    with _raw_lock:
+        obj = _raw.get(path)
+        if obj is None:
+            import joblib  # importe sklearn / lightgbm au passage : jamais à l'import de l'app
+            obj = _raw[path] = joblib.load(path)
+        return obj
+
+
+def _walk(obj, depth: int = 0):
+    """Le modèle et ses étapes (Pipeline, ColumnTransformer), pour retrouver les encodeurs."""
+    if depth > 4 or obj is None:
+        return
+    yield obj
+    for attr in ("steps", "transformers_"):
+        for step in getattr(obj, attr, None) or ():
+            yield from _walk(step[1], depth + 1)
+
+
+def _sample(model, info: dict):
+    """Une ligne d'entrée plausible : modalités connues des encodeurs, 1.0 pour le numérique."""
+    pd = lazy.module("pandas")
+    vocab = {}
+    for o in _walk(model):
+        cats, names = getattr(o, "categories_", None), getattr(o, "feature_names_in_", None)
+        if cats is not None and names is not None:
+            for n, c in zip(names, cats):
+                if len(c):
+                    vocab.setdefault(str(n), c[0])
+    numeric = set(info.get("numeric", []))
+    row = {f: vocab.get(f, 1.0 if f in numeric else 0) for f in info.get("features", [])}
+    return pd.DataFrame([row])
+
+
+def _load(e: _Entry):
+    with e.lock:
+        if e.state in ("ready", "failed", "missing"):
+            return
+        if not os.path.exists(e.path):
+            e.state = "failed" if e.required else "missing"
+            e.error = f"fichier absent : {os.path.basename(e.path)}"
+            return
+        e.state = "loading"
+        t0 = time.perf_counter()
+        try:
+            info = meta(e.name)
+            raw = _deserialize(e.path)
+            e.load_ms = (time.perf_counter() - t0) * 1000.0
+            LOAD_SECONDS.observe(e.load_ms / 1000.0, e.name, "load")
+        except Exception as ex:
+            e.state, e.error = "failed", f"{type(ex).__name__}: {ex}"
+            print(f"[model_store] {e.name} : chargement en échec ({e.error})", file=sys.stderr)
+            return
+        # préchauffage sur le modèle brut : hors métriques de predict et hors échéance de requête
+        t1 = time.perf_counter()
+        try:
+            if info.get("features"):
+                raw.predict(_sample(raw, info))
+        except Exception as ex:  # modèle utilisable, seul le préchauffage a échoué
+            e.warmup_error = f"{type(ex).__name__}: {ex}"
+        e.warmup_ms = (time.perf_counter() - t1) * 1000.0
+        LOAD_SECONDS.observe(e.warmup_ms / 1000.0, e.name, "warmup")
+        e.model = metrics.instrument_model(e.name, raw)
+        e.loaded_at = datetime.now(timezone.utc)
+        e.state = "ready"
+
+
+def get(name: str):
+    """Modèle instrumenté (chargé si besoin) ; None si optionnel et absent, ModelUnavailable si en échec."""
+    e = _entry(name)
+    if e.state != "ready":
+        _load(e)
+    if e.state == "missing":
+        return None
+    if e.state != "ready":
+        raise ModelUnavailable(f"{name} : {e.error}")
+    return e.model
+
+
+def warm_all():
+    for e in list(_entries.values()):
+        _load(e)
+
+
+def start():
+    """Applique MODEL_WARMUP (à appeler une fois les blueprints importés)."""
+    global _thread
+    if MODEL_WARMUP == "eager":
+        warm_all()
+    elif MODEL_WARMUP == "background" and _thread is None:
+        _thread = threading.Thread(target=warm_all, name="model-warmup", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def wait(timeout: float = None) -> bool:
+    """Attend la fin du préchauffage de fond (bench, tests) ; True si tout est prêt."""
+    if _thread is not None:
+        _thread.join(timeout)
+    return ready()
+
+
+def ready() -> bool:
+    """Tous les modèles chargés (un modèle optionnel absent ou en échec ne bloque pas)."""
+    if MODEL_WARMUP == "lazy":
+        return True
+    for e in _entries.values():
+        if e.state in ("pending", "loading") or (e.required and e.state == "failed"):
+            return False
+    return True
+
+
+def status() -> dict:
+    models = {}
+    for e in _entries.values():
+        info = meta(e.name) if e.meta_path else {}
+        models[e.name] = {
+            "state": e.state,
+            "required": e.required,
+            "file": os.path.basename(e.path),
+            "version": info.get("generated_at"),
+            "load_ms": e.load_ms,
+            "warmup_ms": e.warmup_ms,
+            "loaded_at": e.loaded_at,
+            "error": e.error,
+            "warmup_error": e.warmup_error,
+        }
+    return {
+        "ready": ready(),
+        "mode": MODEL_WARMUP,
+        "uptime_s": round(time.time() - _started, 3),
+        "models": models,
+        "imports": {m: lazy.loaded(m) for m in HEAVY_MODULES},
+    }
@@ -0,0 +1,125 @@
+# server/pagination.py
+"""
+Pagination par clé (keyset) commune aux listes de l'API.
+
+Contrat (query string) :
+  limit   taille de page, bornée côté serveur à PAGE_SIZE_MAX
+  cursor  jeton opaque renvoyé par la page précédente (`next_cursor`)
+  from    borne basse incluse (ISO 8601)
+  to      borne haute exclue (ISO 8601)
+
+Le curseur encode la clé de tri de la dernière ligne servie, par ex.
+(ship_dt, shipment_id) ou event_id, en JSON base64url. Au décodage, chaque
+valeur est validée selon le type de sa clé (CURSOR_TYPES) : un curseur altéré
+donne un 400, pas une DataError Postgres. La page suivante est
+lue par un prédicat de seek `(k1, k2) < (:c1, :c2)` sur l'index de tri : la
+page N coûte le même prix que la page 1 (pas d'OFFSET).
+
+Les prédicats optionnels s'écrivent `(CAST(:x AS ...) IS NULL OR ...)` :
+psycopg2 interpole les paramètres côté client, le planner voit donc des
+littéraux et élimine les branches inutiles.
+"""
+import base64
+import json
+import os
+from datetime import datetime, timezone
+
+from flask import request
+
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "500"))
+# type de chaque clé de tri : "int" | "datetime" | "str"
+CURSOR_TYPES = {"event_id": "int", "ship_dt": "datetime", "shipment_id": "str"}
+
+
+class PageError(ValueError):
+    """Paramètre de pagination invalide (-> 400)."""
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(token: str, keys) -> dict:
+    try:
+        pad = "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(token + pad))
+    except Exception:
+        raise PageError("cursor invalide")
+    if not isinstance(values, dict) or set(values) != set(keys):
+        raise PageError("cursor invalide pour cette liste")
+    return {k: _cursor_value(k, v) for k, v in values.items()}
+
+
+def _cursor_value(key: str, v):
+    kind = CURSOR_TYPES.get(key, "str")
+    if kind == "int" and isinstance(v, int) and not isinstance(v, bool) and -2**63 <= v < 2**63:  # bigint
+        return v
+    if kind == "str" and isinstance(v, str):
+        return v
+    if kind == "datetime" and isinstance(v, str) and v:
+        try:
+            return _parse_time(v)
+        except PageError:
+            pass
+    raise PageError(f"cursor invalide : {key}")
+
+
+def _parse_time(v: str):
+    if not v:
+        return None
+    try:
+        dt = datetime.fromisoformat(v.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise PageError(f"date invalide : {v}")
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class Page:
+    """Paramètres d'une page : limite, clé de reprise, fenêtre temporelle."""
+
+    def __init__(self, limit: int, keys, after: dict = None, t_from=None, t_to=None):
+        self.limit = limit
+        self.keys = tuple(keys)
+        self.after = after
+        self.t_from = t_from
+        self.t_to = t_to
+
+    def params(self) -> dict:
+        """Paramètres SQL : :lim (limit + 1 pour détecter la page suivante ; None =
+        LIMIT ALL), :t_from, :t_to et un :c_<clé> par colonne de tri (None en page 1)."""
+        lim = None if self.limit is None else self.limit + 1
+        p = {"lim": lim, "t_from": self.t_from, "t_to": self.t_to}
+        for k in self.keys:
+            p[f"c_{k}"] = self.after[k] if self.after else None
+        return p
+
+    def split(self, rows):
+        """(lignes de la page, next_cursor) ; `rows` = DataFrame ou liste de dicts."""
+        if self.limit is None or len(rows) <= self.limit:
+            return rows, None
+        rows = rows.iloc[: self.limit] if hasattr(rows, "iloc") else rows[: self.limit]
+        last = rows.iloc[-1] if hasattr(rows, "iloc") else rows[-1]
+        values = {}
+        for k in self.keys:
+            v = last[k]
+            values[k] = v.isoformat() if hasattr(v, "isoformat") else (v.item() if hasattr(v, "item") else v)
+        return rows, encode_cursor(values)
+
+
+def parse_page(keys, default_limit, max_limit=PAGE_SIZE_MAX) -> Page:
+    """
+    Lit limit / cursor / from / to dans `request.args` (PageError si invalide).
+    `default_limit` / `max_limit` à None : pas de limite (exports en flux).
+    """
+    args = request.args
+    raw = args.get("limit", default_limit)
+    try:
+        limit = None if raw is None else int(raw)
+    except ValueError:
+        raise PageError("limit doit être un entier")
+    if limit is not None:
+        limit = max(1, limit if max_limit is None else min(limit, max_limit))
+    token = args.get("cursor")
+    after = decode_cursor(token, keys) if token else None
+    return Page(limit, keys, after, _parse_time(args.get("from")), _parse_time(args.get("to")))
@@ -0,0 +1,486 @@
+# server/partitions.py
+"""
+Partitionnement de shipment_events par plage de event_time (mensuel ou hebdo).
+
+shipment_events est un heap unique : les fenêtres LEAD / FIRST_VALUE de
+fv_phase_durations et de kpi counters le parcourent en entier et il grossit
+sans limite. Avec des partitions par event_time, les requêtes bornées par
+`logiops_active_since()` (fenêtre active, cf. migration v0009) n'ouvrent que
+les partitions récentes (pruning à l'exécution).
+
+  - `convert` / `unconvert` : conversion en ligne par lots (trigger de capture
+    pendant le backfill, bascule courte sous verrou) — migration v0008.
+    Le trigger fait un upsert (une ligne copiée par le backfill pendant un
+    UPDATE concurrent est remplacée par la nouvelle version) ; avant et pendant
+    la bascule, la copie est comparée à l'original par tranche de event_id
+    (nombre de lignes + somme de hachés des lignes) et les tranches divergentes
+    sont recopiées
+  - partition DEFAULT (`shipment_events_default`) : reçoit les événements hors
+    des plages créées (retardataires, antidatés, au-delà de l'horizon) au lieu
+    de faire échouer l'INSERT ; `maintain` les range dans leur partition
+  - `maintain` : pré-crée les partitions futures, détache / archive les anciennes
+  - maintenance périodique : tâche `partitions.maintain` du planificateur
+    (scheduler.py), toutes les MAINTENANCE_SECONDS
+
+Configuration :
+  PARTITION_INTERVAL           month | week (month)
+  PARTITION_AHEAD              nb de partitions futures à garder prêtes (3)
+  PARTITION_RETENTION          nb de partitions conservées attachées, 0 = tout (0)
+  PARTITION_ARCHIVE_SCHEMA     schéma des partitions détachées (archive)
+  PARTITION_MAINTENANCE_SECONDS  période de la maintenance planifiée, 0 = off (3600)
+  PARTITION_DETACH_LOCK_TIMEOUT_MS  attente max du verrou pour détacher une partition (5000)
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+import matviews
+
+TABLE = "shipment_events"
+NEW_TABLE = "shipment_events_new"
+OLD_TABLE = "shipment_events_old"
+# index gérés par la conversion : (nom, définition des colonnes)
+INDEXES = [
+    ("ix_shipment_events_shipment_time", "(shipment_id, event_time, event_id) INCLUDE (event_type)"),
+    ("ix_shipment_events_event_id", "(event_id)"),
+]
+
+INTERVAL = os.getenv("PARTITION_INTERVAL", "month")
+AHEAD = int(os.getenv("PARTITION_AHEAD", "3"))
+RETENTION = int(os.getenv("PARTITION_RETENTION", "0"))
+ARCHIVE_SCHEMA = os.getenv("PARTITION_ARCHIVE_SCHEMA", "archive")
+MAINTENANCE_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_SECONDS", "3600"))
+DETACH_LOCK_TIMEOUT_MS = int(os.getenv("PARTITION_DETACH_LOCK_TIMEOUT_MS", "5000"))
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+_MAINT_LOCK_KEY = 360_0003
+
+
+# ----------------------------------------------------------------------------
+# Bornes de partitions
+# ----------------------------------------------------------------------------
+def period_start(ts: datetime, interval: str = INTERVAL) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    if interval == "week":
+        d = ts.date() - timedelta(days=ts.weekday())  # lundi
+        return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+    return datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+
+
+def next_start(start: datetime, interval: str = INTERVAL) -> datetime:
+    if interval == "week":
+        return start + timedelta(days=7)
+    y, m = (start.year + 1, 1) if start.month == 12 else (start.year, start.month + 1)
+    return datetime(y, m, 1, tzinfo=timezone.utc)
+
+
+def partition_name(start: datetime, interval: str = INTERVAL, table: str = TABLE) -> str:
+    if interval == "week":
+        return f"{table}_w{start:%Y%m%d}"
+    return f"{table}_p{start:%Y%m}"
+
+
+def periods(lo: datetime, hi: datetime, interval: str = INTERVAL):
+    """Débuts de période couvrant [lo, hi]."""
+    cur = period_start(lo, interval)
+    while cur <= hi:
+        yield cur
+        cur = next_start(cur, interval)
+
+
+# ----------------------------------------------------------------------------
+# Catalogue
+# ----------------------------------------------------------------------------
+def is_partitioned(conn, table: str = TABLE) -> bool:
+    return bool(conn.execute(text("""
+        SELECT EXISTS (
+          SELECT 1 FROM pg_partitioned_table p
+          JOIN pg_class c ON c.oid = p.partrelid
+          WHERE c.relname = :t AND pg_table_is_visible(c.oid)
+        )
+    """), {"t": table}).scalar())
+
+
+def list_partitions(conn, table: str = TABLE) -> list:
+    """[(nom, borne_basse, borne_haute)] triées, d'après pg_get_expr(relpartbound)."""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :t AND pg_table_is_visible(p.oid)
+    """), {"t": table}).all()
+    out = []
+    for name, bound in rows:
+        # FOR VALUES FROM ('2025-08-01 00:00:00+00') TO ('2025-09-01 00:00:00+00')
+        parts = bound.split("'")
+        if len(parts) >= 4:
+            out.append((name, _parse_ts(parts[1]), _parse_ts(parts[3])))
+    return sorted(out, key=lambda x: x[1])
+
+
+def _parse_ts(s: str) -> datetime:
+    dt = datetime.fromisoformat(s.replace(" ", "T"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def has_default(conn, table: str = TABLE) -> bool:
+    return bool(conn.execute(text("""
+        SELECT EXISTS (
+          SELECT 1 FROM pg_partitioned_table p
+          JOIN pg_class c ON c.oid = p.partrelid
+          WHERE c.relname = :t AND pg_table_is_visible(c.oid) AND p.partdefid <> 0
+        )
+    """), {"t": table}).scalar())
+
+
+def create_default(conn, table: str = TABLE):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {table} DEFAULT"))
+
+
+def create_partition(conn, start: datetime, interval: str = INTERVAL, table: str = TABLE) -> str:
+    """
+    Crée la partition [start, fin de période). Si la partition DEFAULT contient
+    déjà des lignes de cette plage, elles y sont déplacées (un seul bloc DO :
+    atomique même sur une connexion en autocommit).
+    """
+    end = next_start(start, interval)
+    name = partition_name(start, interval, TABLE)
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    stranded = has_default(conn, table) and conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE event_time >= :lo AND event_time < :hi)"
+    ), {"lo": start, "hi": end}).scalar()
+    if not stranded:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES {bounds}"))
+        return name
+    conn.execute(text(f"""
+        DO $$
+        BEGIN
+          CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS);
+          WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE event_time >= '{start.isoformat()}' AND event_time < '{end.isoformat()}'
+            RETURNING *
+          )
+          INSERT INTO {name} SELECT * FROM moved;
+          ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds};
+        END $$
+    """))
+    return name
+
+
+def ensure_partitions(conn, lo: datetime, hi: datetime, interval: str = INTERVAL,
+                      table: str = TABLE) -> list:
+    """Crée les partitions manquantes sur [lo, hi] ; renvoie celles créées."""
+    existing = {n for n, _, _ in list_partitions(conn, table)}
+    created = []
+    for start in periods(lo, hi, interval):
+        name = partition_name(start, interval, TABLE)
+        if name not in existing:
+            create_partition(conn, start, interval, table)
+            created.append(name)
+    return created
+
+
+# ----------------------------------------------------------------------------
+# Maintenance
+# ----------------------------------------------------------------------------
+def maintain(eng, ahead: int = AHEAD, retention: int = RETENTION,
+             archive_schema: str = ARCHIVE_SCHEMA, out=None) -> dict:
+    """
+    Pré-crée `ahead` partitions futures ; si `retention` > 0, détache les partitions
+    au-delà des `retention` plus récentes (hors futures) et les range dans `archive_schema`.
+    No-op si la table n'est pas partitionnée ou si un autre process maintient déjà.
+    """
+    report = {"created": [], "archived": []}
+    lock = eng.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        if not lock.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _MAINT_LOCK_KEY}).scalar():
+            return report
+        if not is_partitioned(lock):
+            return report
+        now = datetime.now(timezone.utc)
+        horizon = now
+        for _ in range(ahead):
+            horizon = next_start(period_start(horizon), INTERVAL)
+        report["created"] = ensure_partitions(lock, now, horizon)
+        if has_default(lock):
+            # événements tombés dans DEFAULT : une partition par période représentée
+            # (à partir de la plus ancienne partition attachée, les plus vieux y restent)
+            parts = list_partitions(lock)
+            existing = {n for n, _, _ in parts}
+            starts = lock.execute(text(
+                f"SELECT DISTINCT date_trunc(:unit, event_time AT TIME ZONE 'UTC') FROM {DEFAULT_PARTITION}"
+            ), {"unit": INTERVAL}).scalars().all()
+            for start in sorted(st.replace(tzinfo=timezone.utc) for st in starts):
+                if parts and start >= parts[0][1] and partition_name(start) not in existing:
+                    report["created"].append(create_partition(lock, start))
+
+        if retention > 0:
+            parts = [p for p in list_partitions(lock) if p[1] <= now]
+            old = parts[:-retention] if len(parts) > retention else []
+            if old:
+                lock.execute(text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}"))
+            concurrently = not has_default(lock)
+            for name, _, _ in old:
+                if concurrently:
+                    # pas de verrou ACCESS EXCLUSIVE sur la table parente
+                    lock.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+                else:
+                    # CONCURRENTLY est refusé avec une partition DEFAULT : verrou bref, abandon
+                    # (nouvel essai à la prochaine maintenance) s'il n'est pas obtenu à temps
+                    lock.execute(text(f"SET lock_timeout = {int(DETACH_LOCK_TIMEOUT_MS)}"))
+                    try:
+                        lock.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+                    except Exception as e:
+                        if out is not None:
+                            print(f"[partitions] {name} non détachée : {e}", file=out)
+                        break
+                    finally:
+                        lock.execute(text("RESET lock_timeout"))
+                lock.execute(text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}"))
+                report["archived"].append(name)
+        if out is not None:
+            print(f"[partitions] créées={report['created']} archivées={report['archived']}", file=out)
+        return report
+    finally:
+        try:
+            lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _MAINT_LOCK_KEY})
+        finally:
+            lock.close()
+
+
+# ----------------------------------------------------------------------------
+# Conversion en ligne (heap <-> partitionnée)
+# ----------------------------------------------------------------------------
+# upsert : si le backfill a copié l'ancienne version d'une ligne dans une transaction
+# encore ouverte, l'INSERT du trigger attend son commit puis la remplace (DO NOTHING
+# gardait la version périmée). Les lignes sans event_time ne sont pas copiées (clé).
+_SYNC_FUNCTION = """
+CREATE OR REPLACE FUNCTION {table}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    DELETE FROM {new} WHERE event_id = OLD.event_id;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.event_time IS NOT NULL THEN
+    INSERT INTO {new} SELECT NEW.*
+    ON CONFLICT ({key}) DO UPDATE SET {assign};
+  END IF;
+  RETURN NULL;
+END $$
+"""
+
+
+def _sync_function(conn, key: tuple) -> str:
+    cols = conn.execute(text("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(:t) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """), {"t": NEW_TABLE}).scalars().all()
+    assign = ", ".join(f"{c} = EXCLUDED.{c}" for c in cols if c not in key)
+    return _SYNC_FUNCTION.format(table=TABLE, new=NEW_TABLE, key=", ".join(key),
+                                 assign=assign or f"{key[0]} = EXCLUDED.{key[0]}")
+
+
+def _prepare(eng, partitioned: bool, interval: str):
+    with eng.begin() as c:
+        if c.execute(text("SELECT to_regclass(:t)"), {"t": OLD_TABLE}).scalar():
+            raise RuntimeError(f"{OLD_TABLE} existe déjà : conversion précédente inachevée ?")
+        c.execute(text(f"DROP TABLE IF EXISTS {NEW_TABLE}"))
+        if partitioned:
+            c.execute(text(
+                f"CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY) "
+                "PARTITION BY RANGE (event_time)"
+            ))
+            # la clé de partition doit faire partie de la clé primaire
+            key = ("event_id", "event_time")
+            c.execute(text(f"ALTER TABLE {NEW_TABLE} ADD PRIMARY KEY (event_id, event_time)"))
+            lo, hi = c.execute(text(f"SELECT MIN(event_time), MAX(event_time) FROM {TABLE}")).first()
+            now = datetime.now(timezone.utc)
+            horizon = max(hi or now, now)
+            for _ in range(AHEAD):
+                horizon = next_start(period_start(horizon, interval), interval)
+            ensure_partitions(c, lo or now, horizon, interval, table=NEW_TABLE)
+            create_default(c, NEW_TABLE)
+        else:
+            key = ("event_id",)
+            c.execute(text(f"CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY)"))
+            c.execute(text(f"ALTER TABLE {NEW_TABLE} ADD PRIMARY KEY (event_id)"))
+        for name, cols in INDEXES:
+            c.execute(text(f"CREATE INDEX {name}_new ON {NEW_TABLE} {cols}"))
+        c.execute(text(_sync_function(c, key)))
+        c.execute(text(f"DROP TRIGGER IF EXISTS trg_{TABLE}_sync ON {TABLE}"))
+        c.execute(text(
+            f"CREATE TRIGGER trg_{TABLE}_sync AFTER INSERT OR UPDATE OR DELETE ON {TABLE} "
+            f"FOR EACH ROW EXECUTE FUNCTION {TABLE}_sync()"
+        ))
+
+
+def _backfill(eng, batch_rows: int, out):
+    with eng.connect() as c:
+        lo, hi = c.execute(text(f"SELECT MIN(event_id), MAX(event_id) FROM {TABLE}")).first()
+    if lo is None:
+        return 0
+    n, t0, cur = 0, time.perf_counter(), int(lo) - 1
+    while cur < hi:
+        with eng.begin() as c:
+            res = c.execute(text(f"""
+                INSERT INTO {NEW_TABLE}
+                SELECT * FROM {TABLE}
+                WHERE event_id > :lo AND event_id <= :hi AND event_time IS NOT NULL
+                ON CONFLICT DO NOTHING
+            """), {"lo": cur, "hi": cur + batch_rows})
+            n += res.rowcount or 0
+        cur += batch_rows
+        if out is not None:
+            el = time.perf_counter() - t0
+            print(f"  backfill event_id<={min(cur, hi)}/{hi} : {n} lignes ({n / max(el, 1e-9):,.0f}/s)",
+                  file=out)
+    return n
+
+
+# empreinte par tranche de event_id : nombre de lignes + somme des hachés du texte de
+# la ligne (indépendante de l'ordre ; mêmes colonnes dans le même ordre des deux côtés)
+_CHECKSUM_SQL = """
+    SELECT event_id / :b AS bucket, COUNT(*) AS n,
+           SUM(hashtextextended(t::text, 0)::numeric) AS h
+    FROM {table} t
+    WHERE event_time IS NOT NULL
+    GROUP BY 1
+"""
+
+
+def _diverging(c, bucket_rows: int) -> list:
+    """Tranches de event_id dont le contenu diffère entre l'original et la copie."""
+    sums = [
+        {r.bucket: (r.n, r.h) for r in c.execute(text(_CHECKSUM_SQL.format(table=t)), {"b": bucket_rows})}
+        for t in (TABLE, NEW_TABLE)
+    ]
+    return sorted(b for b in set(sums[0]) | set(sums[1]) if sums[0].get(b) != sums[1].get(b))
+
+
+def _recopy(c, buckets: list, bucket_rows: int):
+    for b in buckets:
+        rng = {"lo": b * bucket_rows, "hi": (b + 1) * bucket_rows}
+        c.execute(text(f"DELETE FROM {NEW_TABLE} WHERE event_id >= :lo AND event_id < :hi"), rng)
+        c.execute(text(f"""
+            INSERT INTO {NEW_TABLE}
+            SELECT * FROM {TABLE}
+            WHERE event_id >= :lo AND event_id < :hi AND event_time IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """), rng)
+
+
+def _reconcile(eng, bucket_rows: int, out, passes: int = 3):
+    """Avant la bascule (trigger actif) : recopie des tranches divergentes, pour que la
+    vérification sous verrou n'ait presque plus rien à corriger."""
+    for i in range(passes):
+        with eng.begin() as c:
+            buckets = _diverging(c, bucket_rows)
+            if not buckets:
+                return
+            _recopy(c, buckets, bucket_rows)
+        if out is not None:
+            print(f"  vérification {i + 1} : {len(buckets)} tranche(s) recopiée(s)", file=out)
+
+
+def _swap(eng, bucket_rows: int, out=None):
+    with eng.begin() as c:
+        c.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+        # plus d'écriture concurrente : la copie est rendue identique puis revérifiée
+        buckets = _diverging(c, bucket_rows)
+        if buckets:
+            _recopy(c, buckets, bucket_rows)
+            if out is not None:
+                print(f"  bascule : {len(buckets)} tranche(s) recopiée(s) sous verrou", file=out)
+            left = _diverging(c, bucket_rows)
+            if left:
+                raise RuntimeError(f"Copie divergente ({len(left)} tranche(s) de event_id) : bascule annulée")
+        with matviews.views_detached(c, "fv_phase_durations"):
+            c.execute(text(f"DROP TRIGGER IF EXISTS trg_{TABLE}_sync ON {TABLE}"))
+            c.execute(text(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}"))
+            for name, _ in INDEXES:
+                c.execute(text(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_old"))
+            c.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}"))
+            for name, _ in INDEXES:
+                c.execute(text(f"ALTER INDEX {name}_new RENAME TO {name}"))
+            # séquence de event_id : identité recopiée -> recalage ; serial -> changement de propriétaire
+            seq_new = c.execute(text("SELECT pg_get_serial_sequence(:t, 'event_id')"), {"t": TABLE}).scalar()
+            seq_old = c.execute(text("SELECT pg_get_serial_sequence(:t, 'event_id')"), {"t": OLD_TABLE}).scalar()
+            if seq_new:
+                c.execute(text(f"SELECT setval(:s, COALESCE((SELECT MAX(event_id) FROM {TABLE}), 0) + 1, false)"),
+                          {"s": seq_new})
+            elif seq_old:
+                c.execute(text(f"ALTER SEQUENCE {seq_old} OWNED BY {TABLE}.event_id"))
+            c.execute(text(f"DROP TABLE {OLD_TABLE}"))
+            # triggers NOTIFY (v0011) : ils suivaient l'ancienne table
+            if c.execute(text("SELECT to_regproc('logiops_notify_change') IS NOT NULL")).scalar():
+                from migrations import v0011_change_notify as notify
+                for sql in notify.triggers(TABLE):
+                    c.execute(text(sql))
+        c.execute(text(f"DROP FUNCTION IF EXISTS {TABLE}_sync()"))
+        c.execute(text(f"ANALYZE {TABLE}"))
+
+
+def _rebuild(eng, partitioned: bool, interval: str = INTERVAL, batch_rows: int = 50_000, out=sys.stdout):
+    with eng.connect() as c:
+        if is_partitioned(c) == partitioned:
+            if out is not None:
+                print(f"  {TABLE} déjà {'partitionnée' if partitioned else 'non partitionnée'}", file=out)
+            return
+    _prepare(eng, partitioned, interval)
+    try:
+        _backfill(eng, batch_rows, out)
+        _reconcile(eng, batch_rows, out)
+        _swap(eng, batch_rows, out)
+    except Exception:
+        # on laisse la table d'origine intacte : nettoyage du trigger et de la copie
+        with eng.begin() as c:
+            c.execute(text(f"DROP TRIGGER IF EXISTS trg_{TABLE}_sync ON {TABLE}"))
+            c.execute(text(f"DROP TABLE IF EXISTS {NEW_TABLE}"))
+            c.execute(text(f"DROP FUNCTION IF EXISTS {TABLE}_sync()"))
+        raise
+
+
+def convert(eng, interval: str = INTERVAL, batch_rows: int = 50_000, out=sys.stdout):
+    """Heap -> table partitionnée par event_time, en ligne et par lots."""
+    _rebuild(eng, True, interval, batch_rows, out)
+
+
+def unconvert(eng, batch_rows: int = 50_000, out=sys.stdout):
+    """Table partitionnée -> heap (rollback de `convert`, partitions archivées exclues)."""
+    _rebuild(eng, False, INTERVAL, batch_rows, out)
+
+
+def main() -> int:
+    from sqlalchemy import create_engine
+    from db import DATABASE_URL
+
+    ap = argparse.ArgumentParser(description="Partitions de shipment_events")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status")
+    sub.add_parser("maintain")
+    cv = sub.add_parser("convert")
+    cv.add_argument("--batch-rows", type=int, default=50_000)
+    args = ap.parse_args()
+
+    eng = create_engine(DATABASE_URL, pool_pre_ping=True)
+    if args.cmd == "status":
+        with eng.connect() as c:
+            if not is_partitioned(c):
+                print(f"  {TABLE} n'est pas partitionnée")
+            for name, lo, hi in list_partitions(c):
+                print(f"  {name:<32} [{lo:%Y-%m-%d}, {hi:%Y-%m-%d})")
+    elif args.cmd == "maintain":
+        maintain(eng, out=sys.stdout)
+    elif args.cmd == "convert":
+        convert(eng, batch_rows=args.batch_rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# server/profiler.py
+"""
+Profileur par échantillonnage à la demande (flame graphs en production).
+
+Un thread échantillonneur lit `sys._current_frames()` toutes les
+PROFILE_INTERVAL_MS (10 ms) et n'agrège que les threads qui servent une requête
+correspondant au filtre (route Flask + méthode optionnelle). Aucun hook
+sys.setprofile : le coût est celui d'un parcours de pile par thread ciblé et par
+tick (quelques % au pire), et rien ne reste actif en dehors d'une session.
+
+Deux modes :
+  - durée  : échantillonne les requêtes ciblées pendant N secondes
+  - nombre : s'arrête après les K prochaines requêtes ciblées terminées
+
+Sorties : format « collapsed » (flamegraph.pl, speedscope, inferno) ou JSON
+speedscope (sampled profile). Une seule session à la fois par worker : la session
+ne voit que les requêtes du worker qui a reçu le POST.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+import metrics
+
+PROFILE_INTERVAL_MS = 10.0
+MAX_SECONDS = 120.0
+MAX_STACK_DEPTH = 128
+
+_active = {}          # threads servant une requête ciblée (ident -> True)
+_active_lock = threading.Lock()
+_session = None
+_session_lock = threading.Lock()
+_last = None          # dernière session terminée
+
+
+class ProfileBusy(RuntimeError):
+    """Une session de profilage est déjà en cours sur ce worker."""
+
+
+class Session:
+    def __init__(self, route: str = None, method: str = None, seconds: float = None,
+                 requests: int = None, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.route = route
+        self.method = method.upper() if method else None
+        self.seconds = min(float(seconds), MAX_SECONDS) if seconds else None
+        self.requests = int(requests) if requests else None
+        self.interval = max(interval_ms, 1.0) / 1000.0
+        self.stacks = Counter()
+        self.samples = 0
+        self.matched = 0
+        self.started = time.time()
+        self.ended = None
+        self._done = threading.Event()
+
+    def matches(self, route: str, method: str) -> bool:
+        return (self.route is None or route == self.route) and (self.method is None or method == self.method)
+
+    def request_finished(self):
+        self.matched += 1
+        if self.requests is not None and self.matched >= self.requests:
+            self._done.set()
+
+    def _deadline_reached(self) -> bool:
+        limit = self.seconds if self.seconds is not None else MAX_SECONDS
+        return time.time() - self.started >= limit
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._done.is_set() and not self._deadline_reached():
+            with _active_lock:
+                targets = [t for t in _active if t != me]
+            if targets:
+                frames = sys._current_frames()
+                for ident in targets:
+                    f = frames.get(ident)
+                    if f is not None:
+                        self.stacks[_collapse(f)] += 1
+                        self.samples += 1
+            self._done.wait(self.interval)
+        self.ended = time.time()
+        self._done.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+# ----------------------------------------------------------------------------
+# Hooks Flask
+# ----------------------------------------------------------------------------
+def _before_request():
+    s = _session
+    if s is None:
+        return
+    from flask import request
+    if s.matches(metrics.current_route(), request.method):
+        with _active_lock:
+            _active[threading.get_ident()] = True
+
+
+def _teardown_request(exc=None):
+    ident = threading.get_ident()
+    with _active_lock:
+        was_active = _active.pop(ident, None)
+    s = _session
+    if was_active and s is not None:
+        s.request_finished()
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
+
+
+# ----------------------------------------------------------------------------
+# Sessions
+# ----------------------------------------------------------------------------
+def _run(s: Session):
+    global _session, _last
+    try:
+        s.run()
+    finally:
+        with _session_lock:
+            _session = None
+            _last = s
+        with _active_lock:
+            _active.clear()
+
+
+def start(route: str = None, method: str = None, seconds: float = None, requests: int = None,
+          interval_ms: float = PROFILE_INTERVAL_MS) -> Session:
+    """
+    Lance une session en tâche de fond (fin : durée, K requêtes, ou MAX_SECONDS) et
+    rend la main tout de suite : sur un worker mono-thread, la requête d'admin ne
+    doit pas occuper le thread qu'on veut observer. Lève ProfileBusy si une
+    session tourne déjà.
+    """
+    global _session
+    if seconds is None and requests is None:
+        seconds = 10.0
+    s = Session(route, method, seconds, requests, interval_ms)
+    with _session_lock:
+        if _session is not None:
+            raise ProfileBusy("profilage déjà en cours")
+        _session = s
+    threading.Thread(target=_run, args=(s,), name="profiler", daemon=True).start()
+    return s
+
+
+def current():
+    """Session en cours, sinon la dernière terminée (ou None)."""
+    return _session or _last
+
+
+def status(s: Session) -> dict:
+    return {
+        "route": s.route, "method": s.method, "seconds": s.seconds, "requests": s.requests,
+        "running": s.ended is None, "samples": s.samples, "matched_requests": s.matched,
+        "elapsed_s": round((s.ended or time.time()) - s.started, 3),
+    }
+
+
+def to_collapsed(s: Session) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in s.stacks.most_common())
+
+
+def to_speedscope(s: Session, name: str = "logiops") -> dict:
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, n in s.stacks.most_common():
+        ids = []
+        for part in stack.split(";"):
+            i = index.get(part)
+            if i is None:
+                i = index[part] = len(frames)
+                fn, _, loc = part.partition(" (")
+                file, _, line = loc.rstrip(")").rpartition(":")
+                frames.append({"name": fn, "file": file, "line": int(line) if line.isdigit() else None})
+            ids.append(i)
+        samples.append(ids)
+        weights.append(n * s.interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{name} {s.route or '*'}",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+        "name": name,
+        "exporter": "logiops profiler",
+    }
@@ -0,0 +1,360 @@
+# server/scheduler.py
+"""
+Planificateur de tâches de fond, sûr en multi-instance.
+
+Chaque process enregistre ses tâches (`register`) : périodiques (`every=` en
+secondes) ou cron (`cron="*/15 * * * *"`, 5 champs, UTC). L'état est partagé
+dans Postgres (migration v0012) :
+  - scheduler_jobs : prochaine échéance et pause, par tâche ;
+  - scheduler_runs : historique (instance, déclencheur, durée, statut, erreur).
+
+Toutes les SCHEDULER_TICK_S, chaque instance lit les tâches échues. Pour en
+exécuter une, elle prend le verrou consultatif de la tâche
+(pg_try_advisory_lock sur une connexion AUTOCOMMIT dédiée, hors pool, tenue
+pendant l'exécution),
+revérifie l'échéance sous verrou, puis avance `next_run_at` avant de lancer :
+une seule instance exécute chaque échéance, même si plusieurs workers ou
+réplicas tournent. Une instance tuée libère son verrou avec sa connexion.
+
+Remplace les threads de matviews (MATVIEW_REFRESH_SECONDS) et de partitions
+(PARTITION_MAINTENANCE_SECONDS), qui sont désormais des tâches déclarées dans
+app.py. Pilotage superviseur : /api/admin/jobs (voir admin_api.py).
+
+Configuration : SCHEDULER_ENABLED (1), SCHEDULER_TICK_S (5),
+SCHEDULER_HISTORY_DAYS (30).
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+import metrics
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+TICK_S = float(os.getenv("SCHEDULER_TICK_S", "5"))
+HISTORY_DAYS = int(os.getenv("SCHEDULER_HISTORY_DAYS", "30"))
+INSTANCE = f"{socket.gethostname()}:{os.getpid()}"
+_LOCK_CLASS = 360_0010   # pg_try_advisory_lock(classe, crc32(nom))
+
+SQL_UPSERT_JOB = """
+    INSERT INTO scheduler_jobs (name, schedule, next_run_at)
+    VALUES (:name, :schedule, :next)
+    ON CONFLICT (name) DO UPDATE SET
+      schedule = EXCLUDED.schedule,
+      next_run_at = CASE WHEN scheduler_jobs.schedule = EXCLUDED.schedule
+                         THEN scheduler_jobs.next_run_at ELSE EXCLUDED.next_run_at END,
+      updated_at = now()
+"""
+SQL_DUE = "SELECT name FROM scheduler_jobs WHERE NOT paused AND next_run_at <= now()"
+SQL_STILL_DUE = "SELECT NOT paused AND next_run_at <= now() FROM scheduler_jobs WHERE name = :name"
+SQL_ADVANCE = "UPDATE scheduler_jobs SET next_run_at = :next, updated_at = now() WHERE name = :name"
+SQL_PAUSE = "UPDATE scheduler_jobs SET paused = :paused, updated_at = now() WHERE name = :name"
+SQL_RUN_START = """
+    INSERT INTO scheduler_runs (job, instance, trigger, started_at, status)
+    VALUES (:job, :instance, :trigger, now(), :status)
+    RETURNING run_id
+"""
+SQL_RUN_END = """
+    UPDATE scheduler_runs
+    SET finished_at = now(), duration_ms = :duration_ms, status = :status,
+        result = CAST(:result AS jsonb), error = :error
+    WHERE run_id = :run_id
+"""
+SQL_PRUNE = """
+    DELETE FROM scheduler_runs
+    WHERE job = :job AND started_at < now() - make_interval(days => :days)
+"""
+SQL_STATE = """
+    SELECT j.name, j.schedule, j.next_run_at, j.paused,
+           r.started_at AS last_started_at, r.duration_ms AS last_duration_ms,
+           r.status AS last_status, r.instance AS last_instance, r.error AS last_error
+    FROM scheduler_jobs j
+    LEFT JOIN LATERAL (
+      SELECT started_at, duration_ms, status, instance, error
+      FROM scheduler_runs WHERE job = j.name ORDER BY started_at DESC LIMIT 1
+    ) r ON true
+    ORDER BY j.name
+"""
+SQL_HISTORY = """
+    SELECT run_id, instance, trigger, started_at, finished_at, duration_ms, status, result, error
+    FROM scheduler_runs WHERE job = :job
+    ORDER BY started_at DESC
+    LIMIT :lim
+"""
+
+RUNS = metrics.register(metrics.Counter(
+    "logiops_scheduler_runs_total", "Exécutions de tâches planifiées (par cette instance)", ("job", "status")))
+RUN_DURATION = metrics.register(metrics.Histogram(
+    "logiops_scheduler_run_duration_seconds", "Durée des tâches planifiées", ("job",),
+    (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)))
+
+
+class UnknownJob(KeyError):
+    """Aucune tâche de ce nom n'est enregistrée dans ce process."""
+
+
+# ----------------------------------------------------------------------------
+# Échéances
+# ----------------------------------------------------------------------------
+class Cron:
+    """Expression cron à 5 champs (minute heure jour mois jour-semaine), UTC."""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron à 5 champs attendu : {expr!r}")
+        self.expr = expr
+        self.sets = [self._parse(f, lo, hi) for f, (lo, hi) in zip(fields, self._RANGES)]
+        if 7 in self.sets[4]:  # dimanche = 0 ou 7
+            self.sets[4] = (self.sets[4] - {7}) | {0}
+        self._dom_any, self._dow_any = fields[2] == "*", fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lo: int, hi: int) -> set:
+        out = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, s = part.split("/", 1)
+                step = int(s)
+            if part == "*":
+                a, b = lo, hi
+            elif "-" in part:
+                a, b = (int(x) for x in part.split("-", 1))
+            else:
+                a = int(part)
+                b = hi if step > 1 else a
+            if a < lo or b > hi or a > b or step < 1:
+                raise ValueError(f"champ cron invalide : {field!r}")
+            out.update(range(a, b + 1, step))
+        return out
+
+    def _day_ok(self, t: datetime) -> bool:
+        dom = t.day in self.sets[2]
+        dow = t.isoweekday() % 7 in self.sets[4]
+        # convention cron : si jour ET jour-semaine sont restreints, l'un OU l'autre suffit
+        return dom or dow if not (self._dom_any or self._dow_any) else dom and dow
+
+    def next_after(self, dt: datetime) -> datetime:
+        t = dt.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.sets[3]:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_ok(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.sets[1]:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.sets[0]:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"expression cron sans échéance : {self.expr!r}")
+
+
+class Job:
+    def __init__(self, name: str, fn, every: float = None, cron: str = None):
+        if (every is None) == (cron is None):
+            raise ValueError("préciser every= ou cron=")
+        self.name = name
+        self.fn = fn
+        self.every = float(every) if every is not None else None
+        self.cron = Cron(cron) if cron is not None else None
+        self.lock_key = zlib.crc32(name.encode()) - 2 ** 31  # int4 signé
+
+    @property
+    def schedule(self) -> str:
+        return self.cron.expr if self.cron else f"every {self.every:g}s"
+
+    def next_after(self, dt: datetime) -> datetime:
+        return self.cron.next_after(dt) if self.cron else dt + timedelta(seconds=self.every)
+
+
+_jobs = {}
+_running = set()
+_lock = threading.Lock()
+_thread = None
+
+
+def register(name: str, fn, every: float = None, cron: str = None) -> Job:
+    """Déclare une tâche ; `fn()` renvoie un résultat JSON-compatible (ou None)."""
+    job = Job(name, fn, every=every, cron=cron)
+    with _lock:
+        _jobs[name] = job
+    return job
+
+
+def jobs() -> dict:
+    return dict(_jobs)
+
+
+# ----------------------------------------------------------------------------
+# Exécution
+# ----------------------------------------------------------------------------
+def _jsonable(result):
+    try:
+        return json.dumps(result, default=str)
+    except (TypeError, ValueError):
+        return json.dumps(str(result))
+
+
+_lock_engines = {}
+
+
+def _lock_engine(eng):
+    """
+    Engine sans pool (NullPool) pour les verrous des tâches : la connexion tenue
+    pendant toute l'exécution ne doit pas occuper une place du pool batch.
+    """
+    with _lock:
+        le = _lock_engines.get(eng.url)
+        if le is None:
+            le = _lock_engines[eng.url] = create_engine(
+                eng.url, poolclass=NullPool, isolation_level="AUTOCOMMIT",
+                connect_args={"application_name": "logiops-scheduler"})
+        return le
+
+
+def _execute(eng, job: Job, trigger: str = "schedule"):
+    """
+    Exécute `job` sous son verrou consultatif. Renvoie le statut ("ok", "error",
+    "busy") ou None si l'échéance a déjà été prise par une autre instance.
+    """
+    conn = _lock_engine(eng).connect()
+    locked = False
+    try:
+        locked = conn.execute(text("SELECT pg_try_advisory_lock(:c, :k)"),
+                              {"c": _LOCK_CLASS, "k": job.lock_key}).scalar()
+        if not locked:
+            if trigger == "manual":
+                conn.execute(text(SQL_RUN_START), {"job": job.name, "instance": INSTANCE,
+                                                   "trigger": trigger, "status": "busy"})
+                return "busy"
+            return None
+        if trigger == "schedule":
+            if not conn.execute(text(SQL_STILL_DUE), {"name": job.name}).scalar():
+                return None
+            # avancée avant l'exécution : un crash ne relance pas la tâche en boucle
+            conn.execute(text(SQL_ADVANCE), {"name": job.name,
+                                             "next": job.next_after(datetime.now(timezone.utc))})
+        run_id = conn.execute(text(SQL_RUN_START), {"job": job.name, "instance": INSTANCE,
+                                                    "trigger": trigger, "status": "running"}).scalar()
+        t0 = time.perf_counter()
+        result, error, status = None, None, "ok"
+        try:
+            result = job.fn()
+        except Exception as e:
+            error, status = f"{type(e).__name__}: {e}"[:4000], "error"
+            print(f"[scheduler] {job.name} en échec : {error}", file=sys.stderr)
+        dur = time.perf_counter() - t0
+        RUNS.inc(job.name, status)
+        RUN_DURATION.observe(dur, job.name)
+        conn.execute(text(SQL_RUN_END), {"run_id": run_id, "duration_ms": dur * 1000.0, "status": status,
+                                         "result": _jsonable(result), "error": error})
+        conn.execute(text(SQL_PRUNE), {"job": job.name, "days": HISTORY_DAYS})
+        return status
+    finally:
+        try:
+            if locked:
+                conn.execute(text("SELECT pg_advisory_unlock(:c, :k)"), {"c": _LOCK_CLASS, "k": job.lock_key})
+        finally:
+            conn.close()
+
+
+def _spawn(eng, job: Job, trigger: str) -> bool:
+    with _lock:
+        if job.name in _running:
+            return False
+        _running.add(job.name)
+
+    def run():
+        try:
+            _execute(eng, job, trigger)
+        except Exception as e:  # base indisponible, table absente… : jamais fatal
+            print(f"[scheduler] {job.name} : {e}", file=sys.stderr)
+        finally:
+            with _lock:
+                _running.discard(job.name)
+
+    threading.Thread(target=run, name=f"job-{job.name}", daemon=True).start()
+    return True
+
+
+def _sync(eng):
+    now = datetime.now(timezone.utc)
+    with eng.begin() as c:
+        for job in _jobs.values():
+            c.execute(text(SQL_UPSERT_JOB), {"name": job.name, "schedule": job.schedule,
+                                             "next": job.next_after(now)})
+
+
+def _loop(eng):
+    synced = False
+    while True:
+        try:
+            if not synced:
+                _sync(eng)
+                synced = True
+            with eng.connect() as c:
+                due = [r[0] for r in c.execute(text(SQL_DUE))]
+            for name in due:
+                job = _jobs.get(name)
+                if job is not None:
+                    _spawn(eng, job, "schedule")
+        except Exception as e:
+            print(f"[scheduler] tick en échec : {e}", file=sys.stderr)
+        time.sleep(TICK_S)
+
+
+def start(eng):
+    """Démarre la boucle (une par process) ; no-op si aucune tâche ou SCHEDULER_ENABLED=0."""
+    global _thread
+    if not SCHEDULER_ENABLED or not _jobs or _thread is not None:
+        return None
+    _thread = threading.Thread(target=_loop, args=(eng,), name="scheduler", daemon=True)
+    _thread.start()
+    return _thread
+
+
+# ----------------------------------------------------------------------------
+# Pilotage
+# ----------------------------------------------------------------------------
+def _job(name: str) -> Job:
+    job = _jobs.get(name)
+    if job is None:
+        raise UnknownJob(name)
+    return job
+
+
+def trigger(eng, name: str) -> bool:
+    """Lance la tâche tout de suite sur cette instance (hors échéancier) ; False si déjà en cours ici."""
+    return _spawn(eng, _job(name), "manual")
+
+
+def pause(eng, name: str, paused: bool = True):
+    _job(name)
+    with eng.begin() as c:
+        c.execute(text(SQL_PAUSE), {"name": name, "paused": paused})
+
+
+def state(eng) -> list:
+    with eng.connect() as c:
+        rows = [dict(r) for r in c.execute(text(SQL_STATE)).mappings()]
+    for r in rows:
+        r["registered"] = r["name"] in _jobs
+        r["running_here"] = r["name"] in _running
+    return rows
+
+
+def history(eng, name: str, limit: int = 50) -> list:
+    with eng.connect() as c:
+        return [dict(r) for r in c.execute(text(SQL_HISTORY), {"job": name, "lim": limit}).mappings()]
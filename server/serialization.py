@@ -0,0 +1,173 @@
+# server/serialization.py
+"""
+Encodage rapide des réponses JSON.
+
+Les handlers de liste construisaient `df.to_dict(orient="records")` puis `jsonify`,
+soit un dict Python par ligne re-parcouru par l'encodeur de la stdlib (et qui casse
+sur les scalaires NumPy / NaN). Ici on sérialise directement les DataFrames en bytes :
+  - forme "records" (défaut) : une liste d'objets via orjson, NaN -> null, dates ISO
+  - forme "columns" (opt-in `?format=columns`) : un tableau par colonne via orjson
+Les floats sont écrits au plus court qui relit la même valeur (384.6, pas
+384.600000000000023 comme `to_json(double_precision=15)`).
+La compression gzip / br est négociée via Accept-Encoding dans un `after_request`.
+"""
+from __future__ import annotations
+
+import gzip
+import time
+
+import orjson
+from flask import Response, request
+
+import lazy
+import metrics
+
+# pandas / NumPy importés au premier DataFrame (ou par le préchauffage des modèles)
+np = lazy.module("numpy")
+pd = lazy.module("pandas")
+
+try:  # brotli est optionnel : sans lui on se contente de gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+JSON_MIMETYPE = "application/json"
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class RawJSON(bytes):
+    """Fragment JSON déjà encodé, recopié tel quel dans l'enveloppe."""
+
+
+def _default(o):
+    """Types non gérés nativement par orjson (Decimal, Timestamp, NaT, NA…)."""
+    # sans pandas / NumPy chargés, l'objet ne peut pas en venir : pas d'import forcé ici
+    if lazy.loaded("pandas") and (o is pd.NaT or o is pd.NA):
+        return None
+    if hasattr(o, "isoformat"):
+        return o.isoformat()
+    if lazy.loaded("numpy") and isinstance(o, np.generic):
+        return o.item()
+    try:
+        return float(o)
+    except (TypeError, ValueError):
+        return str(o)
+
+
+def dumps(obj) -> bytes:
+    """orjson.dumps avec les options du projet (NumPy, NaN -> null)."""
+    return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+
+
+def _column_values(s: pd.Series):
+    """Valeurs d'une colonne dans une forme que orjson sérialise sans boucle Python."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        if getattr(s.dt, "tz", None) is not None:
+            s = s.dt.tz_convert("UTC").dt.tz_localize(None)
+        vals = s.to_numpy(dtype="datetime64[s]")
+        out = np.datetime_as_string(vals, unit="s", timezone="UTC").astype(object)
+        out[np.isnat(vals)] = None
+        return out.tolist()
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+        if s.hasnans:
+            return s.astype(object).where(s.notna(), None).tolist()
+        return np.ascontiguousarray(s.to_numpy())
+    if pd.api.types.is_float_dtype(s):
+        # orjson écrit NaN / inf en null
+        return np.ascontiguousarray(s.to_numpy(dtype=np.float64))
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def encode_records(df: pd.DataFrame) -> RawJSON:
+    """DataFrame -> `[{...}, ...]` ; mêmes conversions par colonne que `encode_columns`."""
+    if df.empty:
+        return RawJSON(b"[]")
+    cols = [str(c) for c in df.columns]
+    values = []
+    for c in df.columns:
+        v = _column_values(df[c])
+        values.append(v.tolist() if isinstance(v, np.ndarray) else v)
+    return RawJSON(dumps([dict(zip(cols, row)) for row in zip(*values)]))
+
+
+def encode_columns(df: pd.DataFrame) -> RawJSON:
+    """DataFrame -> `{"col": [...], ...}` (une liste par colonne)."""
+    return RawJSON(dumps({str(c): _column_values(df[c]) for c in df.columns}))
+
+
+def encode_record(df: pd.DataFrame) -> RawJSON:
+    """Première ligne d'un DataFrame en objet JSON (ou null si vide)."""
+    if df.empty:
+        return RawJSON(b"null")
+    return RawJSON(encode_records(df.iloc[:1])[1:-1])
+
+
+def wants_columns() -> bool:
+    return (request.args.get("format") or "").strip().lower() == "columns"
+
+
+def _encode_value(v, columnar: bool) -> bytes:
+    if isinstance(v, RawJSON):
+        return v
+    if lazy.loaded("pandas") and isinstance(v, pd.DataFrame):
+        return encode_columns(v) if columnar else encode_records(v)
+    return dumps(v)
+
+
+def json_response(payload: dict, status: int = 200, columnar: bool = None) -> Response:
+    """
+    Réponse JSON dont les valeurs DataFrame sont encodées sans passer par des dicts.
+    En mode colonnes, l'enveloppe porte `"format": "columns"` pour le front.
+    """
+    if columnar is None:
+        columnar = wants_columns()
+    t0 = time.perf_counter()
+    parts = []
+    if columnar:
+        parts.append(b'"format":"columns"')
+    for k, v in payload.items():
+        parts.append(dumps(str(k)) + b":" + _encode_value(v, columnar))
+    body = b"{" + b",".join(parts) + b"}"
+    metrics.JSON_ENCODE.observe(time.perf_counter() - t0, metrics.current_route())
+    return Response(body, status=status, mimetype=JSON_MIMETYPE)
+
+
+# --------------------------- Compression négociée ---------------------------
+
+def _pick_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] > 0:
+        return "br"
+    if accepted["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def compress_response(resp: Response) -> Response:
+    if (resp.direct_passthrough or resp.is_streamed
+            or resp.status_code < 200 or resp.status_code >= 300
+            or "Content-Encoding" in resp.headers
+            or resp.mimetype != JSON_MIMETYPE):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return resp
+    enc = _pick_encoding()
+    if enc == "br":
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif enc == "gzip":
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    else:
+        return resp
+    resp.set_data(body)
+    resp.headers["Content-Encoding"] = enc
+    return resp
+
+
+def init_app(app):
+    app.after_request(compress_response)
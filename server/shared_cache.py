@@ -0,0 +1,362 @@
+# server/shared_cache.py
+"""
+Cache de réponses partagé entre les workers d'un même hôte, avec coalescence.
+
+Stockage : une base SQLite locale (par défaut en mémoire partagée, /dev/shm),
+mode WAL, lue et écrite par tous les process gunicorn. Un fichier par espace de
+noms (SHARED_CACHE_NAMESPACE, par défaut un haché de DATABASE_URL) : deux
+déploiements du même hôte branchés sur des bases différentes ne partagent pas
+leurs réponses. La clé est la règle
+Flask + les paramètres normalisés (query string triée, corps JSON à clés
+triées) ; la valeur est le corps de la réponse 200 du handler, avec son
+content-type. Seules les réponses 200 non streamées sont mises en cache.
+
+Single-flight : sur un miss, un seul calcul par clé et par hôte.
+  - dans le process : les threads concurrents attendent l'Event du premier ;
+  - entre process : un bail (table `flights`, INSERT OR IGNORE) désigne le
+    calculateur ; les autres relisent l'entrée toutes les POLL_MS jusqu'à
+    SHARED_CACHE_WAIT_MS, puis calculent eux-mêmes (jamais de blocage dur).
+    Un bail plus vieux que SHARED_CACHE_LEASE_S est repris (worker tué).
+
+Limites : TTL par route, SHARED_CACHE_MAX_MB au total (éviction LRU + expirés),
+SHARED_CACHE_MAX_ENTRY_MB par entrée (au-delà : pas de mise en cache).
+
+Invalidation : `tables=` étiquette les entrées avec les tables lues ; le bus
+LISTEN / NOTIFY (invalidation.py) appelle `on_invalidate`, qui supprime les
+entrées étiquetées avec la table modifiée et incrémente la génération de
+l'étiquette (`tag_generations`). Un calcul lancé avant l'invalidation lit
+l'ancienne génération : son résultat (pré-modification) n'est pas stocké.
+Le TTL reste un filet de sécurité.
+
+    @bp.get("/list")
+    @jwt_required()
+    @shared_cache.cached(ttl=60, tables=("shipments",))
+    def list_(): ...
+
+Configuration : SHARED_CACHE_ENABLED (1), SHARED_CACHE_NAMESPACE,
+SHARED_CACHE_PATH (défaut /dev/shm/logiops-cache-<namespace>.sqlite), SHARED_CACHE_MAX_MB
+(256), SHARED_CACHE_MAX_ENTRY_MB (16), SHARED_CACHE_WAIT_MS (10000),
+SHARED_CACHE_LEASE_S (60). Résultats (hit / miss / coalesced / bypass) comptés
+sur /api/metrics. En-tête de réponse `X-Cache`.
+"""
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from functools import wraps
+
+import orjson
+from flask import make_response, request, Response
+
+import metrics
+from db import DATABASE_URL
+
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "1") == "1"
+_SHM = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHARED_CACHE_NAMESPACE = os.getenv("SHARED_CACHE_NAMESPACE") or \
+    hashlib.sha1(DATABASE_URL.encode()).hexdigest()[:12]
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH",
+                              os.path.join(_SHM, f"logiops-cache-{SHARED_CACHE_NAMESPACE}.sqlite"))
+MAX_BYTES = int(float(os.getenv("SHARED_CACHE_MAX_MB", "256")) * 1024 * 1024)
+MAX_ENTRY_BYTES = int(float(os.getenv("SHARED_CACHE_MAX_ENTRY_MB", "16")) * 1024 * 1024)
+WAIT_S = float(os.getenv("SHARED_CACHE_WAIT_MS", "10000")) / 1000.0
+LEASE_S = float(os.getenv("SHARED_CACHE_LEASE_S", "60"))
+POLL_MS = 20
+TOUCH_EVERY_S = 1.0       # mise à jour de `accessed` (LRU) au plus une fois par seconde
+EVICT_FRACTION = 0.9      # on redescend à 90 % de MAX_BYTES
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+      key          TEXT PRIMARY KEY,
+      body         BLOB NOT NULL,
+      content_type TEXT,
+      size         INTEGER NOT NULL,
+      expires      REAL NOT NULL,
+      accessed     REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed);
+    CREATE TABLE IF NOT EXISTS entry_tags (
+      tag TEXT NOT NULL,
+      key TEXT NOT NULL,
+      PRIMARY KEY (tag, key)
+    );
+    CREATE TABLE IF NOT EXISTS tag_generations (
+      tag TEXT PRIMARY KEY,
+      gen INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS flights (
+      key     TEXT PRIMARY KEY,
+      owner   TEXT NOT NULL,
+      started REAL NOT NULL
+    );
+"""
+
+CACHE = metrics.register(metrics.Counter(
+    "logiops_shared_cache_total", "Résultats du cache partagé par route", ("route", "result")))
+
+_local = threading.local()
+_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_inflight = {}            # clé -> Event (single-flight intra-process)
+_inflight_lock = threading.Lock()
+_schema_ready = False
+
+
+# ----------------------------------------------------------------------------
+# Stockage SQLite
+# ----------------------------------------------------------------------------
+def _conn() -> sqlite3.Connection:
+    global _schema_ready
+    c = getattr(_local, "conn", None)
+    if c is None or getattr(_local, "pid", None) != os.getpid():  # pas de connexion héritée d'un fork
+        c = sqlite3.connect(SHARED_CACHE_PATH, timeout=5.0, isolation_level=None, check_same_thread=False)
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=OFF")
+        if not _schema_ready:
+            c.executescript(SCHEMA)
+            _schema_ready = True
+        _local.conn, _local.pid = c, os.getpid()
+    return c
+
+
+def make_key(route: str, args=None, body=None) -> str:
+    """Règle + paramètres normalisés (ordre des paramètres et des clés JSON ignoré)."""
+    parts = sorted((k, v) for k, vs in (args or {}).items() for v in vs) if args else []
+    raw = orjson.dumps([parts, body], option=orjson.OPT_SORT_KEYS)
+    return f"{route}|{hashlib.sha1(raw).hexdigest()}"
+
+
+def get(key: str):
+    """(body, content_type) si l'entrée existe et n'a pas expiré, sinon None."""
+    c = _conn()
+    row = c.execute("SELECT body, content_type, expires, accessed FROM entries WHERE key = ?",
+                    (key,)).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    if row[2] < now:
+        return None
+    if now - row[3] > TOUCH_EVERY_S:
+        c.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+    return row[0], row[1]
+
+
+def generations(tags) -> tuple:
+    """Générations courantes des étiquettes (à lire avant de calculer une valeur)."""
+    if not tags:
+        return ()
+    c = _conn()
+    gens = dict(c.execute(f"SELECT tag, gen FROM tag_generations WHERE tag IN ({','.join('?' * len(tags))})",
+                          tuple(tags)).fetchall())
+    return tuple(gens.get(t, 0) for t in tags)
+
+
+def put(key: str, body: bytes, content_type: str, ttl: float, tags=(), gens: tuple = None):
+    """
+    Stocke l'entrée ; avec `gens` (lu par `generations(tags)` avant le calcul), rien
+    n'est stocké si une étiquette a été invalidée entre-temps. Renvoie True si stockée.
+    """
+    if len(body) > MAX_ENTRY_BYTES:
+        return False
+    c = _conn()
+    # écriture exclusive : pas d'invalidation entre la comparaison et l'insertion
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        if gens is not None and tags and generations(tags) != tuple(gens):
+            c.execute("COMMIT")
+            return False
+        now = time.time()
+        c.execute("INSERT OR REPLACE INTO entries (key, body, content_type, size, expires, accessed) "
+                  "VALUES (?, ?, ?, ?, ?, ?)", (key, body, content_type, len(body), now + ttl, now))
+        if tags:
+            c.executemany("INSERT OR IGNORE INTO entry_tags (tag, key) VALUES (?, ?)",
+                          [(t, key) for t in tags])
+        _evict(c, now)
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    return True
+
+
+def _evict(c: sqlite3.Connection, now: float):
+    total = c.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    c.execute("DELETE FROM entries WHERE expires < ?", (now,))
+    c.execute("DELETE FROM entry_tags WHERE key NOT IN (SELECT key FROM entries)")
+    total = c.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    target = int(MAX_BYTES * EVICT_FRACTION)
+    if total <= target:
+        return
+    # LRU : on retire les plus anciennement lues jusqu'à repasser sous la cible
+    freed, victims = 0, []
+    for key, size in c.execute("SELECT key, size FROM entries ORDER BY accessed"):
+        victims.append((key,))
+        freed += size
+        if total - freed <= target:
+            break
+    c.executemany("DELETE FROM entries WHERE key = ?", victims)
+    c.executemany("DELETE FROM entry_tags WHERE key = ?", victims)
+
+
+def invalidate(prefix: str = "") -> int:
+    """Supprime les entrées dont la clé commence par `prefix` (toutes si vide)."""
+    c = _conn()
+    cur = c.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+    c.execute("DELETE FROM entry_tags WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+    return cur.rowcount
+
+
+def invalidate_tags(tags) -> int:
+    """Supprime les entrées étiquetées avec l'une des tables `tags`."""
+    c = _conn()
+    n = 0
+    for tag in tags:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            n += c.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entry_tags WHERE tag = ?)",
+                           (tag,)).rowcount
+            c.execute("DELETE FROM entry_tags WHERE tag = ?", (tag,))
+            c.execute("INSERT INTO tag_generations (tag, gen) VALUES (?, 1) "
+                      "ON CONFLICT (tag) DO UPDATE SET gen = gen + 1", (tag,))
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+    return n
+
+
+def on_invalidate(ev):
+    """Abonné du bus d'invalidation : granularité table (les clés ne sont pas indexées ici)."""
+    invalidate_tags([ev.table])
+
+
+def stats() -> dict:
+    c = _conn()
+    n, size = c.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+    return {"path": SHARED_CACHE_PATH, "entries": n, "bytes": size, "max_bytes": MAX_BYTES}
+
+
+# ----------------------------------------------------------------------------
+# Single-flight
+# ----------------------------------------------------------------------------
+def _acquire_lease(key: str) -> bool:
+    c = _conn()
+    now = time.time()
+    c.execute("DELETE FROM flights WHERE key = ? AND started < ?", (key, now - LEASE_S))
+    cur = c.execute("INSERT OR IGNORE INTO flights (key, owner, started) VALUES (?, ?, ?)",
+                    (key, _owner, now))
+    return cur.rowcount == 1
+
+
+def _release_lease(key: str):
+    _conn().execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, _owner))
+
+
+def _wait_for(key: str, timeout: float):
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        hit = get(key)
+        if hit is not None:
+            return hit
+        c = _conn()
+        if c.execute("SELECT 1 FROM flights WHERE key = ?", (key,)).fetchone() is None:
+            return get(key)  # calcul terminé (ou abandonné) ailleurs
+        time.sleep(POLL_MS / 1000.0)
+    return None
+
+
+def get_or_compute(key: str, compute, ttl: float, tags=()):
+    """
+    (body, content_type, résultat) ; `compute()` renvoie (body, content_type) ou
+    None (non cacheable). Résultat : "hit", "miss" ou "coalesced".
+    """
+    hit = get(key)
+    if hit is not None:
+        return hit[0], hit[1], "hit"
+
+    with _inflight_lock:
+        ev = _inflight.get(key)
+        leader = ev is None
+        if leader:
+            ev = _inflight[key] = threading.Event()
+    if not leader:
+        ev.wait(WAIT_S)
+        hit = get(key)
+        if hit is not None:
+            return hit[0], hit[1], "coalesced"
+        value = compute()
+        return (*value, "miss") if value else (None, None, "miss")
+
+    try:
+        if not _acquire_lease(key):
+            hit = _wait_for(key, WAIT_S)
+            if hit is not None:
+                return hit[0], hit[1], "coalesced"
+            gens = generations(tags)
+            value = compute()  # le calculateur distant n'a pas abouti à temps
+            if value:
+                put(key, value[0], value[1], ttl, tags, gens)
+            return (*value, "miss") if value else (None, None, "miss")
+        try:
+            # génération lue avant les lectures Postgres du calcul
+            gens = generations(tags)
+            value = compute()
+            if value:
+                put(key, value[0], value[1], ttl, tags, gens)
+            return (*value, "miss") if value else (None, None, "miss")
+        finally:
+            _release_lease(key)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        ev.set()
+
+
+# ----------------------------------------------------------------------------
+# Décorateur Flask
+# ----------------------------------------------------------------------------
+def cached(ttl: float, methods=("GET",), tables=()):
+    """
+    Met en cache la réponse 200 du handler pour `ttl` secondes (clé : route +
+    paramètres), étiquetée par les `tables` lues pour l'invalidation.
+    """
+
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            route = metrics.current_route()
+            if not SHARED_CACHE_ENABLED or request.method not in methods \
+                    or request.headers.get("Cache-Control", "").lower() == "no-cache":
+                CACHE.inc(route, "bypass")
+                return fn(*args, **kwargs)
+
+            holder = {}
+
+            def compute():
+                resp = make_response(fn(*args, **kwargs))
+                holder["resp"] = resp
+                if resp.status_code != 200 or resp.is_streamed or resp.direct_passthrough:
+                    return None
+                return resp.get_data(), resp.content_type
+
+            body = request.get_json(silent=True) if request.method != "GET" else None
+            key = make_key(route, request.args.to_dict(flat=False), body)
+            try:
+                data, ctype, result = get_or_compute(key, compute, ttl, tables)
+            except sqlite3.Error:
+                CACHE.inc(route, "bypass")  # cache indisponible : on sert sans
+                return holder["resp"] if "resp" in holder else fn(*args, **kwargs)
+            CACHE.inc(route, result)
+            resp = holder.get("resp")
+            if resp is None:
+                resp = Response(data, status=200, content_type=ctype)
+            resp.headers["X-Cache"] = result
+            return resp
+
+        return wrapper
+
+    return deco
@@ -0,0 +1,207 @@
+# server/slowlog.py
+"""
+Journal des requêtes SQL lentes, branché sur les events de l'engine.
+
+Au-delà de SLOW_QUERY_MS, chaque exécution est agrégée par empreinte (texte SQL
+normalisé) : nombre, durée max / totale, dernière route appelante et derniers
+paramètres *masqués* (type + taille, jamais la valeur). Un échantillon
+(SLOW_QUERY_EXPLAIN_RATE) est rejoué hors requête par un thread dédié en
+`EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`, dans une transaction annulée et sous
+statement_timeout ; le dernier plan est conservé avec l'entrée.
+
+Seules les SELECT / WITH sont rejouées (ANALYZE exécute vraiment la requête).
+Celles qui ne lisent aucune table (pas de FROM), modifient des lignes (CTE
+INSERT / UPDATE / DELETE, FOR UPDATE / SHARE) ou appellent une fonction à effet
+de bord (verrous pg_*lock*, setval, nextval, pg_notify…) sont expliquées sans
+ANALYZE : rejouer `SELECT pg_advisory_xact_lock(...)` bloquerait un utilisateur.
+Le classement top-N (par durée max) est servi par `GET /api/admin/slow-queries`.
+
+Configuration :
+  SLOW_QUERY_MS                seuil d'enregistrement (200, 0 = désactivé)
+  SLOW_QUERY_TOP               taille du classement conservé (50)
+  SLOW_QUERY_EXPLAIN_RATE      proportion rejouée en EXPLAIN ANALYZE (0.1)
+  SLOW_QUERY_EXPLAIN_EVERY_S   au plus un EXPLAIN par empreinte et par période (300)
+  SLOW_QUERY_EXPLAIN_TIMEOUT_MS  statement_timeout du rejeu (30000)
+"""
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+import metrics
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_TOP = int(os.getenv("SLOW_QUERY_TOP", "50"))
+EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+EXPLAIN_EVERY_S = float(os.getenv("SLOW_QUERY_EXPLAIN_EVERY_S", "300"))
+EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "30000"))
+
+_WS = re.compile(r"\s+")
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_HAS_FROM = re.compile(r"\bFROM\b", re.IGNORECASE)
+_SIDE_EFFECTS = re.compile(
+    r"\b(pg_\w*lock\w*|setval|nextval|pg_notify|pg_cancel_backend|pg_terminate_backend)\s*\("
+    r"|\b(INSERT|UPDATE|DELETE|MERGE|SHARE)\b",
+    re.IGNORECASE,
+)
+
+_entries = {}
+_lock = threading.Lock()
+_explain_queue = queue.Queue(maxsize=32)
+_worker = None
+
+
+def fingerprint(statement: str) -> str:
+    return _WS.sub(" ", statement).strip()
+
+
+def _redact_value(v) -> str:
+    if v is None:
+        return "NULL"
+    if isinstance(v, (list, tuple)):
+        return f"<{type(v).__name__}[{len(v)}]>"
+    if isinstance(v, str):
+        return f"<str[{len(v)}]>"
+    return f"<{type(v).__name__}>"
+
+
+def redact(parameters):
+    """Paramètres liés -> type / taille uniquement (pas de données métier dans les logs)."""
+    if isinstance(parameters, dict):
+        return {k: _redact_value(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_redact_value(v) for v in parameters]
+    return _redact_value(parameters)
+
+
+def _record(statement: str, parameters, duration_ms: float, route: str, eng):
+    fp = fingerprint(statement)
+    now = time.time()
+    with _lock:
+        e = _entries.get(fp)
+        if e is None:
+            e = _entries[fp] = {
+                "statement": fp, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "routes": {}, "last_params": None, "last_seen": None,
+                "explain": None, "explained_at": None, "_explain_due": 0.0,
+            }
+        e["count"] += 1
+        e["total_ms"] += duration_ms
+        e["max_ms"] = max(e["max_ms"], duration_ms)
+        e["routes"][route] = e["routes"].get(route, 0) + 1
+        e["last_params"] = redact(parameters)
+        e["last_seen"] = now
+        want_explain = (
+            EXPLAIN_RATE > 0 and _EXPLAINABLE.match(statement) is not None
+            and now >= e["_explain_due"] and random.random() < EXPLAIN_RATE
+        )
+        if want_explain:
+            e["_explain_due"] = now + EXPLAIN_EVERY_S
+        _trim()
+    if want_explain:
+        try:  # vraies valeurs : uniquement en mémoire, le temps du rejeu
+            _explain_queue.put_nowait((eng, fp, statement, parameters))
+        except queue.Full:
+            pass
+
+
+def _trim():
+    if len(_entries) <= SLOW_QUERY_TOP * 2:
+        return
+    keep = sorted(_entries.values(), key=lambda e: e["max_ms"], reverse=True)[:SLOW_QUERY_TOP]
+    keep_fp = {e["statement"] for e in keep}
+    for fp in [fp for fp in _entries if fp not in keep_fp]:
+        del _entries[fp]
+
+
+def _analyzable(statement: str) -> bool:
+    """Rejouable sous ANALYZE : lit une table, sans écriture, verrou ni effet de bord."""
+    return _HAS_FROM.search(statement) is not None and _SIDE_EFFECTS.search(statement) is None
+
+
+def _explain(eng, statement: str, parameters):
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if _analyzable(statement) else "FORMAT JSON"
+    raw = eng.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+        cur.execute(f"EXPLAIN ({options}) " + statement, parameters)
+        return cur.fetchone()[0]
+    finally:
+        raw.rollback()
+        raw.close()
+
+
+def _explain_loop():
+    while True:
+        eng, fp, statement, parameters = _explain_queue.get()
+        try:
+            plan = _explain(eng, statement, parameters)
+            error = None
+        except Exception as e:
+            plan, error = None, str(e)
+        with _lock:
+            e = _entries.get(fp)
+            if e is not None:
+                e["explain"] = plan if plan is not None else {"error": error}
+                e["explained_at"] = time.time()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_slowlog_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("_slowlog_t0")
+    if not stack:
+        return
+    ms = (time.perf_counter() - stack.pop()) * 1000.0
+    if ms >= SLOW_QUERY_MS:
+        _record(statement, parameters, ms, metrics.current_route(), conn.engine)
+
+
+def install(eng):
+    """Branche le journal sur l'engine et démarre le thread de rejeu (idempotent)."""
+    global _worker
+    if SLOW_QUERY_MS <= 0 or getattr(eng, "_slowlog_installed", False):
+        return eng
+    eng._slowlog_installed = True
+    event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+    event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+    if _worker is None and EXPLAIN_RATE > 0:
+        _worker = threading.Thread(target=_explain_loop, name="slowlog-explain", daemon=True)
+        _worker.start()
+    return eng
+
+
+def _iso(ts):
+    return None if ts is None else datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def top(n: int = None, with_plans: bool = True) -> list:
+    """Classement par durée max (les plans peuvent être omis pour alléger)."""
+    with _lock:
+        items = sorted(_entries.values(), key=lambda e: e["max_ms"], reverse=True)
+        items = items[: n or SLOW_QUERY_TOP]
+        out = []
+        for e in items:
+            d = {k: v for k, v in e.items() if not k.startswith("_")}
+            d["routes"] = dict(e["routes"])
+            d["mean_ms"] = e["total_ms"] / e["count"] if e["count"] else None
+            d["last_seen"] = _iso(e["last_seen"])
+            d["explained_at"] = _iso(e["explained_at"])
+            if not with_plans:
+                d.pop("explain")
+            out.append(d)
+    return out
+
+
+def reset():
+    with _lock:
+        _entries.clear()
+
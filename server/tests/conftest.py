@@ -0,0 +1,27 @@
+# server/tests/conftest.py
+"""
+Tests d'intégration : ils tournent contre une base Postgres migrée
+(`python migrate.py up`) désignée par LOGIOPS_TEST_DATABASE_URL, et sont
+ignorés sans elle.
+
+    LOGIOPS_TEST_DATABASE_URL=postgresql+psycopg2://... python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.getenv("LOGIOPS_TEST_DATABASE_URL")
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("LOGIOPS_TEST_DATABASE_URL non défini")
+    from sqlalchemy import create_engine
+
+    eng = create_engine(TEST_DATABASE_URL)
+    yield eng
+    eng.dispose()
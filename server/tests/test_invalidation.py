@@ -0,0 +1,43 @@
+# server/tests/test_invalidation.py
+"""Un UPDATE sur une table surveillée arrive jusqu'aux abonnés de invalidation.py."""
+import threading
+import uuid
+
+from sqlalchemy import text
+
+import invalidation
+
+WAIT_S = 10.0
+
+
+def test_update_reaches_subscriber(engine):
+    carrier = f"TEST_{uuid.uuid4().hex[:12]}"
+    seen = []
+    got = threading.Event()
+
+    def on_change(ev):
+        if ev.all or carrier in ev.keys:
+            seen.append(ev)
+            if "update" in ev.ops:
+                got.set()
+
+    invalidation.subscribe(["carrier_profiles"], on_change)
+    invalidation.start(engine)
+    # avant le correctif, la connexion d'écoute était None : LISTEN jamais établi
+    assert invalidation.listening(WAIT_S), "écoute LISTEN non établie"
+    with engine.begin() as c:
+        c.execute(text("""
+            INSERT INTO carrier_profiles (carrier, service_level, sla_hours, exception_rate,
+                                          base_rate_per_km, surcharge_per_kg)
+            VALUES (:c, 'STANDARD', 48, 0.05, 0.5, 0.1)
+        """), {"c": carrier})
+    try:
+        with engine.begin() as c:
+            c.execute(text("UPDATE carrier_profiles SET sla_hours = 36 WHERE carrier = :c"),
+                      {"c": carrier})
+        assert got.wait(WAIT_S), f"aucune invalidation reçue en {WAIT_S}s ({seen})"
+    finally:
+        with engine.begin() as c:
+            c.execute(text("DELETE FROM carrier_profiles WHERE carrier = :c"), {"c": carrier})
+    ev = next(e for e in seen if "update" in e.ops)
+    assert ev.table == "carrier_profiles"
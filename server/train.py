@@ -0,0 +1,616 @@
+# server/train.py
+"""
+Entraînement des modèles servis par l'API (ETA, retard, reco ETA / coût).
+
+Les artefacts de `models/` avaient été produits hors dépôt ; ce module les
+reconstruit depuis les vues d'entraînement :
+
+    python train.py eta                          # entraînement complet + recherche d'hyper-paramètres
+    python train.py delay --trials 24 --parallel 4
+    python train.py cost --warm-start --recent-days 30   # continuation sur les données récentes
+    python train.py reco_eta --out-dir /tmp/staging --report train_reco_eta.json
+
+Étapes :
+  1. lecture de la vue par COPY en batches (extract.read_frame) : seules les
+     colonnes utiles, numériques en float32, catégorielles dictionnaire-encodées
+  2. découpage temporel train / valid / test (TRAIN_VALID_FRAC, TRAIN_TEST_FRAC
+     les plus récents) ; l'encodeur (OrdinalEncoder -> catégorielles natives
+     LightGBM) est ajusté une fois, les matrices float32 sont écrites en .npy
+  3. recherche aléatoire (TRAIN_TRIALS essais, le premier reprend les
+     paramètres du meta existant) dans un pool de processus : chaque essai lit
+     les matrices en mmap (pas de copie par processus) et s'arrête tout seul
+     (early stopping sur valid, TRAIN_MAX_TREES arbres au plus) ; les cœurs
+     sont partagés entre essais (`--parallel` essais x cpu/parallel threads)
+  4. réentraînement des meilleurs paramètres sur train + valid (tous les
+     cœurs, meilleur nombre d'itérations), métriques sur test
+  5. écriture atomique de l'artefact (Pipeline encodeur + modèle, même format
+     que les artefacts servis) puis du meta JSON (schéma existant, plus une
+     clé `training` : durées, pic mémoire, lignes)
+
+`--warm-start` : reprend l'artefact en place (même encodeur, `init_model` =
+booster existant) et ajoute au plus TRAIN_WARM_TREES arbres appris sur les
+`--recent-days` derniers jours, avec early stopping. L'artefact n'est remplacé
+que si l'erreur sur le test récent ne se dégrade pas par rapport au modèle en
+place (`--force` pour passer outre). Une modalité apparue depuis le dernier
+entraînement complet est traitée comme manquante : relancer un entraînement
+complet périodiquement.
+
+Les workers de l'API chargent les modèles au démarrage (model_store) : les
+redémarrer pour servir un nouvel artefact.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import extract
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(HERE, "models")
+
+TRAIN_TRIALS = int(os.getenv("TRAIN_TRIALS", "12"))
+TRAIN_PARALLEL = int(os.getenv("TRAIN_PARALLEL", "0"))          # 0 = auto (>= 4 threads par essai)
+TRAIN_MAX_TREES = int(os.getenv("TRAIN_MAX_TREES", "5000"))
+TRAIN_EARLY_STOPPING = int(os.getenv("TRAIN_EARLY_STOPPING", "100"))
+TRAIN_WARM_TREES = int(os.getenv("TRAIN_WARM_TREES", "300"))
+TRAIN_VALID_FRAC = float(os.getenv("TRAIN_VALID_FRAC", "0.15"))
+TRAIN_TEST_FRAC = float(os.getenv("TRAIN_TEST_FRAC", "0.15"))
+TRAIN_BATCH_ROWS = int(os.getenv("TRAIN_BATCH_ROWS", "200000"))
+TRAIN_SEED = int(os.getenv("TRAIN_SEED", "42"))
+
+ETA_FEATURES = ["origin", "destination_zone", "carrier", "service_level", "ship_dow", "ship_hour",
+                "distance_km", "weight_kg", "volume_m3", "total_units", "n_lines"]
+RECO_FEATURES = ETA_FEATURES + ["p50_eta_h", "p90_eta_h", "delay_rate", "cp_cost_baseline_eur",
+                                "on_time_rate", "capacity_score"]
+CATEGORICAL = ["origin", "destination_zone", "carrier", "service_level", "ship_dow", "ship_hour"]
+
+# espace de recherche (tirages uniformes, learning_rate log-uniforme)
+SEARCH_SPACE = {
+    "num_leaves": [31, 63, 127, 255],
+    "min_child_samples": [20, 50, 100, 200],
+    "subsample": [0.7, 0.8, 0.9, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "reg_lambda": [0.0, 1.0, 5.0],
+}
+LEARNING_RATE = (0.02, 0.1)
+_SEARCHED = set(SEARCH_SPACE) | {"learning_rate"}
+
+
+@dataclass(frozen=True)
+class Task:
+    view: str
+    target: str
+    time_col: str
+    kind: str                  # regression | binary
+    artifact: str
+    meta: str
+    features: tuple
+    section: str = None        # clé dans un meta partagé (reco_meta.json : eta / cost)
+
+
+TASKS = {
+    "eta": Task("fv_train_eta", "target_eta_hours", "ship_dt", "regression",
+                "eta_lgbm.joblib", "eta_feature_meta.json", tuple(ETA_FEATURES)),
+    "delay": Task("fv_train_delay", "is_late", "ship_dt", "binary",
+                  "delay_lgbm.joblib", "delay_feature_meta.json", tuple(ETA_FEATURES)),
+    "reco_eta": Task("fv_train_carrier_choice", "eta_h", "ship_day", "regression",
+                     "eta_carrier_lgbm.joblib", "reco_meta.json", tuple(RECO_FEATURES), "eta"),
+    "cost": Task("fv_train_carrier_choice", "actual_total_cost_eur", "ship_day", "regression",
+                 "cost_lgbm.joblib", "reco_meta.json", tuple(RECO_FEATURES), "cost"),
+}
+
+
+class TrainError(RuntimeError):
+    """Entraînement impossible (pas de données, artefact incompatible...)."""
+
+
+# ----------------------------------------------------------------------------
+# Mesures
+# ----------------------------------------------------------------------------
+class Clock:
+    """Durées par phase (s)."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases = {}
+
+    def phase(self, name: str, since: float) -> float:
+        now = time.perf_counter()
+        self.phases[name] = round(now - since, 3)
+        return now
+
+    @property
+    def total(self) -> float:
+        return round(time.perf_counter() - self.t0, 3)
+
+
+def peak_rss_mb(trials=None) -> dict:
+    """
+    RSS max du process et des essais, en Mo (Linux : ko). Les workers forkserver ne
+    sont pas des enfants directs (RUSAGE_CHILDREN ne les voit pas) : "workers" est
+    le max des `peak_rss_mb` relevés par chaque essai dans son process (None sans essai).
+    """
+    scale = 1 / 1024.0 if sys.platform != "darwin" else 1 / (1024.0 * 1024.0)
+    peaks = [r["peak_rss_mb"] for r in trials or () if r.get("peak_rss_mb") is not None]
+    return {"main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+            "workers": max(peaks) if peaks else None}
+
+
+def _log(msg: str):
+    print(f"[train] {msg}", file=sys.stderr, flush=True)
+
+
+# ----------------------------------------------------------------------------
+# Données
+# ----------------------------------------------------------------------------
+def _numeric_features(task: Task) -> list:
+    return [f for f in task.features if f not in CATEGORICAL]
+
+
+def _shrink(task: Task):
+    """Réduction d'un batch : lignes sans cible écartées, Int64 / float64 -> float32."""
+
+    def fn(b: pd.DataFrame) -> pd.DataFrame:
+        b = b.loc[b[task.target].notna()]
+        return b.astype({c: "float32" for c in b.columns
+                         if c != task.time_col and not isinstance(b[c].dtype, pd.CategoricalDtype)
+                         and (pd.api.types.is_numeric_dtype(b[c].dtype) or pd.api.types.is_bool_dtype(b[c].dtype))})
+
+    return fn
+
+
+def load(eng, task: Task, since: datetime = None) -> pd.DataFrame:
+    cols = list(task.features) + [task.target, task.time_col]
+    where, params = f"{task.target} IS NOT NULL", {}
+    if since is not None:
+        where += f" AND {task.time_col} >= %(since)s"
+        params["since"] = since
+    progress = extract.Progress(task.view)
+    df = extract.read_frame(eng, task.view, transform=_shrink(task), columns=cols, where=where,
+                            params=params, batch_rows=TRAIN_BATCH_ROWS,
+                            categorical=[c for c in CATEGORICAL if c in task.features],
+                            progress=progress)
+    if df.empty:
+        raise TrainError(f"{task.view} : aucune ligne d'entraînement" + (f" depuis {since}" if since else ""))
+    return df
+
+
+def split(df: pd.DataFrame, time_col: str):
+    """Masques train / valid / test : les fractions les plus récentes vont en valid puis test."""
+    t = df[time_col]
+    t_valid = t.quantile(1.0 - TRAIN_VALID_FRAC - TRAIN_TEST_FRAC)
+    t_test = t.quantile(1.0 - TRAIN_TEST_FRAC)
+    train = (t < t_valid).to_numpy()
+    test = (t >= t_test).to_numpy()
+    valid = ~train & ~test
+    if not train.any() or not valid.any() or not test.any():
+        raise TrainError(f"découpage temporel impossible ({len(df)} lignes, {time_col} trop peu varié)")
+    return train, valid, test
+
+
+def make_encoder(task: Task):
+    """Catégorielles -> codes (inconnues = -1, traitées comme manquantes par LightGBM), numériques inchangées."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OrdinalEncoder
+
+    cats = [c for c in task.features if c in CATEGORICAL]
+    return ColumnTransformer(
+        [("cat", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1,
+                                dtype=np.float32), cats),
+         ("num", "passthrough", _numeric_features(task))],
+        sparse_threshold=0.0,
+    )
+
+
+def _n_categorical(task: Task) -> int:
+    return sum(1 for c in task.features if c in CATEGORICAL)
+
+
+def _categorical_idx(task: Task, encoder):
+    """Colonnes catégorielles en sortie de l'encodeur : les premières si c'est `make_encoder`, sinon auto."""
+    prep = encoder.steps[-1][1] if hasattr(encoder, "steps") else encoder
+    if "cat" in getattr(prep, "named_transformers_", {}):
+        return list(range(_n_categorical(task)))
+    return "auto"
+
+
+# ----------------------------------------------------------------------------
+# Modèles et métriques
+# ----------------------------------------------------------------------------
+def _estimator(task: Task, params: dict, n_jobs: int):
+    import lightgbm as lgb
+
+    common = dict(n_jobs=n_jobs, random_state=TRAIN_SEED, verbose=-1, subsample_freq=1)
+    if task.kind == "binary":
+        return lgb.LGBMClassifier(**{**common, "class_weight": "balanced", **params})
+    return lgb.LGBMRegressor(**{**common, **params})
+
+
+def _metric(task: Task) -> tuple:
+    """(métrique LightGBM d'early stopping, plus grand = meilleur)."""
+    return ("average_precision", True) if task.kind == "binary" else ("l1", False)
+
+
+def _predict(task: Task, model, X):
+    return model.predict_proba(X)[:, 1] if task.kind == "binary" else model.predict(X)
+
+
+def regression_metrics(y, pred) -> dict:
+    from sklearn.metrics import mean_absolute_error, mean_squared_error
+
+    return {"mae": float(mean_absolute_error(y, pred)), "rmse": float(math.sqrt(mean_squared_error(y, pred)))}
+
+
+def best_threshold(y, proba) -> float:
+    """Seuil qui maximise le F1 (précision / rappel) sur valid."""
+    from sklearn.metrics import precision_recall_curve
+
+    p, r, thr = precision_recall_curve(y, proba)
+    f1 = 2 * p[:-1] * r[:-1] / np.maximum(p[:-1] + r[:-1], 1e-12)
+    return float(thr[int(np.argmax(f1))]) if len(thr) else 0.5
+
+
+def binary_metrics(y, proba, thr: float, confusion: bool = False) -> dict:
+    from sklearn.metrics import average_precision_score, confusion_matrix, f1_score, roc_auc_score
+
+    y = np.asarray(y).astype(int)
+    pred = (proba >= thr).astype(int)
+    out = {"auc": float(roc_auc_score(y, proba)) if len(np.unique(y)) > 1 else None,
+           "ap": float(average_precision_score(y, proba)),
+           "f1_at_thr": float(f1_score(y, pred, zero_division=0))}
+    if confusion:
+        out["confusion_matrix"] = confusion_matrix(y, pred, labels=[0, 1]).tolist()
+    return out
+
+
+def evaluate(task: Task, valid_model, Xv, yv, test_model, Xt, yt) -> dict:
+    """
+    {"valid", "test", "threshold"} ; en binaire le seuil (F1 max) est choisi sur
+    valid avec `valid_model`, qui ne doit pas avoir appris sur valid.
+    """
+    pv, pt = _predict(task, valid_model, Xv), _predict(task, test_model, Xt)
+    if task.kind != "binary":
+        return {"valid": regression_metrics(yv, pv), "test": regression_metrics(yt, pt), "threshold": None}
+    thr = best_threshold(yv, pv)
+    valid = {**binary_metrics(yv, pv, thr), "best_threshold": thr}
+    return {"valid": valid, "test": binary_metrics(yt, pt, thr, confusion=True), "threshold": thr}
+
+
+# ----------------------------------------------------------------------------
+# Recherche d'hyper-paramètres (pool de processus)
+# ----------------------------------------------------------------------------
+_data = {}
+
+
+def _worker_init(data_dir: str):
+    # matrices en mmap : pages partagées entre essais via le cache du système de fichiers
+    _data["dir"] = data_dir
+    for name in ("X_train", "y_train", "X_valid", "y_valid"):
+        _data[name] = np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode="r")
+
+
+def _trial(task_name: str, index: int, params: dict, n_jobs: int) -> dict:
+    import lightgbm as lgb
+
+    task = TASKS[task_name]
+    metric, _ = _metric(task)
+    model = _estimator(task, {**params, "n_estimators": TRAIN_MAX_TREES, "metric": metric}, n_jobs)
+    t0 = time.perf_counter()
+    model.fit(_data["X_train"], _data["y_train"], eval_set=[(_data["X_valid"], _data["y_valid"])],
+              eval_metric=metric, categorical_feature=list(range(_n_categorical(task))),
+              callbacks=[lgb.early_stopping(TRAIN_EARLY_STOPPING, verbose=False)])
+    fit_s = time.perf_counter() - t0
+    # modèle gardé pour les métriques valid et le seuil du meilleur essai
+    path = os.path.join(_data["dir"], f"trial-{index}.joblib")
+    joblib.dump(model, path)
+    return {"index": index, "params": params, "path": path,
+            "best_iteration": int(model.best_iteration_ or TRAIN_MAX_TREES),
+            "score": float(model.best_score_["valid_0"][metric]),
+            "fit_s": round(fit_s, 3),
+            "peak_rss_mb": peak_rss_mb()["main"]}
+
+
+def candidates(n: int, base: dict = None, seed: int = TRAIN_SEED) -> list:
+    """`n` jeux de paramètres : ceux du meta existant d'abord (s'il y en a), puis tirages aléatoires."""
+    rng = np.random.default_rng(seed)
+    out = []
+    if base:
+        out.append({k: v for k, v in base.items() if k in _SEARCHED})
+    lo, hi = np.log(LEARNING_RATE[0]), np.log(LEARNING_RATE[1])
+    while len(out) < n:
+        p = {k: v[int(rng.integers(len(v)))] for k, v in SEARCH_SPACE.items()}
+        p["learning_rate"] = round(float(np.exp(rng.uniform(lo, hi))), 4)
+        out.append(p)
+    return out
+
+
+def search(task_name: str, data_dir: str, trials: list, parallel: int, cpus: int) -> list:
+    """Essais en parallèle ; renvoie les résultats triés du meilleur au moins bon."""
+    _, higher = _metric(TASKS[task_name])
+    threads = max(1, cpus // parallel)
+    _log(f"recherche : {len(trials)} essais, {parallel} en parallèle x {threads} threads")
+    results = []
+    # forkserver : pas de fork d'un process dont le runtime OpenMP (LightGBM) est déjà initialisé
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=multiprocessing.get_context("forkserver"),
+                             initializer=_worker_init, initargs=(data_dir,)) as pool:
+        futures = {pool.submit(_trial, task_name, i, p, threads): p for i, p in enumerate(trials)}
+        for f in as_completed(futures):
+            try:
+                r = f.result()
+            except Exception as e:
+                _log(f"essai en échec {futures[f]} : {type(e).__name__}: {e}")
+                continue
+            results.append(r)
+            _log(f"essai {len(results)}/{len(trials)} : score {r['score']:.5f}, "
+                 f"{r['best_iteration']} arbres, {r['fit_s']:.1f}s")
+    if not results:
+        raise TrainError("tous les essais ont échoué")
+    return sorted(results, key=lambda r: r["score"], reverse=higher)
+
+
+# ----------------------------------------------------------------------------
+# Artefacts
+# ----------------------------------------------------------------------------
+def _atomic_write(path: str, write):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_meta(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_meta(task: Task, previous: dict, model_path: str, params: dict, ev: dict, training: dict) -> dict:
+    """Meta au schéma existant (*_feature_meta.json ou section de reco_meta.json)."""
+    now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    schema = {
+        "features": list(task.features),
+        "categorical": [c for c in task.features if c in CATEGORICAL],
+        "numeric": _numeric_features(task),
+    }
+    if task.section:
+        meta = dict(previous)
+        meta.update(generated_at=now, **schema)
+        meta[f"{task.section}_model_path"] = model_path
+        meta.setdefault("metrics", {})[task.section] = {"valid": ev["valid"], "test": ev["test"]}
+        meta.setdefault("params_by_model", {})[task.section] = params
+        meta.setdefault("training", {})[task.section] = training
+        return meta
+    meta = {"generated_at": now, "model_path": model_path, **schema, "target": task.target}
+    if task.kind == "binary":
+        meta.update(metrics={"valid": ev["valid"], "test": ev["test"]}, algo="LightGBMClassifier",
+                    params={**params, "class_weight": "balanced", "random_state": TRAIN_SEED},
+                    decision_threshold=ev["threshold"])
+    else:
+        meta.update(metrics_valid=ev["valid"], metrics_test=ev["test"], algo="LightGBMRegressor",
+                    params={**params, "random_state": TRAIN_SEED})
+    meta["training"] = training
+    return meta
+
+
+def write(task: Task, out_dir: str, pipe, meta: dict):
+    """Artefact puis meta, chacun remplacé atomiquement."""
+    os.makedirs(out_dir, exist_ok=True)
+    _atomic_write(os.path.join(out_dir, task.artifact), lambda p: joblib.dump(pipe, p))
+
+    def _json(p):
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False, default=str)
+
+    _atomic_write(os.path.join(out_dir, task.meta), _json)
+
+
+def _pipeline(encoder, model):
+    from sklearn.pipeline import Pipeline
+
+    return Pipeline([("prep", encoder), ("model", model)])
+
+
+def _params_of(model) -> dict:
+    """Paramètres recherchés + n_estimators effectif du modèle final."""
+    p = model.get_params()
+    out = {k: p[k] for k in sorted(_SEARCHED) if k in p}
+    out["n_estimators"] = int(model.n_estimators)
+    return out
+
+
+# ----------------------------------------------------------------------------
+# Entraînement complet
+# ----------------------------------------------------------------------------
+def train_full(eng, task_name: str, out_dir: str, n_trials: int, parallel: int) -> dict:
+    task = TASKS[task_name]
+    clock = Clock()
+    cpus = os.cpu_count() or 1
+    parallel = parallel or TRAIN_PARALLEL or max(1, min(n_trials, cpus // 4))
+    previous = read_meta(os.path.join(out_dir, task.meta)) or read_meta(os.path.join(MODELS_DIR, task.meta))
+    base = (previous.get("params_by_model", {}).get(task.section) or previous.get("params")) \
+        if task.section else previous.get("params")
+
+    t = time.perf_counter()
+    df = load(eng, task)
+    train, valid, test = split(df, task.time_col)
+    t = clock.phase("load", t)
+
+    encoder = make_encoder(task).fit(df[list(task.features)])
+    X = encoder.transform(df[list(task.features)]).astype(np.float32, copy=False)
+    y = df[task.target].to_numpy(dtype=np.float32)
+    rows = {"train": int(train.sum()), "valid": int(valid.sum()), "test": int(test.sum())}
+    del df
+    t = clock.phase("encode", t)
+
+    data_dir = tempfile.mkdtemp(prefix=f"train-{task_name}-")
+    try:
+        for name, arr in (("X_train", X[train]), ("y_train", y[train]),
+                          ("X_valid", X[valid]), ("y_valid", y[valid])):
+            np.save(os.path.join(data_dir, f"{name}.npy"), arr)
+        results = search(task_name, data_dir, candidates(n_trials, base), parallel, cpus)
+        best = results[0]
+        best_model = joblib.load(best["path"])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    for r in results:
+        r.pop("path", None)
+    t = clock.phase("search", t)
+
+    # modèle final : train + valid (les données les plus récentes), tous les cœurs,
+    # nombre d'itérations du meilleur essai
+    fit_rows = train | valid
+    model = _estimator(task, {**best["params"], "n_estimators": best["best_iteration"]}, cpus)
+    model.fit(X[fit_rows], y[fit_rows], categorical_feature=list(range(_n_categorical(task))))
+    t = clock.phase("fit", t)
+
+    # valid : meilleur essai (n'a pas vu valid) ; test : modèle final
+    ev = evaluate(task, best_model, X[valid], y[valid], model, X[test], y[test])
+    clock.phase("evaluate", t)
+
+    training = {"mode": "full", "view": task.view, "rows": rows, "wall_s": clock.total,
+                "phases_s": clock.phases, "peak_rss_mb": peak_rss_mb(results), "cpus": cpus,
+                "parallel_trials": parallel, "trials": len(results), "best_trial": best}
+    params = _params_of(model)
+    model_path = os.path.abspath(os.path.join(out_dir, task.artifact))
+    meta = build_meta(task, previous, model_path, params, ev, training)
+    write(task, out_dir, _pipeline(encoder, model), meta)
+    return {"task": task_name, "written": True, "model_path": model_path, "metrics": ev,
+            "params": params, "training": training, "search": results}
+
+
+# ----------------------------------------------------------------------------
+# Continuation (warm start)
+# ----------------------------------------------------------------------------
+def _test_error(task: Task, ev: dict) -> float:
+    """Erreur à minimiser sur test (MAE, ou 1 - AP en binaire)."""
+    return 1.0 - ev["test"]["ap"] if task.kind == "binary" else ev["test"]["mae"]
+
+
+def train_warm(eng, task_name: str, out_dir: str, recent_days: int, force: bool = False) -> dict:
+    import lightgbm as lgb
+
+    task = TASKS[task_name]
+    clock = Clock()
+    cpus = os.cpu_count() or 1
+    src = os.path.join(out_dir, task.artifact)
+    if not os.path.exists(src):
+        src = os.path.join(MODELS_DIR, task.artifact)
+    if not os.path.exists(src):
+        raise TrainError(f"{task.artifact} absent : entraînement complet nécessaire")
+    previous = read_meta(os.path.join(out_dir, task.meta)) or read_meta(os.path.join(MODELS_DIR, task.meta))
+
+    t = time.perf_counter()
+    current = joblib.load(src)
+    steps = getattr(current, "steps", None)
+    if not steps or not hasattr(steps[-1][1], "booster_"):
+        raise TrainError(f"{task.artifact} : pipeline sklearn terminé par un modèle LightGBM attendu")
+    encoder, old = current[:-1], steps[-1][1]
+    since = datetime.now(timezone.utc) - timedelta(days=recent_days)
+    df = load(eng, task, since=since)
+    train, valid, test = split(df, task.time_col)
+    t = clock.phase("load", t)
+
+    X = np.asarray(encoder.transform(df[list(task.features)]), dtype=np.float32)
+    if X.shape[1] != old.booster_.num_feature():
+        raise TrainError(f"{task.artifact} : l'encodeur produit {X.shape[1]} colonnes, "
+                         f"le modèle en attend {old.booster_.num_feature()}")
+    y = df[task.target].to_numpy(dtype=np.float32)
+    rows = {"train": int(train.sum()), "valid": int(valid.sum()), "test": int(test.sum())}
+    del df
+    t = clock.phase("encode", t)
+
+    baseline = evaluate(task, old, X[valid], y[valid], old, X[test], y[test])
+    metric, _ = _metric(task)
+    inherited = {k: v for k, v in old.get_params().items() if k in _SEARCHED}
+    before = int(old.booster_.current_iteration())
+    model = _estimator(task, {**inherited, "n_estimators": TRAIN_WARM_TREES, "metric": metric}, cpus)
+    model.fit(X[train], y[train], eval_set=[(X[valid], y[valid])], eval_metric=metric,
+              categorical_feature=_categorical_idx(task, encoder), init_model=old.booster_,
+              callbacks=[lgb.early_stopping(TRAIN_EARLY_STOPPING, verbose=False)])
+    # best_iteration_ compte aussi les arbres du modèle initial
+    total = int(model.best_iteration_ or model.booster_.current_iteration())
+    t = clock.phase("fit", t)
+
+    ev = evaluate(task, model, X[valid], y[valid], model, X[test], y[test])
+    clock.phase("evaluate", t)
+
+    improved = _test_error(task, ev) <= _test_error(task, baseline)
+    training = {"mode": "warm_start", "view": task.view, "since": since, "rows": rows,
+                "wall_s": clock.total, "phases_s": clock.phases, "peak_rss_mb": peak_rss_mb(),
+                "cpus": cpus, "init_model": os.path.abspath(src),
+                "iterations_before": before, "iterations_added": total - before,
+                "baseline_test": baseline["test"]}
+    params = {**{k: inherited[k] for k in sorted(inherited)}, "n_estimators": total}
+    model_path = os.path.abspath(os.path.join(out_dir, task.artifact))
+    written = improved or force
+    if written:
+        meta = build_meta(task, previous, model_path, params, ev, training)
+        write(task, out_dir, _pipeline(encoder, model), meta)
+    else:
+        _log(f"modèle en place conservé : erreur test {_test_error(task, baseline):.5f} "
+             f"-> {_test_error(task, ev):.5f} (--force pour remplacer)")
+    return {"task": task_name, "written": written, "model_path": model_path, "metrics": ev,
+            "baseline": baseline, "params": params, "training": training}
+
+
+# ----------------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------------
+def main() -> int:
+    import db
+
+    ap = argparse.ArgumentParser(description="Entraînement des modèles Logiops360")
+    ap.add_argument("task", choices=sorted(TASKS))
+    ap.add_argument("--trials", type=int, default=TRAIN_TRIALS)
+    ap.add_argument("--parallel", type=int, default=0, help="essais simultanés (0 = auto)")
+    ap.add_argument("--warm-start", action="store_true", help="continuer l'artefact en place sur les données récentes")
+    ap.add_argument("--recent-days", type=int, default=30)
+    ap.add_argument("--force", action="store_true", help="warm start : écrire même si le test récent se dégrade")
+    ap.add_argument("--out-dir", default=MODELS_DIR)
+    ap.add_argument("--report", help="rapport JSON (durées, mémoire, essais, métriques)")
+    args = ap.parse_args()
+
+    eng = db.make_engine("batch", name="train")
+    try:
+        if args.warm_start:
+            report = train_warm(eng, args.task, args.out_dir, args.recent_days, args.force)
+        else:
+            report = train_full(eng, args.task, args.out_dir, args.trials, args.parallel)
+    except TrainError as e:
+        _log(f"échec : {e}")
+        return 1
+    finally:
+        eng.dispose()
+
+    tr = report["training"]
+    _log(f"{args.task} ({tr['mode']}) : {sum(tr['rows'].values())} lignes, {tr['wall_s']:.1f}s "
+         f"({', '.join(f'{k} {v:.1f}s' for k, v in tr['phases_s'].items())}), "
+         f"pic RSS {tr['peak_rss_mb']['main']:.0f} Mo"
+         + (f" (essais {tr['peak_rss_mb']['workers']:.0f} Mo)" if tr['peak_rss_mb']['workers'] is not None else "")
+         + ", "
+         f"test {report['metrics']['test']}" + ("" if report["written"] else " [non écrit]"))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
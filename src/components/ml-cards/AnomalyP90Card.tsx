@@ -12,6 +12,7 @@ type Props = { token: string };
 type Item = {
   shipment_id: string;
   event_id: number;
+  event_time?: string | null;
   phase: string;
   carrier: string;
   origin: string;
@@ -87,6 +88,7 @@ export default function AnomalyP90Card({ token }: Props) {
     shipment_id: string;
     anomalyCount: number;
     firstEventId: number;
+    firstEventTime?: string | null;
     maxRetardH: number;
     sample: Item;
   };
@@ -104,6 +106,7 @@ export default function AnomalyP90Card({ token }: Props) {
           shipment_id: key,
           anomalyCount: 1,
           firstEventId: it.event_id,
+          firstEventTime: it.event_time,
           maxRetardH: retard,
           sample: it,
         });
@@ -159,7 +162,7 @@ export default function AnomalyP90Card({ token }: Props) {
 
   async function openDetailGroup(g: Group) {
     try {
-      const d = await anomP90Detail(token, g.shipment_id, g.firstEventId);
+      const d = await anomP90Detail(token, g.shipment_id, g.firstEventId, g.firstEventTime ?? undefined);
       setDetail({ ...d, selected_event_id: g.firstEventId });
       setOpen(true);
     } catch (e: any) {
@@ -40,6 +40,24 @@ async function callAPI(path: string, { method = "GET", token, body }: FetchOptio
   return data;
 }
 
+/**
+ * Décode une réponse `?format=columns` ({ colonne: [valeurs] }) en liste d’objets.
+ * Renvoie la valeur telle quelle si elle est déjà au format "records".
+ */
+export function rowsFromColumns<T = any>(cols: any): T[] {
+  if (Array.isArray(cols)) return cols as T[];
+  if (!cols || typeof cols !== "object") return [];
+  const keys = Object.keys(cols);
+  const n = keys.length ? cols[keys[0]].length : 0;
+  const rows = new Array(n);
+  for (let i = 0; i < n; i++) {
+    const row: Record<string, any> = {};
+    for (const k of keys) row[k] = cols[k][i];
+    rows[i] = row;
+  }
+  return rows as T[];
+}
+
 /* =========================
  *         ETA
  * ========================= */
@@ -61,9 +79,20 @@ export async function getEtaDistincts(token: string) {
   return callAPI("/api/ml/eta/distincts", { token });
 }
 
-export async function getEtaShipmentIds(token: string, limit = 200) {
-  const qs = new URLSearchParams({ limit: String(limit) }).toString();
-  return callAPI(`/api/ml/eta/shipments?${qs}`, { token }); // { shipment_ids: [...] }
+// Pagination keyset : repasser `next_cursor` de la réponse précédente en `cursor`
+export type PageOptions = { cursor?: string | null; from?: string; to?: string };
+
+function pageQuery(limit: number, { cursor, from, to }: PageOptions = {}, extra: Record<string, string> = {}) {
+  const p: Record<string, string> = { limit: String(limit), ...extra };
+  if (cursor) p.cursor = cursor;
+  if (from) p.from = from;
+  if (to) p.to = to;
+  return new URLSearchParams(p).toString();
+}
+
+export async function getEtaShipmentIds(token: string, limit = 200, page: PageOptions = {}) {
+  const qs = pageQuery(limit, page);
+  return callAPI(`/api/ml/eta/shipments?${qs}`, { token }); // { shipment_ids: [...], next_cursor }
 }
 
 /* =========================
@@ -86,9 +115,10 @@ export async function recoSimpleRecommend(payload: any, token: string) {
  *   RISQUE DE RETARD
  * ========================= */
 
-export async function delayList(token: string, limit = 40) {
-  const qs = new URLSearchParams({ limit: String(limit) }).toString();
-  return callAPI(`/api/ml/delay/list?${qs}`, { token }); // { items: [...] }
+export async function delayList(token: string, limit = 40, page: PageOptions = {}) {
+  const qs = pageQuery(limit, page, { format: "columns" });
+  const data = await callAPI(`/api/ml/delay/list?${qs}`, { token });
+  return { ...data, items: rowsFromColumns(data.items) }; // { items: [...], next_cursor }
 }
 
 export async function delayDetail(token: string, shipmentId: string) {
@@ -100,18 +130,21 @@ export async function delayDetail(token: string, shipmentId: string) {
  *   ANOMALIES P90 (NOUVEAU)
  * ========================= */
 
-export async function anomP90List(token: string, limit = 30) {
-  const qs = new URLSearchParams({ limit: String(limit) }).toString();
-  return callAPI(`/api/ml/anom/list?${qs}`, { token }); // { items: [...] }
+export async function anomP90List(token: string, limit = 30, page: PageOptions = {}) {
+  const qs = pageQuery(limit, page, { format: "columns" });
+  const data = await callAPI(`/api/ml/anom/list?${qs}`, { token });
+  return { ...data, items: rowsFromColumns(data.items) }; // { items: [...], next_cursor }
 }
 
 // ... garde le reste inchangé
 
-export async function anomP90Detail(token: string, shipmentId: string, eventId: number) {
-  const qs = new URLSearchParams({
+export async function anomP90Detail(token: string, shipmentId: string, eventId: number, eventTime?: string) {
+  const params = new URLSearchParams({
     shipment_id: shipmentId,
     event_id: String(eventId),
-  }).toString();
+  });
+  if (eventTime) params.set("event_time", eventTime); // borne les partitions lues
+  const qs = params.toString();
   return callAPI(`/api/ml/anom/detail?${qs}`, { token }); // {...}
 }
 